@@ -0,0 +1,125 @@
+"""
+Ingest throughput under each database engine profile.
+
+Writer threads insert ANPR reads one transaction at a time, as the ingest
+endpoints do, while reader threads run the dashboard's count and recent-reads
+queries. Each profile gets a fresh SQLite file.
+
+    python benchmarks/db_profile.py --seconds 10 --writers 4 --readers 2
+"""
+from datetime import datetime
+from pathlib import Path
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Never touch the real database, even though importing models builds the default engine
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "anpr_bench_unused.db"))
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, DB_PROFILES, build_engine
+from models import ANPRRead
+
+
+def run_profile(profile: str, seconds: float, writers: int, readers: int, workdir: str) -> dict:
+    path = os.path.join(workdir, f"bench_{profile}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    engine = build_engine(f"sqlite:///{path}", profile)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    counts = {"writes": 0, "reads": 0, "write_errors": 0, "read_errors": 0}
+    counts_lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def bump(key):
+        with counts_lock:
+            counts[key] += 1
+
+    def writer(worker: int):
+        rng = random.Random(worker)
+        while time.perf_counter() < deadline:
+            db = Session()
+            try:
+                db.add(ANPRRead(
+                    license_plate=f"BN{rng.randint(10, 99)}{rng.choice('ABCDEFGH')}{rng.choice('JKLMNPRS')}{rng.choice('TUVWXYZ')}",
+                    timestamp=datetime.utcnow(),
+                    camera_id=f"CAM{worker:03d}",
+                    location="Benchmark",
+                    confidence=rng.uniform(0.7, 1.0),
+                ))
+                db.commit()
+                bump("writes")
+            except OperationalError:
+                db.rollback()
+                bump("write_errors")
+            finally:
+                db.close()
+
+    def reader():
+        while time.perf_counter() < deadline:
+            db = Session()
+            try:
+                db.query(ANPRRead).count()
+                db.query(ANPRRead).order_by(ANPRRead.timestamp.desc()).limit(50).all()
+                bump("reads")
+            except OperationalError:
+                bump("read_errors")
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+
+    return {
+        "profile": profile,
+        "seconds": round(elapsed, 2),
+        "writes_per_second": round(counts["writes"] / elapsed, 1),
+        "dashboard_queries_per_second": round(counts["reads"] / elapsed, 1),
+        **counts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--profiles", nargs="+", default=list(DB_PROFILES[::-1]), choices=DB_PROFILES)
+    parser.add_argument("--workdir", default=tempfile.gettempdir())
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for profile in args.profiles:
+        result = run_profile(profile, args.seconds, args.writers, args.readers, args.workdir)
+        results.append(result)
+        print(f"{profile:>10}: {result['writes_per_second']:>8} writes/s  "
+              f"{result['dashboard_queries_per_second']:>8} dashboard queries/s  "
+              f"errors w={result['write_errors']} r={result['read_errors']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
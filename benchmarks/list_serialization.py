@@ -0,0 +1,159 @@
+"""
+Bulk list serialization: ORM + response_model validation vs column tuples + orjson.
+
+Seeds a scratch SQLite database, then serves /anpr/reads and
+/api/hotlist-groups both ways from one app and times them through the full
+ASGI stack. Both paths are checked to return the same JSON.
+
+    python benchmarks/list_serialization.py --reads 5000 --limit 1000 --iterations 200
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "anpr_bench_unused.db"))
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, build_engine
+from models import ANPRRead, Hotlist, HotlistGroup
+from schemas import ANPRReadResponse, HotlistGroupResponse
+from serialization import FastJSONResponse, READ_FIELDS, group_query, groups_with_vehicles, read_query, rows_to_dicts
+
+
+def seed(Session, reads: int, groups: int, vehicles_per_group: int):
+    db = Session()
+    started = datetime(2026, 1, 1)
+    db.bulk_insert_mappings(ANPRRead, [
+        {
+            "license_plate": f"BN{n:06d}",
+            "camera_id": f"CAM{n % 40:03d}",
+            "location": f"Feed:1, Source:{n % 10}, Camera:{n % 40}",
+            "timestamp": started + timedelta(seconds=n),
+            "confidence": 70 + n % 30,
+            "plate_image_path": f"static/uploads/plate_{n}.jpg",
+            "hotlist_match": n % 50 == 0,
+        }
+        for n in range(reads)
+    ])
+    for group_index in range(groups):
+        group = HotlistGroup(name=f"Bench group {group_index}")
+        db.add(group)
+        db.flush()
+        db.bulk_insert_mappings(Hotlist, [
+            {
+                "hotlist_group_id": group.id,
+                "license_plate": f"H{group_index:02d}{n:05d}",
+                "vehicle_make": "Ford",
+                "vehicle_model": "Focus",
+                "vehicle_color": "Blue",
+                "warning_markers": "None",
+                "intelligence_information": "Stop and account",
+                "weed_date": started.date(),
+            }
+            for n in range(vehicles_per_group)
+        ])
+    db.commit()
+    db.close()
+
+
+def build_app(Session) -> FastAPI:
+    app = FastAPI()
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @app.get("/orm/anpr/reads", response_model=List[ANPRReadResponse])
+    async def orm_reads(limit: int = 100, db: Session = Depends(get_db)):
+        return db.query(ANPRRead).order_by(ANPRRead.timestamp.desc()).limit(limit).all()
+
+    @app.get("/fast/anpr/reads", response_model=List[ANPRReadResponse], response_class=FastJSONResponse)
+    async def fast_reads(limit: int = 100, db: Session = Depends(get_db)):
+        rows = read_query(db).order_by(ANPRRead.timestamp.desc()).limit(limit).all()
+        return FastJSONResponse(rows_to_dicts(READ_FIELDS, rows))
+
+    @app.get("/orm/api/hotlist-groups", response_model=List[HotlistGroupResponse])
+    async def orm_groups(limit: int = 100, db: Session = Depends(get_db)):
+        return db.query(HotlistGroup).order_by(HotlistGroup.id).limit(limit).all()
+
+    @app.get("/fast/api/hotlist-groups", response_model=List[HotlistGroupResponse], response_class=FastJSONResponse)
+    async def fast_groups(limit: int = 100, db: Session = Depends(get_db)):
+        rows = group_query(db).order_by(HotlistGroup.id).limit(limit).all()
+        return FastJSONResponse(groups_with_vehicles(db, rows))
+
+    return app
+
+
+def time_endpoint(client: TestClient, url: str, iterations: int) -> dict:
+    client.get(url)  # warm up
+    timings = []
+    size = 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - started)
+        size = len(response.content)
+    timings.sort()
+    return {
+        "mean_ms": round(statistics.mean(timings) * 1000, 2),
+        "p50_ms": round(timings[len(timings) // 2] * 1000, 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1] * 1000, 2),
+        "requests_per_second": round(len(timings) / sum(timings), 1),
+        "bytes": size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reads", type=int, default=5000)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--vehicles-per-group", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="anpr_serialization_")
+    engine = build_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    seed(Session, args.reads, args.groups, args.vehicles_per_group)
+
+    results = {}
+    with TestClient(build_app(Session)) as client:
+        for path in ("/anpr/reads", "/api/hotlist-groups"):
+            url = f"{path}?limit={args.limit}"
+            orm_body = client.get(f"/orm{url}").json()
+            fast_body = client.get(f"/fast{url}").json()
+            if orm_body != fast_body:
+                raise SystemExit(f"{path}: fast path output differs from the validated path")
+
+            before = time_endpoint(client, f"/orm{url}", args.iterations)
+            after = time_endpoint(client, f"/fast{url}", args.iterations)
+            results[path] = {"before": before, "after": after,
+                             "speedup": round(before["mean_ms"] / after["mean_ms"], 2)}
+            print(f"{path} (limit={args.limit}): before {before['mean_ms']}ms mean / {before['p95_ms']}ms p95, "
+                  f"after {after['mean_ms']}ms mean / {after['p95_ms']}ms p95, {results[path]['speedup']}x")
+    engine.dispose()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""
+Ingest and hotlist sync load test.
+
+Drives the BOF endpoints the way a deployment does: cameras sending compact
+captures, full captures with images, compound batches and buffered
+sendCaptureStream uploads at a target rate,
+while N devices poll getHotlistStatus and pull getHotlistUpdates for groups
+whose revision moved. Reports p50/p95/p99 latency and throughput per endpoint
+and can write the results as JSON for comparison between commits. With
+--fail-on-errors it exits non-zero if any request failed, or a stream's summary
+does not account for every line sent, so a short run doubles as an end-to-end
+check of the ingest paths (at the default LOG_LEVEL, so their log calls run too).
+
+By default the app runs in-process (httpx ASGITransport) inside a throwaway
+working directory, so the database, uploads and thumbnail cache never touch
+the checkout. Pass --url to load a running server instead.
+
+    python benchmarks/load_test.py --duration 30 --rate 200 --devices 50 --hotlist-size 20000
+    python benchmarks/load_test.py --url http://localhost:8000 --json results.json
+    python benchmarks/load_test.py --duration 5 --rate 20 --devices 2 --hotlist-size 100 --fail-on-errors
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+CAPTURE_SERVICE = "/bof/services/InputCaptureWebService"
+HOTLIST_SERVICE = "/bof/services/UpdateHotlistsService"
+
+
+class EndpointStats:
+    """Latencies and outcomes for one endpoint"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.status_codes = {}
+
+    def record(self, seconds: float, status_code: int):
+        self.latencies.append(seconds)
+        self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+        if status_code >= 400:
+            self.errors += 1
+
+    def record_failure(self, seconds: float, error: Exception):
+        self.latencies.append(seconds)
+        self.errors += 1
+        key = type(error).__name__
+        self.status_codes[key] = self.status_codes.get(key, 0) + 1
+
+    def record_mismatch(self, key: str):
+        """A successful response whose body is not what was sent"""
+        self.errors += 1
+        self.status_codes[key] = self.status_codes.get(key, 0) + 1
+
+    @staticmethod
+    def _percentile(ordered, fraction):
+        # Nearest rank
+        index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+        return ordered[index]
+
+    def summary(self, elapsed: float) -> dict:
+        ordered = sorted(self.latencies)
+        count = len(ordered)
+        result = {
+            "requests": count,
+            "errors": self.errors,
+            "status_codes": {str(code): total for code, total in self.status_codes.items()},
+            "throughput_per_second": round(count / elapsed, 2) if elapsed else 0.0,
+        }
+        if count:
+            result.update({
+                "mean_ms": round(sum(ordered) / count * 1000, 2),
+                "p50_ms": round(self._percentile(ordered, 0.50) * 1000, 2),
+                "p95_ms": round(self._percentile(ordered, 0.95) * 1000, 2),
+                "p99_ms": round(self._percentile(ordered, 0.99) * 1000, 2),
+                "max_ms": round(ordered[-1] * 1000, 2),
+            })
+        return result
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.stats = {}
+        self.hotlist_names = []
+        self.hotlist_plates = []
+        self.image = base64.b64encode(self.rng.randbytes(args.image_kb * 1024)).decode("ascii")
+        self.sequence = 0
+        self.late = 0
+        self.deadline = 0.0
+
+    async def timed(self, name: str, method: str, url: str, **kwargs):
+        stats = self.stats.setdefault(name, EndpointStats())
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except Exception as e:
+            stats.record_failure(time.perf_counter() - started, e)
+            return None
+        stats.record(time.perf_counter() - started, response.status_code)
+        return response
+
+    # Setup
+
+    async def seed_hotlists(self):
+        """Create hotlist groups sharing --hotlist-size plates, via the CSV upload endpoint"""
+        args = self.args
+        run_id = uuid.uuid4().hex[:6].upper()
+        per_group = max(1, args.hotlist_size // max(args.hotlist_groups, 1))
+        for group_index in range(args.hotlist_groups):
+            name = f"LOADTEST-{run_id}-{group_index + 1}"
+            response = await self.client.post("/api/hotlist-groups", json={"name": name, "vehicles": []})
+            response.raise_for_status()
+            group_id = response.json()["id"]
+
+            plates = [f"H{group_index:02d}{n:06d}" for n in range(per_group)]
+            rows = ["license_plate,vehicle_make,warning_markers"]
+            rows += [f"{plate},LOADTEST,BENCH" for plate in plates]
+            response = await self.client.post(
+                f"/api/hotlist-groups/{group_id}/upload-csv",
+                files={"file": ("hotlist.csv", "\n".join(rows).encode(), "text/csv")},
+                timeout=None,
+            )
+            response.raise_for_status()
+            self.hotlist_names.append(name)
+            self.hotlist_plates.extend(plates)
+
+    # Capture generators
+
+    def _next_capture(self):
+        self.sequence += 1
+        if self.hotlist_plates and self.rng.random() < self.args.hit_rate:
+            vrm = self.rng.choice(self.hotlist_plates)
+        else:
+            vrm = f"LT{self.sequence:08d}"
+        camera_id = self.rng.randrange(self.args.cameras) + 1
+        source_id = (camera_id - 1) // 4 + 1
+        capture_date = datetime.now(timezone.utc).isoformat()
+        latitude = round(51.5 + self.rng.uniform(-0.2, 0.2), 6)
+        longitude = round(-0.12 + self.rng.uniform(-0.2, 0.2), 6)
+        confidence = self.rng.randint(70, 100)
+        return vrm, camera_id, source_id, capture_date, latitude, longitude, confidence
+
+    def _compact_string(self):
+        vrm, camera_id, source_id, capture_date, latitude, longitude, confidence = self._next_capture()
+        return f"sig|loadtest|{vrm}|1|{source_id}|{camera_id}|{capture_date}|{latitude}|{longitude}|||||{confidence}|true"
+
+    async def send_compact(self):
+        await self.timed("sendCompactCapture", "POST", f"{CAPTURE_SERVICE}/sendCompactCapture",
+                         json={"capture": self._compact_string()})
+
+    async def send_full(self):
+        vrm, camera_id, source_id, capture_date, latitude, longitude, confidence = self._next_capture()
+        await self.timed("sendCapture", "POST", f"{CAPTURE_SERVICE}/sendCapture", json={
+            "vrm": vrm,
+            "captureGUID": str(uuid.uuid4()),
+            "feedID": 1,
+            "sourceID": source_id,
+            "cameraID": camera_id,
+            "plateImage": self.image,
+            "overviewImage": self.image,
+            "captureDate": capture_date,
+            "latitude": latitude,
+            "longitude": longitude,
+            "confidencePercentage": confidence,
+            "motionTowardCamera": True,
+        })
+
+    async def send_compound(self):
+        captures = [self._compact_string() for _ in range(self.args.compound_size)]
+        await self.timed("sendCompoundCapture", "POST", f"{CAPTURE_SERVICE}/sendCompoundCapture",
+                         json={"captures": captures})
+
+    async def send_stream(self):
+        lines = [self._compact_string() for _ in range(self.args.stream_size)]
+        response = await self.timed("sendCaptureStream", "POST", f"{CAPTURE_SERVICE}/sendCaptureStream",
+                                    content="\n".join(lines).encode(), headers={"Content-Type": "text/plain"})
+        if response is None or response.status_code != 200:
+            return
+        summary = response.json()
+        if summary["lines"] != len(lines) or summary["errors"] or summary["created"] + summary["duplicates"] \
+                + summary["journalled"] != len(lines):
+            self.stats["sendCaptureStream"].record_mismatch("summary_mismatch")
+
+    # Load loops
+
+    async def _run_capture(self, sender, semaphore):
+        try:
+            await sender()
+        finally:
+            semaphore.release()
+
+    async def capture_loop(self):
+        """Open-loop arrivals at --rate requests per second, split by --mix"""
+        args = self.args
+        senders = [self.send_compact, self.send_full, self.send_compound, self.send_stream]
+        weights = args.mix
+        if args.rate <= 0 or not any(weights):
+            return
+        interval = 1.0 / args.rate
+        semaphore = asyncio.Semaphore(args.concurrency)
+        tasks = set()
+        next_send = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            if now >= self.deadline:
+                break
+            if next_send > now:
+                await asyncio.sleep(next_send - now)
+            elif now - next_send > interval:
+                # Falling behind the schedule: the app (or this client) is saturated
+                self.late += 1
+            next_send += interval
+
+            await semaphore.acquire()
+            sender = self.rng.choices(senders, weights)[0]
+            task = asyncio.create_task(self._run_capture(sender, semaphore))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def device_loop(self, device_index: int):
+        """One BOF device: poll status, pull updates for groups that changed"""
+        args = self.args
+        source_id = f"LOADTEST{device_index:04d}"
+        known = {}
+        status_etag = None
+        # Spread the first polls over one interval
+        await asyncio.sleep(min(self.rng.uniform(0, args.poll_interval), args.duration))
+        while time.perf_counter() < self.deadline:
+            headers = {"If-None-Match": status_etag} if status_etag and not args.no_conditional else {}
+            response = await self.timed("getHotlistStatus", "GET", f"{HOTLIST_SERVICE}/getHotlistStatus",
+                                        params={"sourceID": source_id}, headers=headers)
+            if response is not None and response.status_code == 200:
+                status_etag = response.headers.get("etag")
+                for hotlist in response.json():
+                    name, revision = hotlist["hotlist_name"], hotlist["latest_revision"]
+                    if args.always_fetch or known.get(name) != revision:
+                        update = await self.timed("getHotlistUpdates", "GET",
+                                                  f"{HOTLIST_SERVICE}/getHotlistUpdates",
+                                                  params={"sourceID": source_id, "hotlistname": name})
+                        if update is not None and update.status_code == 200:
+                            known[name] = revision
+            pause = args.poll_interval * self.rng.uniform(0.8, 1.2)
+            await asyncio.sleep(max(0.0, min(pause, self.deadline - time.perf_counter())))
+
+    async def run(self) -> dict:
+        args = self.args
+        await self.seed_hotlists()
+
+        started = time.perf_counter()
+        self.deadline = started + args.duration
+        await asyncio.gather(self.capture_loop(), *(self.device_loop(i) for i in range(args.devices)))
+        elapsed = time.perf_counter() - started
+
+        endpoints = {name: stats.summary(elapsed) for name, stats in sorted(self.stats.items())}
+        captures = sum(stats.summary(elapsed)["requests"] for name, stats in self.stats.items()
+                       if name.startswith("send"))
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "capture_requests_per_second": round(captures / elapsed, 2),
+            "late_arrivals": self.late,
+            "endpoints": endpoints,
+        }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def run_in_process(args) -> dict:
+    """Import the app inside a scratch directory and drive it through ASGITransport"""
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="anpr_loadtest_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir / 'loadtest.db'}")
+    os.environ.setdefault("THUMBNAIL_CACHE_DIR", str(workdir / "cache" / "thumbnails"))
+    sys.path.insert(0, str(REPO_ROOT))
+    if not (workdir / "templates").exists():
+        os.symlink(REPO_ROOT / "templates", workdir / "templates", target_is_directory=True)
+
+    import main
+
+    print(f"In-process app, working directory {workdir}")
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+            await wait_until_ready(client)
+            return await LoadTest(client, args).run()
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 60.0):
+    """Poll /readyz so the measurement starts with warm caches"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/readyz")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.05)
+    raise SystemExit("Server did not become ready")
+
+
+async def run_against_server(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency + args.devices)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        await wait_until_ready(client)
+        return await LoadTest(client, args).run()
+
+
+def print_report(results: dict):
+    print(f"\n{'endpoint':<22}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, summary in results["endpoints"].items():
+        print(f"{name:<22}{summary['requests']:>10}{summary['errors']:>8}{summary['throughput_per_second']:>10}"
+              f"{summary.get('p50_ms', '-'):>10}{summary.get('p95_ms', '-'):>10}{summary.get('p99_ms', '-'):>10}")
+    print(f"\nCapture requests/s: {results['capture_requests_per_second']}  "
+          f"late arrivals: {results['late_arrivals']}  elapsed: {results['elapsed_seconds']}s")
+
+
+def parse_mix(value: str):
+    weights = [float(part) for part in value.split(":")]
+    if len(weights) not in (3, 4) or any(weight < 0 for weight in weights):
+        raise argparse.ArgumentTypeError("mix must be three or four non-negative weights, compact:full:compound[:stream]")
+    return weights + [0.0] * (4 - len(weights))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Base URL of a running server (default: run the app in-process)")
+    parser.add_argument("--workdir", help="Scratch directory for the in-process app (default: a new temp dir)")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load")
+    parser.add_argument("--rate", type=float, default=100, help="Capture requests per second")
+    parser.add_argument("--mix", type=parse_mix, default=[70, 20, 10, 2],
+                        help="Relative weights compact:full:compound:stream (default 70:20:10:2)")
+    parser.add_argument("--compound-size", type=int, default=20, help="Captures per compound request (max 50)")
+    parser.add_argument("--stream-size", type=int, default=200, help="Captures per sendCaptureStream request")
+    parser.add_argument("--cameras", type=int, default=40)
+    parser.add_argument("--image-kb", type=int, default=24, help="Size of each synthetic image")
+    parser.add_argument("--hit-rate", type=float, default=0.02, help="Fraction of captures on a hotlisted plate")
+    parser.add_argument("--devices", type=int, default=20, help="Simulated BOF devices polling for hotlists")
+    parser.add_argument("--poll-interval", type=float, default=5, help="Seconds between device polls")
+    parser.add_argument("--always-fetch", action="store_true",
+                        help="Devices pull every hotlist on every poll instead of only changed ones")
+    parser.add_argument("--no-conditional", action="store_true",
+                        help="Devices poll without If-None-Match, so every status poll is a full response")
+    parser.add_argument("--hotlist-size", type=int, default=5000, help="Total hotlist entries")
+    parser.add_argument("--hotlist-groups", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=32, help="Maximum capture requests in flight")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--fail-on-errors", action="store_true",
+                        help="Exit with status 1 if any request failed or a stream summary did not match")
+    args = parser.parse_args()
+    args.compound_size = max(1, min(args.compound_size, 50))
+    args.stream_size = max(1, args.stream_size)
+    if args.json:
+        # The in-process run changes directory
+        args.json = os.path.abspath(args.json)
+
+    runner = run_against_server if args.url else run_in_process
+    results = asyncio.run(runner(args))
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "target": args.url or "in-process",
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("json",)},
+        **results,
+    }
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    if args.fail_on_errors and any(summary["errors"] for summary in results["endpoints"].values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
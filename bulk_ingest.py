@@ -0,0 +1,159 @@
+"""
+Streaming bulk capture uploads.
+
+sendCaptureStream takes a body of any length: one sendCapture JSON object per
+line (application/x-ndjson) or one compact capture string per line
+(text/plain). The body is split into lines as it arrives from the request
+stream and stored in transactions of BULK_INGEST_CHUNK_LINES lines, so memory
+use depends on the chunk size and the longest line, not on the upload.
+
+A unit catching up on a day of buffered reads sends it in one request instead
+of thousands of 50-capture sendCompoundCapture calls. Results are either a
+summary with the numbers of the lines that failed, or one result per line.
+Per-line results are spooled (to disk past BULK_RESULT_SPOOL_BYTES) and sent
+once the upload has been stored.
+"""
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Lines stored per transaction
+BULK_INGEST_CHUNK_LINES = int(os.getenv("BULK_INGEST_CHUNK_LINES", "500"))
+
+# Longer lines are reported as errors and skipped (sendCapture lines carry base64 images)
+BULK_INGEST_MAX_LINE_BYTES = int(os.getenv("BULK_INGEST_MAX_LINE_BYTES", str(16 * 1024 * 1024)))
+
+# Failed line numbers listed in the summary; the count covers all of them
+BULK_INGEST_MAX_ERROR_LINES = 1000
+
+# Per-line results kept in memory up to this size, then spooled to a temporary file
+BULK_RESULT_SPOOL_BYTES = 1024 * 1024
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+RESULT_CREATED = "created"
+RESULT_DUPLICATE = "duplicate"
+RESULT_JOURNALLED = "journalled"
+RESULT_ERROR = "error"
+
+
+def _dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":")).encode("utf-8")
+
+
+async def iter_lines(chunks: AsyncIterator[bytes],
+                     max_line_bytes: int = BULK_INGEST_MAX_LINE_BYTES) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    (line number, line) for each non-blank line of a byte stream. Lines over
+    max_line_bytes are yielded as None and not buffered past the limit.
+    """
+    buffer = bytearray()
+    line_number = 0
+    oversized = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                if not oversized:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line_bytes:
+                        oversized = True
+                        buffer.clear()
+                break
+            line_number += 1
+            if oversized:
+                oversized = False
+                yield line_number, None
+            else:
+                buffer += chunk[start:end]
+                if len(buffer) > max_line_bytes:
+                    yield line_number, None
+                elif buffer.strip():
+                    yield line_number, bytes(buffer).rstrip(b"\r")
+                buffer.clear()
+            start = end + 1
+    if oversized or buffer.strip():
+        line_number += 1
+        yield line_number, None if oversized else bytes(buffer).rstrip(b"\r")
+
+
+class BulkIngestResult:
+    """Counts, failed line numbers and (optionally) spooled per-line results of one upload"""
+
+    def __init__(self, per_line: bool = False):
+        self.lines = 0
+        self.created = 0
+        self.duplicates = 0
+        self.journalled = 0
+        self.errors = 0
+        self.error_lines: List[int] = []
+        self.chunks = 0
+        self.aborted: Optional[dict] = None
+        self._spool = SpooledTemporaryFile(max_size=BULK_RESULT_SPOOL_BYTES) if per_line else None
+
+    def record(self, line: int, status: str, read_id: Optional[int] = None, error: Optional[str] = None):
+        self.lines += 1
+        if status == RESULT_CREATED:
+            self.created += 1
+        elif status == RESULT_DUPLICATE:
+            self.duplicates += 1
+        elif status == RESULT_JOURNALLED:
+            self.journalled += 1
+        else:
+            self.errors += 1
+            if len(self.error_lines) < BULK_INGEST_MAX_ERROR_LINES:
+                self.error_lines.append(line)
+        if self._spool is not None:
+            result = {"line": line, "status": status}
+            if read_id is not None:
+                result["read_id"] = read_id
+            if error is not None:
+                result["error"] = error
+            self._spool.write(_dumps(result) + b"\n")
+
+    def abort(self, line: int, error: str):
+        """Stop at a chunk that could not be stored; lines from `line` on were not stored"""
+        self.aborted = {"resume_from_line": line, "error": error}
+
+    def summary(self) -> dict:
+        summary = {
+            "lines": self.lines,
+            "created": self.created,
+            "duplicates": self.duplicates,
+            "journalled": self.journalled,
+            "errors": self.errors,
+            "error_lines": self.error_lines,
+            "error_lines_truncated": self.errors > len(self.error_lines),
+            "chunks": self.chunks,
+            "success": self.aborted is None,
+        }
+        if self.aborted is not None:
+            summary.update(self.aborted)
+        return summary
+
+    def iter_ndjson(self, block_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Spooled per-line results followed by a {"summary": ...} line"""
+        try:
+            if self._spool is not None:
+                self._spool.seek(0)
+                while True:
+                    block = self._spool.read(block_size)
+                    if not block:
+                        break
+                    yield block
+            yield _dumps({"summary": self.summary()}) + b"\n"
+        finally:
+            self.close()
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
@@ -0,0 +1,104 @@
+"""
+Cross-process cache invalidation.
+
+Every worker process keeps its own in-memory caches (hotlist match index,
+device sources). A worker that changes the data behind a cache bumps that
+topic's row in cache_versions; all workers poll the table at most once per
+CACHE_SYNC_INTERVAL_SECONDS and invalidate caches whose version moved. With a
+single worker the local invalidation is immediate and polling is cheap.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, List
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import CacheVersion
+
+logger = logging.getLogger(__name__)
+
+CACHE_SYNC_INTERVAL_SECONDS = float(os.getenv("CACHE_SYNC_INTERVAL_SECONDS", "1.0"))
+
+# Topics
+HOTLISTS = "hotlists"
+DEVICE_SOURCES = "device_sources"
+FLEET_SYNC = "fleet_sync"
+ALLOCATIONS = "hotlist_allocations"
+
+
+class InvalidationChannel:
+    """Version-row based invalidation shared by all processes using the database"""
+
+    def __init__(self, interval_seconds: float = CACHE_SYNC_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._versions: Dict[str, int] = {}
+        self._subscribers: Dict[str, List[Callable[[], None]]] = defaultdict(list)
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: str, callback: Callable[[], None]):
+        """Call callback whenever topic changes in any process"""
+        self._subscribers[topic].append(callback)
+
+    def _notify(self, topic: str):
+        for callback in self._subscribers.get(topic, ()):
+            callback()
+
+    def publish(self, topic: str):
+        """Announce that the data behind topic changed (call after committing the change)"""
+        db = SessionLocal()
+        try:
+            for attempt in range(2):
+                try:
+                    updated = db.query(CacheVersion).filter(CacheVersion.topic == topic).update(
+                        {CacheVersion.version: CacheVersion.version + 1, CacheVersion.updated_at: datetime.utcnow()},
+                        synchronize_session=False
+                    )
+                    if not updated:
+                        db.add(CacheVersion(topic=topic, version=1))
+                    db.commit()
+                    break
+                except IntegrityError:
+                    # Another process created the row first
+                    db.rollback()
+            version = db.query(CacheVersion.version).filter(CacheVersion.topic == topic).scalar()
+        finally:
+            db.close()
+
+        with self._lock:
+            if version is not None:
+                self._versions[topic] = version
+        self._notify(topic)
+
+    def poll(self, force: bool = False):
+        """Invalidate local caches changed by other processes. Throttled unless forced."""
+        now = time.monotonic()
+        if not force and now < self._next_poll:
+            return
+        self._next_poll = now + self.interval_seconds
+
+        db = SessionLocal()
+        try:
+            rows = db.query(CacheVersion.topic, CacheVersion.version).all()
+        except Exception as e:
+            logger.warning("Cache version poll failed: %s", e, extra={"event": "cache_sync.poll_failed"})
+            return
+        finally:
+            db.close()
+
+        changed = []
+        with self._lock:
+            for topic, version in rows:
+                if self._versions.get(topic) != version:
+                    self._versions[topic] = version
+                    changed.append(topic)
+        for topic in changed:
+            self._notify(topic)
+
+
+invalidation_channel = InvalidationChannel()
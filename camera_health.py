@@ -0,0 +1,197 @@
+"""
+Per-camera health and throughput monitoring.
+
+The ingest endpoints update these stats in memory on every read, so no
+database query is needed per read or per health check. Each camera is compared
+against its own rolling baseline to flag cameras that have gone silent or whose
+recognition confidence has dropped.
+"""
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import os
+import threading
+import time
+
+# Minutes of per-minute buckets kept per camera
+BUCKET_MINUTES = int(os.getenv("CAMERA_HEALTH_BUCKET_MINUTES", "60"))
+
+# Window used for "current" reads per minute and mean confidence
+RECENT_MINUTES = int(os.getenv("CAMERA_HEALTH_RECENT_MINUTES", "5"))
+
+# Smoothing factors for the per-camera baselines (per completed minute)
+RATE_BASELINE_ALPHA = float(os.getenv("CAMERA_HEALTH_RATE_ALPHA", "0.1"))
+CONFIDENCE_BASELINE_ALPHA = float(os.getenv("CAMERA_HEALTH_CONFIDENCE_ALPHA", "0.05"))
+LAG_ALPHA = 0.1
+
+# A camera is silent after this many expected inter-read intervals without a read...
+SILENCE_FACTOR = float(os.getenv("CAMERA_HEALTH_SILENCE_FACTOR", "10"))
+# ...but never sooner than this
+MIN_SILENCE_SECONDS = int(os.getenv("CAMERA_HEALTH_MIN_SILENCE_SECONDS", "300"))
+# Cameras quieter than this (reads/min) have no reliable silence baseline
+MIN_BASELINE_RATE = float(os.getenv("CAMERA_HEALTH_MIN_BASELINE_RATE", "0.1"))
+
+# Confidence drop (percentage points) below baseline that flags a camera
+LOW_CONFIDENCE_DROP = float(os.getenv("CAMERA_HEALTH_LOW_CONFIDENCE_DROP", "15"))
+# Recent reads needed before the confidence check applies
+MIN_CONFIDENCE_SAMPLES = int(os.getenv("CAMERA_HEALTH_MIN_CONFIDENCE_SAMPLES", "20"))
+
+
+def _to_naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class CameraStats:
+    """Rolling counters for a single camera"""
+    __slots__ = (
+        "camera_id", "buckets", "total_reads", "reads_with_images",
+        "last_seen", "last_capture", "last_lag_seconds", "lag_seconds",
+        "baseline_rate", "baseline_confidence",
+    )
+
+    def __init__(self, camera_id: str):
+        self.camera_id = camera_id
+        # Each bucket is [minute, reads, confidence_sum]
+        self.buckets = deque(maxlen=BUCKET_MINUTES)
+        self.total_reads = 0
+        self.reads_with_images = 0
+        self.last_seen: Optional[float] = None
+        self.last_capture: Optional[datetime] = None
+        self.last_lag_seconds: Optional[float] = None
+        self.lag_seconds: Optional[float] = None
+        self.baseline_rate: Optional[float] = None
+        self.baseline_confidence: Optional[float] = None
+
+    def _fold_minutes(self, minute: int):
+        """Fold completed minutes (including empty ones) into the baselines"""
+        if not self.buckets:
+            return
+        last_minute, reads, confidence_sum = self.buckets[-1]
+        if minute <= last_minute:
+            return
+
+        self._fold(reads, confidence_sum)
+        # Cap the number of empty minutes folded in, the baseline has decayed by then
+        for _ in range(min(minute - last_minute - 1, BUCKET_MINUTES)):
+            self._fold(0, 0)
+
+    def _fold(self, reads: int, confidence_sum: int):
+        if self.baseline_rate is None:
+            self.baseline_rate = float(reads)
+        else:
+            self.baseline_rate += RATE_BASELINE_ALPHA * (reads - self.baseline_rate)
+
+        if reads:
+            mean_confidence = confidence_sum / reads
+            if self.baseline_confidence is None:
+                self.baseline_confidence = mean_confidence
+            else:
+                self.baseline_confidence += CONFIDENCE_BASELINE_ALPHA * (mean_confidence - self.baseline_confidence)
+
+    def record_read(self, now: float, confidence: int, capture_time: Optional[datetime], has_images: bool):
+        minute = int(now // 60)
+        self._fold_minutes(minute)
+        if self.buckets and self.buckets[-1][0] == minute:
+            bucket = self.buckets[-1]
+            bucket[1] += 1
+            bucket[2] += confidence
+        else:
+            self.buckets.append([minute, 1, confidence])
+
+        self.total_reads += 1
+        if has_images:
+            self.reads_with_images += 1
+        self.last_seen = now
+
+        if capture_time is not None:
+            capture_time = _to_naive_utc(capture_time)
+            self.last_capture = capture_time
+            lag = now - capture_time.replace(tzinfo=timezone.utc).timestamp()
+            self.last_lag_seconds = lag
+            if self.lag_seconds is None:
+                self.lag_seconds = lag
+            else:
+                self.lag_seconds += LAG_ALPHA * (lag - self.lag_seconds)
+
+    def snapshot(self, now: float) -> dict:
+        current_minute = int(now // 60)
+        recent_reads = 0
+        recent_confidence = 0
+        for minute, reads, confidence_sum in self.buckets:
+            if minute > current_minute - RECENT_MINUTES:
+                recent_reads += reads
+                recent_confidence += confidence_sum
+
+        mean_confidence = recent_confidence / recent_reads if recent_reads else None
+        silent_seconds = now - self.last_seen if self.last_seen is not None else None
+
+        flags = []
+        if silent_seconds is not None and self.baseline_rate is not None and self.baseline_rate >= MIN_BASELINE_RATE:
+            expected_interval = 60.0 / self.baseline_rate
+            if silent_seconds > max(SILENCE_FACTOR * expected_interval, MIN_SILENCE_SECONDS):
+                flags.append("silent")
+        if (mean_confidence is not None and self.baseline_confidence is not None
+                and recent_reads >= MIN_CONFIDENCE_SAMPLES
+                and mean_confidence < self.baseline_confidence - LOW_CONFIDENCE_DROP):
+            flags.append("low_confidence")
+
+        return {
+            "camera_id": self.camera_id,
+            "status": "alert" if flags else "ok",
+            "flags": flags,
+            "reads_per_minute": round(recent_reads / RECENT_MINUTES, 2),
+            "baseline_reads_per_minute": round(self.baseline_rate, 2) if self.baseline_rate is not None else None,
+            "mean_confidence": round(mean_confidence, 1) if mean_confidence is not None else None,
+            "baseline_confidence": round(self.baseline_confidence, 1) if self.baseline_confidence is not None else None,
+            "total_reads": self.total_reads,
+            "image_attach_rate": round(self.reads_with_images / self.total_reads, 3) if self.total_reads else 0.0,
+            "last_seen": datetime.fromtimestamp(self.last_seen, timezone.utc).replace(tzinfo=None) if self.last_seen is not None else None,
+            "last_capture": self.last_capture,
+            "seconds_since_last_read": round(silent_seconds, 1) if silent_seconds is not None else None,
+            "ingest_lag_seconds": round(self.lag_seconds, 2) if self.lag_seconds is not None else None,
+            "last_ingest_lag_seconds": round(self.last_lag_seconds, 2) if self.last_lag_seconds is not None else None,
+        }
+
+
+class CameraHealthMonitor:
+    """In-memory registry of per-camera stats, updated from the ingest path"""
+
+    def __init__(self):
+        self._cameras: Dict[str, CameraStats] = {}
+        self._lock = threading.Lock()
+
+    def record_read(self, camera_id: str, confidence: Optional[int] = None,
+                    capture_time: Optional[datetime] = None, has_images: bool = False):
+        """Record one ingested read for a camera"""
+        now = time.time()
+        with self._lock:
+            stats = self._cameras.get(camera_id)
+            if stats is None:
+                stats = self._cameras[camera_id] = CameraStats(camera_id)
+            stats.record_read(now, confidence or 0, capture_time, has_images)
+
+    def record_image_attached(self, camera_id: str):
+        """Record that a read without images has had its first image attached later"""
+        with self._lock:
+            stats = self._cameras.get(camera_id)
+            if stats is not None and stats.reads_with_images < stats.total_reads:
+                stats.reads_with_images += 1
+
+    def get_camera(self, camera_id: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            stats = self._cameras.get(camera_id)
+            return stats.snapshot(now) if stats is not None else None
+
+    def get_all(self) -> List[dict]:
+        """Snapshots for every camera, flagged cameras first"""
+        now = time.time()
+        with self._lock:
+            snapshots = [stats.snapshot(now) for stats in self._cameras.values()]
+        snapshots.sort(key=lambda s: (s["status"] != "alert", s["camera_id"]))
+        return snapshots
+
+
+camera_monitor = CameraHealthMonitor()
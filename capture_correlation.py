@@ -0,0 +1,181 @@
+"""
+Capture GUID correlation for addBinaryCaptureData.
+
+Maps recently seen capture GUIDs to their ANPR read so an image can be attached
+with a keyed update (TTL-evicted and size-capped, per worker). Images that
+arrive before their capture are written to the uploads directory and recorded
+in pending_capture_images until sendCapture delivers the matching GUID, so
+they are found whichever worker (or journal replay) stores the capture.
+
+An image is only ever claimed once: taking it deletes its row, and whoever's
+DELETE removed the row attaches the file. The image side records the row and
+then looks for the capture again, and the capture side takes the rows after
+committing its read, so however the two interleave one of them sees the other.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from metrics import CACHE_REQUESTS
+from models import PendingCaptureImage
+
+logger = logging.getLogger(__name__)
+
+_guid_hits = CACHE_REQUESTS.labels("capture_guid", "hit")
+_guid_misses = CACHE_REQUESTS.labels("capture_guid", "miss")
+
+# Held images are read as plain rows, as their IDs can be reused once deleted
+_PENDING_COLUMNS = (PendingCaptureImage.id, PendingCaptureImage.capture_guid, PendingCaptureImage.image_type,
+                    PendingCaptureImage.image_path, PendingCaptureImage.size)
+
+# Recently seen GUID -> read mappings kept in memory
+CAPTURE_GUID_CACHE_SIZE = int(os.getenv("CAPTURE_GUID_CACHE_SIZE", "100000"))
+CAPTURE_GUID_TTL_SECONDS = int(os.getenv("CAPTURE_GUID_TTL_SECONDS", "900"))
+
+# Images waiting for their capture record
+PENDING_IMAGE_TTL_SECONDS = int(os.getenv("PENDING_IMAGE_TTL_SECONDS", "300"))
+PENDING_IMAGE_MAX_BYTES = int(os.getenv("PENDING_IMAGE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# How long the pending image totals reported to /metrics are reused
+PENDING_TOTALS_TTL_SECONDS = 5.0
+
+
+class CaptureRef:
+    """Where a capture GUID lives in anpr_reads"""
+    __slots__ = ("read_id", "camera_id", "has_images", "expires_at")
+
+    def __init__(self, read_id: int, camera_id: str, has_images: bool, expires_at: float):
+        self.read_id = read_id
+        self.camera_id = camera_id
+        self.has_images = has_images
+        self.expires_at = expires_at
+
+
+class CaptureCorrelator:
+    """GUID -> read index plus the pending_capture_images table for early images"""
+
+    def __init__(self, cache_size: int = CAPTURE_GUID_CACHE_SIZE, ttl_seconds: int = CAPTURE_GUID_TTL_SECONDS,
+                 pending_ttl_seconds: int = PENDING_IMAGE_TTL_SECONDS,
+                 pending_max_bytes: int = PENDING_IMAGE_MAX_BYTES):
+        self.cache_size = cache_size
+        self.ttl_seconds = ttl_seconds
+        self.pending_ttl_seconds = pending_ttl_seconds
+        self.pending_max_bytes = pending_max_bytes
+        self._captures: "OrderedDict[str, CaptureRef]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._totals: Tuple[int, int] = (0, 0)
+        self._totals_until = 0.0
+
+    def __len__(self):
+        return len(self._captures)
+
+    def pending_totals(self) -> Tuple[int, int]:
+        """(images, bytes) waiting for their capture, across all workers; one query per PENDING_TOTALS_TTL_SECONDS"""
+        now = time.monotonic()
+        if now < self._totals_until:
+            return self._totals
+        db = SessionLocal()
+        try:
+            count, size = db.query(func.count(PendingCaptureImage.id), func.sum(PendingCaptureImage.size)).one()
+        finally:
+            db.close()
+        self._totals = (count, size or 0)
+        self._totals_until = now + PENDING_TOTALS_TTL_SECONDS
+        return self._totals
+
+    def remember(self, guid: str, read_id: int, camera_id: str, has_images: bool = False):
+        """Record the read a capture GUID was stored as"""
+        now = time.monotonic()
+        with self._lock:
+            self._captures.pop(guid, None)
+            self._captures[guid] = CaptureRef(read_id, camera_id, has_images, now + self.ttl_seconds)
+            while self._captures:
+                oldest = next(iter(self._captures.values()))
+                if oldest.expires_at > now and len(self._captures) <= self.cache_size:
+                    break
+                self._captures.popitem(last=False)
+
+    def lookup(self, guid: str) -> Optional[CaptureRef]:
+        now = time.monotonic()
+        with self._lock:
+            ref = self._captures.get(guid)
+            if ref is not None and ref.expires_at <= now:
+                del self._captures[guid]
+                ref = None
+        (_guid_misses if ref is None else _guid_hits).inc()
+        return ref
+
+    def _claim(self, db: Session, rows: Iterable) -> list:
+        """Delete the rows, returning those this session deleted (another may have claimed some)"""
+        return [
+            row for row in rows
+            if db.query(PendingCaptureImage).filter(PendingCaptureImage.id == row.id).delete(synchronize_session=False)
+        ]
+
+    def _discard(self, db: Session, rows: list, reason: str):
+        """Drop pending images and their files (commits)"""
+        claimed = [(row.capture_guid, row.image_path) for row in self._claim(db, rows)]
+        db.commit()
+        for _, image_path in claimed:
+            try:
+                os.unlink(image_path)
+            except FileNotFoundError:
+                pass
+        if claimed:
+            logger.warning("Discarded %s pending image(s): %s", len(claimed), reason,
+                           extra={"event": "binary.pending_discarded", "images": len(claimed),
+                                  "capture_guids": sorted({guid for guid, _ in claimed})})
+
+    def add_pending(self, db: Session, guid: str, image_type: str, image_path: str, size: int):
+        """Record an image written to image_path until the capture with this GUID arrives (commits)"""
+        now = datetime.utcnow()
+        expired = db.query(*_PENDING_COLUMNS).filter(
+            PendingCaptureImage.created_at < now - timedelta(seconds=self.pending_ttl_seconds)
+        ).all()
+        if expired:
+            self._discard(db, expired, "capture not received in time")
+
+        # A resent image replaces the earlier copy of the same type
+        resent = db.query(*_PENDING_COLUMNS).filter(
+            PendingCaptureImage.capture_guid == guid, PendingCaptureImage.image_type == image_type
+        ).all()
+        if resent:
+            self._discard(db, resent, "image resent")
+
+        held = db.query(func.sum(PendingCaptureImage.size)).scalar() or 0
+        if held + size > self.pending_max_bytes:
+            oldest = []
+            for row in db.query(*_PENDING_COLUMNS).order_by(PendingCaptureImage.id):
+                if held + size <= self.pending_max_bytes:
+                    break
+                oldest.append(row)
+                held -= row.size
+            self._discard(db, oldest, "pending image store full")
+
+        db.add(PendingCaptureImage(capture_guid=guid, image_type=image_type, image_path=image_path,
+                                   size=size, created_at=now))
+        db.commit()
+
+    def take_pending(self, db: Session, guid: str) -> List[Tuple[str, str]]:
+        """Claim the (image_type, image_path) held for a GUID (caller commits)"""
+        return self.take_pending_many(db, [guid]).get(guid, [])
+
+    def take_pending_many(self, db: Session, guids: List[str]) -> Dict[str, List[Tuple[str, str]]]:
+        """Claim the images held for several GUIDs, in one query: GUID -> [(image_type, image_path)] (caller commits)"""
+        if not guids:
+            return {}
+        rows = db.query(*_PENDING_COLUMNS).filter(PendingCaptureImage.capture_guid.in_(guids)).all()
+        taken: Dict[str, List[Tuple[str, str]]] = {}
+        for row in self._claim(db, rows):
+            taken.setdefault(row.capture_guid, []).append((row.image_type, row.image_path))
+        return taken
+
+capture_correlator = CaptureCorrelator()
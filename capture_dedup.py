@@ -0,0 +1,175 @@
+"""
+Duplicate capture suppression for the ingest endpoints.
+
+Cameras resend captures after timeouts and multi-lane rigs report the same
+plate from more than one camera. Recent captures are remembered in memory under
+a time-bucketed (VRM, camera or site, window) key so repeats can be dropped,
+merged into the original read, or tagged. Entries expire after a TTL and the
+table is capped, so memory stays bounded.
+
+A repeat can arrive while its original is still being stored (another request
+in the threadpool, or a stream chunk not committed yet). It then waits up to
+DEDUP_INFLIGHT_WAIT_SECONDS for the original's read ID rather than being
+stored as a new, untagged read.
+"""
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+import os
+import threading
+import time
+
+from metrics import CACHE_REQUESTS
+
+DEDUP_MODES = ("off", "drop", "merge", "tag")
+
+# off: no de-duplication, drop: ignore repeats, merge: fold repeats into the
+# original read, tag: store repeats with duplicate_of_id set
+DEDUP_MODE = os.getenv("DEDUP_MODE", "merge").lower()
+
+# Captures of the same VRM closer together than this are duplicates
+DEDUP_WINDOW_SECONDS = int(os.getenv("DEDUP_WINDOW_SECONDS", "5"))
+
+# camera: same camera only, site: any camera on the same source/site
+DEDUP_SCOPE = os.getenv("DEDUP_SCOPE", "camera").lower()
+
+# How long a capture is remembered, and the maximum number remembered
+DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", "120"))
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "200000"))
+
+# How long a repeat waits for its original to be committed
+DEDUP_INFLIGHT_WAIT_SECONDS = float(os.getenv("DEDUP_INFLIGHT_WAIT_SECONDS", "2"))
+
+
+_duplicates = CACHE_REQUESTS.labels("dedup", "hit")
+_new_captures = CACHE_REQUESTS.labels("dedup", "miss")
+
+
+def _epoch_seconds(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class DedupEntry:
+    """A remembered capture. read_id is filled in once the read is committed (see CaptureDeduplicator.stored)."""
+    __slots__ = ("key", "capture_ts", "read_id", "released", "expires_at")
+
+    def __init__(self, key: tuple, capture_ts: float, expires_at: float):
+        self.key = key
+        self.capture_ts = capture_ts
+        self.read_id: Optional[int] = None
+        # Set when the original was never stored
+        self.released = False
+        self.expires_at = expires_at
+
+
+class CaptureDeduplicator:
+    """Bounded, TTL-evicted index of recent captures"""
+
+    def __init__(self, mode: str = DEDUP_MODE, window_seconds: int = DEDUP_WINDOW_SECONDS,
+                 scope: str = DEDUP_SCOPE, ttl_seconds: int = DEDUP_TTL_SECONDS,
+                 max_entries: int = DEDUP_MAX_ENTRIES, inflight_wait_seconds: float = DEDUP_INFLIGHT_WAIT_SECONDS):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"Invalid DEDUP_MODE '{mode}', expected one of {', '.join(DEDUP_MODES)}")
+        self.mode = mode
+        self.window_seconds = max(window_seconds, 1)
+        self.scope = scope
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.inflight_wait_seconds = inflight_wait_seconds
+        # Insertion ordered, so the oldest entries are always at the front
+        self._entries: "OrderedDict[tuple, DedupEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Notified when an entry's original is stored or released
+        self._settled = threading.Condition(self._lock)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _scope_key(self, vrm: str, camera_id: str, site_id: Optional[str]) -> tuple:
+        normalised_vrm = vrm.replace(" ", "").upper()
+        if self.scope == "site" and site_id is not None:
+            return (normalised_vrm, "site", str(site_id))
+        return (normalised_vrm, "camera", str(camera_id))
+
+    def _evict(self, now: float):
+        entries = self._entries
+        while entries:
+            oldest = next(iter(entries.values()))
+            if oldest.expires_at > now and len(entries) <= self.max_entries:
+                break
+            entries.popitem(last=False)
+
+    def _find(self, scope_key: tuple, capture_ts: float, now: float) -> Optional[DedupEntry]:
+        bucket = int(capture_ts // self.window_seconds)
+        # A repeat can straddle a bucket boundary, so check both neighbours
+        for candidate_bucket in (bucket, bucket - 1, bucket + 1):
+            entry = self._entries.get(scope_key + (candidate_bucket,))
+            if (entry is not None and entry.expires_at > now
+                    and abs(entry.capture_ts - capture_ts) <= self.window_seconds):
+                return entry
+        return None
+
+    def claim(self, vrm: str, camera_id: str, site_id: Optional[str],
+              capture_time: datetime) -> Tuple[Optional[DedupEntry], bool]:
+        """
+        Look up a capture and remember it if it is new.
+        Returns (entry, is_duplicate). For a new capture the caller calls
+        stored(entry, read_id) after committing, or release(entry) on failure.
+        """
+        if not self.enabled:
+            return None, False
+
+        now = time.monotonic()
+        scope_key = self._scope_key(vrm, camera_id, site_id)
+        capture_ts = _epoch_seconds(capture_time)
+
+        with self._lock:
+            existing = self._find(scope_key, capture_ts, now)
+            if existing is not None:
+                _duplicates.inc()
+                return existing, True
+
+            key = scope_key + (int(capture_ts // self.window_seconds),)
+            entry = DedupEntry(key, capture_ts, now + self.ttl_seconds)
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            self._evict(now)
+        _new_captures.inc()
+        return entry, False
+
+    def stored(self, entry: Optional[DedupEntry], read_id: int):
+        """Record the read a claimed capture was committed as"""
+        if entry is None:
+            return
+        with self._settled:
+            entry.read_id = read_id
+            self._settled.notify_all()
+
+    def release(self, entry: Optional[DedupEntry]):
+        """Forget a claimed capture whose read was never stored"""
+        if entry is None:
+            return
+        with self._settled:
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+            entry.released = True
+            self._settled.notify_all()
+
+    def wait_stored(self, entry: DedupEntry) -> Optional[int]:
+        """
+        Read ID of a repeat's original, waiting up to inflight_wait_seconds if it is still
+        being stored. None if it was released, or is still in flight after the wait.
+        Blocking: call it off the event loop.
+        """
+        with self._settled:
+            self._settled.wait_for(lambda: entry.read_id is not None or entry.released, self.inflight_wait_seconds)
+            return entry.read_id
+
+
+capture_deduplicator = CaptureDeduplicator()
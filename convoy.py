@@ -0,0 +1,194 @@
+"""
+Convoy / co-travelling vehicle detection.
+
+Finds vehicles that repeatedly pass the same cameras within N seconds of a
+target VRM. Reads are scanned per camera in (camera_id, timestamp) order, only
+around the target's own passes, and joined against the target's timestamps
+with a sliding window. Candidates are scored by the number of distinct cameras
+they share with the target.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import heapq
+import logging
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import ANPRRead, ConvoyAnalysis, ConvoyCandidate
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip while streaming a camera's reads
+CHUNK_SIZE = 5000
+
+# Target passes per range query, keeps the generated SQL small
+MAX_INTERVALS_PER_QUERY = 200
+
+
+class _CandidateStats:
+    """Running co-occurrence totals for one candidate VRM"""
+    __slots__ = ("cameras", "co_occurrences", "first_seen", "last_seen")
+
+    def __init__(self):
+        self.cameras = set()
+        self.co_occurrences = 0
+        self.first_seen = None
+        self.last_seen = None
+
+    def add(self, camera_id: str, timestamp: datetime):
+        self.cameras.add(camera_id)
+        self.co_occurrences += 1
+        if self.first_seen is None or timestamp < self.first_seen:
+            self.first_seen = timestamp
+        if self.last_seen is None or timestamp > self.last_seen:
+            self.last_seen = timestamp
+
+
+def _merge_intervals(timestamps: List[datetime], window: timedelta) -> List[Tuple[datetime, datetime]]:
+    """Merge [t - window, t + window] around sorted target passes into disjoint ranges"""
+    intervals = []
+    for ts in timestamps:
+        start, end = ts - window, ts + window
+        if intervals and start <= intervals[-1][1]:
+            intervals[-1] = (intervals[-1][0], end)
+        else:
+            intervals.append((start, end))
+    return intervals
+
+
+def _target_passes(db: Session, target_vrm: str, start_time: Optional[datetime],
+                   end_time: Optional[datetime]) -> Dict[str, List[datetime]]:
+    """Target read timestamps grouped by camera, each list sorted"""
+    query = db.query(ANPRRead.camera_id, ANPRRead.timestamp).filter(ANPRRead.license_plate == target_vrm)
+    if start_time:
+        query = query.filter(ANPRRead.timestamp >= start_time)
+    if end_time:
+        query = query.filter(ANPRRead.timestamp <= end_time)
+
+    passes: Dict[str, List[datetime]] = {}
+    for camera_id, timestamp in query.order_by(ANPRRead.camera_id, ANPRRead.timestamp):
+        if timestamp is not None:
+            passes.setdefault(camera_id, []).append(timestamp)
+    return passes
+
+
+def _scan_camera(db: Session, camera_id: str, target_times: List[datetime], window: timedelta,
+                 target_vrm: str, candidates: Dict[str, _CandidateStats]) -> int:
+    """Sliding-window join of one camera's reads against the target's passes. Returns reads scanned."""
+    scanned = 0
+    intervals = _merge_intervals(target_times, window)
+
+    for i in range(0, len(intervals), MAX_INTERVALS_PER_QUERY):
+        batch = intervals[i:i + MAX_INTERVALS_PER_QUERY]
+        rows = db.query(ANPRRead.license_plate, ANPRRead.timestamp).filter(
+            ANPRRead.camera_id == camera_id,
+            or_(*(ANPRRead.timestamp.between(start, end) for start, end in batch))
+        ).order_by(ANPRRead.timestamp).yield_per(CHUNK_SIZE)
+
+        # Reads arrive in timestamp order, so the earliest target pass that can
+        # still match only ever moves forward.
+        pointer = 0
+        for license_plate, timestamp in rows:
+            scanned += 1
+            if license_plate == target_vrm:
+                continue
+            while pointer < len(target_times) and target_times[pointer] < timestamp - window:
+                pointer += 1
+            if pointer < len(target_times) and target_times[pointer] <= timestamp + window:
+                stats = candidates.get(license_plate)
+                if stats is None:
+                    stats = candidates[license_plate] = _CandidateStats()
+                stats.add(camera_id, timestamp)
+
+    return scanned
+
+
+def find_co_travellers(db: Session, target_vrm: str, window_seconds: int,
+                       start_time: Optional[datetime] = None, end_time: Optional[datetime] = None,
+                       min_cameras: int = 2, max_results: int = 100) -> Tuple[List[dict], dict]:
+    """
+    Find vehicles seen at the same cameras as the target within window_seconds.
+    Returns (ranked candidates, scan statistics).
+    """
+    window = timedelta(seconds=window_seconds)
+    passes = _target_passes(db, target_vrm, start_time, end_time)
+
+    candidates: Dict[str, _CandidateStats] = {}
+    scanned = 0
+    for camera_id in sorted(passes):
+        scanned += _scan_camera(db, camera_id, passes[camera_id], window, target_vrm, candidates)
+
+    qualifying = ((plate, stats) for plate, stats in candidates.items() if len(stats.cameras) >= min_cameras)
+    top = heapq.nlargest(
+        max_results, qualifying,
+        key=lambda item: (len(item[1].cameras), item[1].co_occurrences)
+    )
+
+    results = [
+        {
+            "rank": rank,
+            "license_plate": plate,
+            "camera_count": len(stats.cameras),
+            "co_occurrences": stats.co_occurrences,
+            "cameras": ",".join(sorted(stats.cameras)),
+            "first_seen": stats.first_seen,
+            "last_seen": stats.last_seen,
+        }
+        for rank, (plate, stats) in enumerate(top, start=1)
+    ]
+    summary = {
+        "target_reads": sum(len(times) for times in passes.values()),
+        "cameras_analysed": len(passes),
+        "reads_scanned": scanned,
+    }
+    return results, summary
+
+
+def run_convoy_analysis(analysis_id: int):
+    """Background job: run a queued convoy analysis and store its candidates"""
+    db = SessionLocal()
+    try:
+        analysis = db.query(ConvoyAnalysis).filter(ConvoyAnalysis.id == analysis_id).first()
+        if not analysis:
+            logger.warning("Convoy analysis %s not found", analysis_id, extra={"event": "convoy.not_found"})
+            return
+
+        analysis.status = "running"
+        analysis.started_at = datetime.utcnow()
+        db.commit()
+
+        try:
+            results, summary = find_co_travellers(
+                db,
+                target_vrm=analysis.target_vrm,
+                window_seconds=analysis.window_seconds,
+                start_time=analysis.start_time,
+                end_time=analysis.end_time,
+                min_cameras=analysis.min_cameras,
+                max_results=analysis.max_results,
+            )
+        except Exception as e:
+            db.rollback()
+            analysis.status = "failed"
+            analysis.error = str(e)
+            analysis.completed_at = datetime.utcnow()
+            db.commit()
+            logger.error("Convoy analysis %s failed: %s", analysis_id, e, extra={"event": "convoy.failed"})
+            return
+
+        for result in results:
+            db.add(ConvoyCandidate(analysis_id=analysis.id, **result))
+
+        analysis.target_reads = summary["target_reads"]
+        analysis.cameras_analysed = summary["cameras_analysed"]
+        analysis.reads_scanned = summary["reads_scanned"]
+        analysis.status = "completed"
+        analysis.completed_at = datetime.utcnow()
+        db.commit()
+
+        logger.info("Convoy analysis %s: %s candidates for %s", analysis_id, len(results), analysis.target_vrm,
+                    extra={"event": "convoy.completed"})
+    finally:
+        db.close()
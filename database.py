@@ -1,16 +1,211 @@
-from sqlalchemy import create_engine
+from datetime import datetime
+from sqlalchemy import create_engine, event, inspect, text, Column, DateTime, Integer, MetaData, String, Table
+from sqlalchemy.exc import OperationalError, ProgrammingError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from typing import Optional
+import hashlib
 import os
+import time
 
 # Database URL - using SQLite for simplicity, can be changed to PostgreSQL
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./anpr_system.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
-)
+# Engine profile: "production" tunes SQLite for concurrent ingest and dashboard
+# reads, "default" leaves the driver defaults (rollback journal, no pooling)
+DB_PROFILE = os.getenv("DB_PROFILE", "production").lower()
+DB_PROFILES = ("production", "default")
+
+# How long a SQLite writer waits for the lock before "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# SQLite pragmas applied to every new connection by the production profile
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY").upper()
+
+# Connection pool sizing (per worker process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+
+# Schema migrations: how long a starting worker waits for another worker's
+# migration to finish (SQLite), and the PostgreSQL advisory lock key they share
+SCHEMA_LOCK_TIMEOUT_SECONDS = float(os.getenv("SCHEMA_LOCK_TIMEOUT_SECONDS", "300"))
+SCHEMA_LOCK_KEY = 0x616E7072
+
+
+def sqlite_pragmas(profile: str = DB_PROFILE) -> list:
+    """PRAGMA statements run on each new SQLite connection"""
+    if profile == "default":
+        # Still wait for the lock rather than failing straight away
+        return [f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}"]
+    return [
+        # WAL lets readers run alongside a writer, and other worker processes
+        # wait for the write lock instead of failing immediately
+        "PRAGMA journal_mode=WAL",
+        # In WAL mode NORMAL only syncs at checkpoints; a power cut can lose the
+        # last commits but never corrupts the database
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA temp_store={SQLITE_TEMP_STORE}",
+    ]
+
+
+def build_engine(url: str = SQLALCHEMY_DATABASE_URL, profile: str = DB_PROFILE):
+    """Create an engine with connection and pool settings for the backend and profile"""
+    if profile not in DB_PROFILES:
+        raise ValueError(f"Invalid DB_PROFILE '{profile}', expected one of {', '.join(DB_PROFILES)}")
+
+    if not url.startswith("sqlite"):
+        # Server databases: bounded pool, drop dead connections before use and
+        # recycle them before server/proxy idle timeouts close them
+        return create_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=True,
+            pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        )
+
+    engine_args = {"connect_args": {"check_same_thread": False}}
+    in_memory = url in ("sqlite://", "sqlite:///:memory:")
+    if profile == "production" and not in_memory:
+        # File databases otherwise open a new connection (and rerun the pragmas)
+        # for every session; a local file needs no pre-ping or recycling
+        engine_args.update(poolclass=QueuePool, pool_size=DB_POOL_SIZE,
+                           max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    sqlite_engine = create_engine(url, **engine_args)
+
+    pragmas = sqlite_pragmas(profile)
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _configure_sqlite_connection(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return sqlite_engine
+
+
+engine = build_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base() 
\ No newline at end of file
+Base = declarative_base()
+
+def upgrade_schema(metadata, conn=None):
+    """Bring an existing database up to date with the models.
+
+    ``create_all`` only creates missing tables, so columns and indexes added to
+    existing models are applied here. New columns must be nullable. Runs on
+    ``conn`` inside its transaction when given.
+    """
+    if conn is None:
+        with engine.begin() as conn:
+            return upgrade_schema(metadata, conn)
+
+    inspector = inspect(conn)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+# Fingerprint of the models the database was last migrated to. Kept out of the
+# models' metadata so it is not part of the fingerprint itself.
+schema_version_table = Table(
+    "schema_version", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("migrated_at", DateTime),
+)
+
+
+def schema_fingerprint(metadata) -> str:
+    """Hash of the tables, columns and indexes the models declare"""
+    parts = []
+    for table in metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{column.name} {column.type.compile(dialect=engine.dialect)} {column.nullable}"
+                     for column in table.columns)
+        parts.extend(sorted(f"{index.name} {','.join(column.name for column in index.columns)} {index.unique}"
+                            for index in table.indexes))
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def _stored_fingerprint(conn) -> Optional[str]:
+    row = conn.execute(schema_version_table.select().where(schema_version_table.c.id == 1)).first()
+    return row.fingerprint if row is not None else None
+
+
+def _lock_schema(conn):
+    """Take the migration lock for the rest of conn's transaction"""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        return
+    if conn.dialect.name != "sqlite":
+        return
+
+    # The write lock is held until commit; busy_timeout bounds each attempt, so
+    # keep trying while another worker's migration runs
+    deadline = time.monotonic() + SCHEMA_LOCK_TIMEOUT_SECONDS
+    while True:
+        try:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            return
+        except OperationalError as e:
+            if "locked" not in str(e) or time.monotonic() >= deadline:
+                raise
+            time.sleep(0.5)
+
+
+def ensure_schema(metadata) -> bool:
+    """Create and upgrade tables only when the models changed since the last migration.
+
+    An unchanged schema costs one query instead of reflecting every table.
+    Otherwise the migration runs under a lock (SQLite's write lock, or a
+    PostgreSQL advisory lock) so workers starting together migrate once: the
+    others wait, find the new fingerprint and return. Returns whether
+    migrations ran.
+    """
+    fingerprint = schema_fingerprint(metadata)
+    try:
+        with engine.connect() as conn:
+            stored = _stored_fingerprint(conn)
+    except (OperationalError, ProgrammingError):
+        # No schema_version table yet
+        stored = None
+    if stored == fingerprint:
+        return False
+
+    with engine.connect() as conn:
+        with conn.begin():
+            _lock_schema(conn)
+            # Another worker may have migrated while this one waited
+            if inspect(conn).has_table(schema_version_table.name) and _stored_fingerprint(conn) == fingerprint:
+                return False
+
+            metadata.create_all(bind=conn)
+            upgrade_schema(metadata, conn)
+            schema_version_table.create(bind=conn, checkfirst=True)
+            conn.execute(schema_version_table.delete())
+            conn.execute(schema_version_table.insert().values(id=1, fingerprint=fingerprint,
+                                                              migrated_at=datetime.utcnow()))
+    return True
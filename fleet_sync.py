@@ -0,0 +1,480 @@
+"""
+Fleet hotlist sync monitoring.
+
+Every device poll (getHotlistStatus, getHotlistUpdates) and every revision a
+device reports through setHotlistStatus updates per-device state in memory:
+when it last polled and which revision of each hotlist group it has
+acknowledged. Counts of devices by acknowledged revision are kept per group
+alongside, as is the set of devices that are behind, so the fleet summary and
+the lists of devices needing attention are read from these aggregates instead
+of scanning hotlist_revisions per request.
+
+A device is
+- behind when it has acknowledged an older revision than the latest of an
+  active group allocated to it (see hotlist_allocation.py), or none at all,
+- stale when it has been behind for longer than FLEET_STALE_AFTER_SECONDS,
+- silent when it has not polled for FLEET_SILENT_AFTER_SECONDS.
+
+Acknowledged revisions are stored in hotlist_revisions.external_system_revision
+as they arrive; poll times are written to device_sources.last_poll_at in
+batches every FLEET_REFRESH_SECONDS. Each worker loads both when it starts and
+re-reads the rows other workers changed on the same interval (straight away
+after an acknowledgement, through the FLEET_SYNC cache_sync topic), so the
+workers' views converge.
+"""
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import bindparam
+
+from cache_sync import invalidation_channel, FLEET_SYNC
+from database import SessionLocal
+from hotlist_allocation import allocation_cache, AllocationTable
+from hotlist_cache import group_revision_cache, GroupRevision, GroupRevisionSnapshot
+from models import DeviceSource, HotlistRevision
+
+logger = logging.getLogger(__name__)
+
+# A device is silent after this long without polling
+FLEET_SILENT_AFTER_SECONDS = float(os.getenv("FLEET_SILENT_AFTER_SECONDS", "900"))
+
+# A device is stale after being behind an active group for this long
+FLEET_STALE_AFTER_SECONDS = float(os.getenv("FLEET_STALE_AFTER_SECONDS", "86400"))
+
+# Seconds between writing poll times and reading other workers' changes
+FLEET_REFRESH_SECONDS = float(os.getenv("FLEET_REFRESH_SECONDS", "30"))
+
+# Changed rows are re-read with this much overlap, for clock differences between workers
+REFRESH_OVERLAP_SECONDS = 5.0
+
+# Poll times per UPDATE statement
+POLL_FLUSH_CHUNK_SIZE = 500
+
+# Device lists served by summary(); alert is behind or silent
+FLEET_DEVICE_STATUSES = ("alert", "behind", "stale", "silent", "all")
+
+
+def _epoch(value: Optional[datetime]) -> Optional[float]:
+    return value.replace(tzinfo=timezone.utc).timestamp() if value is not None else None
+
+
+def _utc(value: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None) if value is not None else None
+
+
+class DeviceSyncState:
+    """Last poll and acknowledged revisions of one device"""
+    __slots__ = ("source_id", "first_seen", "last_poll", "polls", "acked", "ack_tag")
+
+    def __init__(self, source_id: str, now: float):
+        self.source_id = source_id
+        self.first_seen = now
+        self.last_poll: Optional[float] = None
+        self.polls = 0
+        # Group ID -> (acknowledged revision, when)
+        self.acked: Dict[int, Tuple[int, float]] = {}
+        self.ack_tag = "0"
+
+    def retag(self):
+        key = ";".join(f"{group_id}:{revision}" for group_id, (revision, _) in sorted(self.acked.items()))
+        self.ack_tag = hashlib.sha1(key.encode()).hexdigest()[:12] if key else "0"
+
+    def lag(self, groups: Iterable[GroupRevision]) -> Tuple[int, int]:
+        """(groups behind, revisions behind) against the given (allocated, active) groups"""
+        groups_behind = 0
+        revisions_behind = 0
+        for group in groups:
+            acked = self.acked.get(group.id, (-1, None))[0]
+            if acked < group.revision:
+                groups_behind += 1
+                revisions_behind += group.revision - max(acked, 0)
+        return groups_behind, revisions_behind
+
+    def last_ack(self) -> Optional[float]:
+        return max((at for _, at in self.acked.values()), default=None)
+
+
+class FleetSyncMonitor:
+    """Per-device hotlist sync state and fleet aggregates, updated as devices poll and acknowledge"""
+
+    def __init__(self, silent_after: float = FLEET_SILENT_AFTER_SECONDS, stale_after: float = FLEET_STALE_AFTER_SECONDS,
+                 refresh_seconds: float = FLEET_REFRESH_SECONDS):
+        self.silent_after = silent_after
+        self.stale_after = stale_after
+        self.refresh_seconds = refresh_seconds
+        # In poll order, least recent (and never polled) first, so silent devices are read off the front
+        self._devices: "OrderedDict[str, DeviceSyncState]" = OrderedDict()
+        # Group ID -> acknowledged revision -> devices
+        self._acked_counts: Dict[int, Counter] = {}
+        # Devices behind an active group -> since when
+        self._behind: Dict[str, float] = {}
+        self._revisions: Optional[GroupRevisionSnapshot] = None
+        self._allocations: Optional[AllocationTable] = None
+        self._unflushed_polls: Dict[str, float] = {}
+        self._refreshed_until: Optional[datetime] = None
+        self.loaded = False
+        self.last_refresh: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        invalidation_channel.subscribe(FLEET_SYNC, self._wake.set)
+
+    # Updates from the sync endpoints
+
+    def record_poll(self, source_id: str):
+        """A device asked for its hotlist status or updates"""
+        now = time.time()
+        with self._lock:
+            state = self._state(source_id, now)
+            self._devices.move_to_end(source_id)
+            state.last_poll = now
+            state.polls += 1
+            self._unflushed_polls[source_id] = now
+
+    def record_ack(self, source_id: str, revisions: Dict[int, int]):
+        """A device reported the revision it holds of each group (group ID -> revision, -1 if deleted)"""
+        now = time.time()
+        snapshot = group_revision_cache.snapshot()
+        allocations = allocation_cache.table()
+        with self._lock:
+            self._reconcile(snapshot, allocations, now)
+            state = self._state(source_id, now)
+            for group_id, revision in revisions.items():
+                self._set_ack(state, group_id, revision, now)
+            state.retag()
+            self._update_behind(state, snapshot, now)
+
+    def ack_tag(self, source_id: str) -> str:
+        """Tag that changes whenever the device's acknowledged revisions change"""
+        state = self._devices.get(source_id)
+        return state.ack_tag if state is not None else "0"
+
+    def _state(self, source_id: str, now: float) -> DeviceSyncState:
+        state = self._devices.get(source_id)
+        if state is None:
+            state = self._devices[source_id] = DeviceSyncState(source_id, now)
+            # Never polled yet, so it goes with the least recent
+            self._devices.move_to_end(source_id, last=False)
+            if self._revisions is not None:
+                self._update_behind(state, self._revisions, now)
+        return state
+
+    def _set_ack(self, state: DeviceSyncState, group_id: int, revision: int, at: float):
+        previous = state.acked.get(group_id)
+        counts = self._acked_counts.setdefault(group_id, Counter())
+        if previous is not None:
+            counts[previous[0]] -= 1
+            if counts[previous[0]] <= 0:
+                del counts[previous[0]]
+        counts[revision] += 1
+        state.acked[group_id] = (revision, at)
+
+    def _allocated(self, source_id: str, snapshot: GroupRevisionSnapshot) -> List[GroupRevision]:
+        if self._allocations is None:
+            return snapshot.active
+        return self._allocations.allocated(source_id, snapshot)
+
+    def _update_behind(self, state: DeviceSyncState, snapshot: GroupRevisionSnapshot, now: float,
+                       since: Optional[float] = None):
+        groups_behind, _ = state.lag(self._allocated(state.source_id, snapshot))
+        if groups_behind == 0:
+            self._behind.pop(state.source_id, None)
+        elif since is not None:
+            self._behind[state.source_id] = min(self._behind.get(state.source_id, since), since)
+        elif state.source_id not in self._behind:
+            self._behind[state.source_id] = now
+
+    def _reconcile(self, snapshot: GroupRevisionSnapshot, allocations: AllocationTable, now: float):
+        """Re-check which devices are behind once a group has been revised, added, removed or reallocated"""
+        if (self._revisions is not None and snapshot.active_tag == self._revisions.active_tag
+                and allocations is self._allocations):
+            return
+        self._allocations = allocations
+        for state in self._devices.values():
+            self._update_behind(state, snapshot, now)
+        self._revisions = snapshot
+
+    # Persistence and other workers' changes
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="fleet-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.flush_polls()
+        except Exception:
+            logger.exception("Writing device poll times failed", extra={"event": "fleet_sync.flush_failed"})
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Fleet sync refresh failed", extra={"event": "fleet_sync.refresh_failed"})
+            self._wake.wait(self.refresh_seconds)
+            self._wake.clear()
+
+    def flush_polls(self) -> int:
+        """Write poll times recorded since the last flush to device_sources.last_poll_at"""
+        with self._lock:
+            polls, self._unflushed_polls = self._unflushed_polls, {}
+        if not polls:
+            return 0
+
+        table = DeviceSource.__table__
+        statement = table.update().where(table.c.source_id == bindparam("b_source_id")).values(
+            last_poll_at=bindparam("b_last_poll_at"),
+            # A poll is not an edit of the device
+            updated_at=table.c.updated_at,
+        )
+        rows = [{"b_source_id": source_id, "b_last_poll_at": _utc(at)} for source_id, at in polls.items()]
+        db = SessionLocal()
+        try:
+            for start in range(0, len(rows), POLL_FLUSH_CHUNK_SIZE):
+                db.execute(statement, rows[start:start + POLL_FLUSH_CHUNK_SIZE])
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Keep them for the next flush unless the device has polled again since
+            with self._lock:
+                for source_id, at in polls.items():
+                    self._unflushed_polls.setdefault(source_id, at)
+            raise
+        finally:
+            db.close()
+        return len(rows)
+
+    def refresh(self) -> dict:
+        """Flush poll times, then apply devices, polls and acknowledgements changed since the last refresh"""
+        started = time.perf_counter()
+        flushed = self.flush_polls()
+        since = self._refreshed_until
+        read_until = datetime.utcnow()
+
+        db = SessionLocal()
+        try:
+            devices = db.query(DeviceSource.source_id, DeviceSource.last_poll_at).filter(DeviceSource.is_active == True)
+            acks = db.query(
+                DeviceSource.source_id, HotlistRevision.hotlist_group_id,
+                HotlistRevision.external_system_revision, HotlistRevision.updated_at
+            ).join(DeviceSource, DeviceSource.id == HotlistRevision.device_source_id).filter(
+                DeviceSource.is_active == True,
+                HotlistRevision.external_system_revision.isnot(None)
+            )
+            if since is not None:
+                devices = devices.filter(DeviceSource.last_poll_at > since)
+                acks = acks.filter(HotlistRevision.updated_at > since)
+            device_rows = devices.all()
+            ack_rows = acks.all()
+        finally:
+            db.close()
+
+        snapshot = group_revision_cache.snapshot()
+        self._apply(device_rows, ack_rows, snapshot, allocation_cache.table(), initial=since is None)
+        self._refreshed_until = read_until - timedelta(seconds=REFRESH_OVERLAP_SECONDS)
+
+        self.last_refresh = {
+            "at": read_until.isoformat(),
+            "polls_written": flushed,
+            "devices_read": len(device_rows),
+            "acknowledgements_read": len(ack_rows),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        if since is None:
+            self.loaded = True
+            logger.info("Fleet sync state loaded for %s devices", len(self._devices),
+                        extra={"event": "fleet_sync.loaded", **self.last_refresh})
+        return self.last_refresh
+
+    def _apply(self, device_rows: Iterable, ack_rows: Iterable, snapshot: GroupRevisionSnapshot,
+               allocations: AllocationTable, initial: bool):
+        now = time.time()
+        with self._lock:
+            self._reconcile(snapshot, allocations, now)
+            # Oldest first, keeping the poll order
+            for source_id, last_poll_at in sorted(device_rows, key=lambda row: row[1] or datetime.min):
+                state = self._state(source_id, now)
+                last_poll = _epoch(last_poll_at)
+                if last_poll is not None and (state.last_poll is None or last_poll > state.last_poll):
+                    # Polled at another worker. Slightly out of order at the back, which only
+                    # delays the silent flag by up to a refresh interval.
+                    state.last_poll = last_poll
+                    self._devices.move_to_end(source_id)
+
+            changed = {}
+            for source_id, group_id, revision, updated_at in ack_rows:
+                state = self._state(source_id, now)
+                at = _epoch(updated_at) or now
+                current = state.acked.get(group_id)
+                if current is None or (current[0] != revision and at >= current[1]):
+                    self._set_ack(state, group_id, revision, at)
+                    changed[source_id] = state
+
+            for state in (self._devices.values() if initial else changed.values()):
+                state.retag()
+                # Behind since its last acknowledgement at the latest
+                self._update_behind(state, snapshot, now, since=state.last_ack() or state.first_seen)
+
+    # Reads
+
+    def _flags(self, source_id: str, state: DeviceSyncState, now: float) -> List[str]:
+        flags = []
+        behind_since = self._behind.get(source_id)
+        if behind_since is not None:
+            flags.append("stale" if now - behind_since > self.stale_after else "behind")
+        if state.last_poll is None or now - state.last_poll > self.silent_after:
+            flags.append("silent")
+        return flags
+
+    def _snapshot(self, state: DeviceSyncState, snapshot: GroupRevisionSnapshot, now: float,
+                  hotlists: bool = False) -> dict:
+        allocated = self._allocated(state.source_id, snapshot)
+        groups_behind, revisions_behind = state.lag(allocated)
+        behind_since = self._behind.get(state.source_id)
+        flags = self._flags(state.source_id, state, now)
+        device = {
+            "source_id": state.source_id,
+            "status": "alert" if flags else "ok",
+            "flags": flags,
+            "last_poll": _utc(state.last_poll),
+            "seconds_since_poll": round(now - state.last_poll, 1) if state.last_poll is not None else None,
+            "polls": state.polls,
+            "groups_behind": groups_behind,
+            "revisions_behind": revisions_behind,
+            "behind_since": _utc(behind_since),
+            "behind_seconds": round(now - behind_since, 1) if behind_since is not None else None,
+            "last_acknowledged": _utc(state.last_ack()),
+        }
+        if hotlists:
+            device["hotlists"] = [
+                {
+                    "hotlist_name": group.name,
+                    "latest_revision": group.revision,
+                    "acknowledged_revision": state.acked.get(group.id, (-1, None))[0],
+                    "acknowledged_at": _utc(state.acked.get(group.id, (None, None))[1]),
+                    "revisions_behind": max(group.revision - max(state.acked.get(group.id, (-1, None))[0], 0), 0),
+                }
+                for group in allocated
+            ]
+        return device
+
+    def _silent(self, now: float) -> List[str]:
+        cutoff = now - self.silent_after
+        silent = []
+        for source_id, state in self._devices.items():
+            if state.last_poll is not None and state.last_poll >= cutoff:
+                break
+            silent.append(source_id)
+        return silent
+
+    def summary(self, status: str = "alert", limit: int = 100) -> dict:
+        """
+        Fleet counts, per-group counts and the devices with the given status
+        (alert: behind or silent; behind, stale, silent, or all), longest out of sync first
+        """
+        now = time.time()
+        snapshot = group_revision_cache.snapshot()
+        allocations = allocation_cache.table()
+        with self._lock:
+            self._reconcile(snapshot, allocations, now)
+            total = len(self._devices)
+            behind = len(self._behind)
+            silent = self._silent(now)
+            stale_cutoff = now - self.stale_after
+            stale = [source_id for source_id, since in self._behind.items() if since < stale_cutoff]
+            last_poll = next(reversed(self._devices.values())).last_poll if self._devices else None
+
+            groups = []
+            for group in snapshot.active:
+                allocated_to = allocations.devices(group.id)
+                if allocated_to is None:
+                    allocated = total
+                    counts = self._acked_counts.get(group.id, Counter())
+                    current = sum(devices for revision, devices in counts.items() if revision >= group.revision)
+                else:
+                    # Only the devices the group is allocated to count
+                    states = [self._devices[source_id] for source_id in allocated_to if source_id in self._devices]
+                    allocated = len(states)
+                    current = sum(1 for state in states if state.acked.get(group.id, (-1, None))[0] >= group.revision)
+                groups.append({
+                    "hotlist_name": group.name,
+                    "latest_revision": group.revision,
+                    "devices_allocated": allocated,
+                    "devices_current": current,
+                    "devices_behind": allocated - current,
+                })
+
+            if status == "all":
+                selected = list(self._devices)
+            elif status == "silent":
+                selected = silent
+            elif status == "stale":
+                selected = stale
+            elif status == "behind":
+                selected = list(self._behind)
+            else:
+                selected = list(dict.fromkeys(list(self._behind) + silent))
+            devices = [self._snapshot(self._devices[source_id], snapshot, now) for source_id in selected]
+
+        devices.sort(key=lambda d: -max(d["behind_seconds"] or 0, d["seconds_since_poll"] or float("inf")))
+        return {
+            "total_devices": total,
+            "connected_devices": total - len(silent),
+            "behind_devices": behind,
+            "stale_devices": len(stale),
+            "silent_devices": len(silent),
+            "last_poll": _utc(last_poll),
+            "silent_after_seconds": self.silent_after,
+            "stale_after_seconds": self.stale_after,
+            "loaded": self.loaded,
+            "hotlists": groups,
+            "devices": devices[:limit],
+        }
+
+    def get_device(self, source_id: str) -> Optional[dict]:
+        now = time.time()
+        snapshot = group_revision_cache.snapshot()
+        allocations = allocation_cache.table()
+        with self._lock:
+            self._reconcile(snapshot, allocations, now)
+            state = self._devices.get(source_id)
+            return self._snapshot(state, snapshot, now, hotlists=True) if state is not None else None
+
+    def last_poll(self) -> Optional[datetime]:
+        """When the most recent poll of any device was seen"""
+        with self._lock:
+            return _utc(next(reversed(self._devices.values())).last_poll) if self._devices else None
+
+    def counts(self) -> dict:
+        """Device counts for the metrics gauges and /anpr/connectivity"""
+        now = time.time()
+        snapshot = group_revision_cache.snapshot()
+        allocations = allocation_cache.table()
+        with self._lock:
+            self._reconcile(snapshot, allocations, now)
+            stale_cutoff = now - self.stale_after
+            return {
+                "total": len(self._devices),
+                "behind": len(self._behind),
+                "stale": sum(1 for since in self._behind.values() if since < stale_cutoff),
+                "silent": len(self._silent(now)),
+            }
+
+
+fleet_monitor = FleetSyncMonitor()
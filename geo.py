@@ -0,0 +1,127 @@
+"""
+Capture geolocation: geohash cells for "reads near here" queries.
+
+Each read with a GPS fix stores its latitude, longitude and the geohash of the
+point at GEO_CELL_PRECISION characters (geo_cell). With the (geo_cell,
+timestamp) index, a bounding box or radius query becomes a handful of index
+range scans over the cells covering the area, bounded by the time window,
+instead of a scan of every read. Exact coordinates are checked afterwards.
+
+A 6 character cell is roughly 1.2 km x 0.6 km. The precision is fixed, as
+changing it would need every stored cell recomputed.
+"""
+from typing import List, Optional, Tuple
+import math
+
+from sqlalchemy import and_, or_
+
+GEO_CELL_PRECISION = 6
+
+# Above this many cells a query covers prefixes of a coarser precision instead
+GEO_MAX_CELLS = 64
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE_LAT = 111320.0
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode_geohash(latitude: float, longitude: float, precision: int = GEO_CELL_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        if value >= middle:
+            bits = bits << 1 | 1
+            bounds[0] = middle
+        else:
+            bits <<= 1
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(latitude, longitude) extent of a geohash cell in degrees"""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def valid_coordinates(latitude: Optional[float], longitude: Optional[float]) -> bool:
+    """A usable GPS fix: both present, in range, and not 0,0 (what cameras without a fix send)"""
+    if latitude is None or longitude is None:
+        return False
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        return False
+    return not (latitude == 0.0 and longitude == 0.0)
+
+
+def geo_fields(latitude: Optional[float], longitude: Optional[float]) -> dict:
+    """latitude, longitude and geo_cell columns for an ANPRRead (all None without a usable fix)"""
+    if not valid_coordinates(latitude, longitude):
+        return {"latitude": None, "longitude": None, "geo_cell": None}
+    return {"latitude": latitude, "longitude": longitude, "geo_cell": encode_geohash(latitude, longitude)}
+
+
+def _cells(min_lat: float, min_lon: float, max_lat: float, max_lon: float, precision: int) -> List[str]:
+    lat_step, lon_step = cell_size(precision)
+    cells = set()
+    # Walk cell by cell from the cell containing the south-west corner
+    lat = math.floor((min_lat + 90.0) / lat_step) * lat_step - 90.0
+    while lat <= max_lat:
+        lon = math.floor((min_lon + 180.0) / lon_step) * lon_step - 180.0
+        while lon <= max_lon:
+            center_lat = min(lat + lat_step / 2, 90.0)
+            center_lon = min(lon + lon_step / 2, 180.0)
+            cells.add(encode_geohash(center_lat, center_lon, precision))
+            lon += lon_step
+        lat += lat_step
+    return sorted(cells)
+
+
+def covering_cells(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> Tuple[List[str], bool]:
+    """
+    Geohash cells covering a bounding box, and whether they are full-precision
+    cells (match geo_cell exactly) or shorter prefixes (match by prefix range).
+    The finest precision needing no more than GEO_MAX_CELLS cells is used.
+    """
+    for precision in range(GEO_CELL_PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        estimate = (math.ceil((max_lat - min_lat) / lat_step) + 1) * (math.ceil((max_lon - min_lon) / lon_step) + 1)
+        if estimate <= GEO_MAX_CELLS or precision == 1:
+            return _cells(min_lat, min_lon, max_lat, max_lon, precision), precision == GEO_CELL_PRECISION
+    return [], False
+
+
+def cell_filter(column, cells: List[str], exact: bool):
+    """SQL condition matching geo_cell against covering_cells() output"""
+    if exact:
+        return column.in_(cells)
+    # "{" sorts after every geohash character, so this is the prefix's index range
+    return or_(*(and_(column >= prefix, column < prefix + "{") for prefix in cells))
+
+
+def radius_bbox(latitude: float, longitude: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) enclosing a circle"""
+    lat_delta = radius_m / METERS_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(latitude))
+    lon_delta = 180.0 if cos_lat < 1e-6 else min(radius_m / (METERS_PER_DEGREE_LAT * cos_lat), 180.0)
+    return (max(latitude - lat_delta, -90.0), max(longitude - lon_delta, -180.0),
+            min(latitude + lat_delta, 90.0), min(longitude + lon_delta, 180.0))
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle (haversine) distance in metres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
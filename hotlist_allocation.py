@@ -0,0 +1,229 @@
+"""
+Per-device hotlist allocation.
+
+A hotlist group without allocation rules goes to every device. A group with
+rules goes only to the devices one of them matches, by
+- device: the device's BOF source ID,
+- device_group: the device's device_group,
+- force_area: the device's force_area.
+A rule can also narrow a large shared group to a per-device subset: with
+force_area_subset the device gets only the entries for its own force area,
+plus those with no force area.
+
+Rules are evaluated against every device once per change to the rules or to a
+device's attributes, into a source ID -> allocated groups table held in memory
+(getHotlistStatus and getHotlistUpdates read it per poll) and written to
+hotlist_revisions.is_allocated. Other workers re-evaluate through the
+ALLOCATIONS cache_sync topic.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+import logging
+import threading
+import time
+
+from sqlalchemy import bindparam
+
+from cache_sync import invalidation_channel, ALLOCATIONS
+from database import SessionLocal
+from hotlist_cache import GroupRevision, GroupRevisionSnapshot
+from metrics import CACHE_REQUESTS
+from models import DeviceSource, HotlistAllocationRule, HotlistRevision
+
+logger = logging.getLogger(__name__)
+
+ALLOCATION_MATCH_TYPES = ("device", "device_group", "force_area")
+
+# hotlist_revisions rows per UPDATE statement when rewriting is_allocated
+ALLOCATED_FLAG_CHUNK_SIZE = 500
+
+_allocation_hits = CACHE_REQUESTS.labels("hotlist_allocations", "hit")
+_allocation_misses = CACHE_REQUESTS.labels("hotlist_allocations", "miss")
+
+
+class AllocationTable:
+    """Groups allocated to each device, as evaluated from the rules at one point in time"""
+
+    def __init__(self, ruled_groups: Set[int], by_source: Dict[str, Dict[int, Optional[str]]], rule_count: int = 0):
+        # Groups with at least one rule; every other group goes to every device
+        self.ruled_groups = ruled_groups
+        # Source ID -> ruled group ID -> force area subset (None for the whole group)
+        self.by_source = by_source
+        self.by_group: Dict[int, Set[str]] = defaultdict(set)
+        for source_id, groups in by_source.items():
+            for group_id in groups:
+                self.by_group[group_id].add(source_id)
+        self.rule_count = rule_count
+
+    def is_allocated(self, source_id: str, group_id: int) -> bool:
+        return group_id not in self.ruled_groups or group_id in self.by_source.get(source_id, ())
+
+    def subset(self, source_id: str, group_id: int) -> Optional[str]:
+        """Force area the device's copy of the group is narrowed to ("" for entries without one), or None"""
+        return self.by_source.get(source_id, {}).get(group_id)
+
+    def allocated(self, source_id: str, snapshot: GroupRevisionSnapshot) -> List[GroupRevision]:
+        """Active groups allocated to the device, by ID"""
+        if not self.ruled_groups:
+            return snapshot.active
+        groups = self.by_source.get(source_id, {})
+        return [group for group in snapshot.active if group.id not in self.ruled_groups or group.id in groups]
+
+    def devices(self, group_id: int) -> Optional[Set[str]]:
+        """Source IDs the group is allocated to, or None if it goes to every device"""
+        if group_id not in self.ruled_groups:
+            return None
+        return self.by_group.get(group_id, set())
+
+
+def evaluate(rules: Iterable, devices: Iterable) -> AllocationTable:
+    """
+    Allocation of (hotlist_group_id, match_type, match_value, force_area_subset) rules
+    to (source_id, device_group, force_area) devices
+    """
+    rules_by_key = defaultdict(list)
+    ruled_groups = set()
+    rule_count = 0
+    for group_id, match_type, match_value, force_area_subset in rules:
+        rules_by_key[(match_type, match_value)].append((group_id, bool(force_area_subset)))
+        ruled_groups.add(group_id)
+        rule_count += 1
+
+    by_source: Dict[str, Dict[int, Optional[str]]] = {}
+    known_sources = set()
+
+    def allocate(source_id: str, device_group: Optional[str], force_area: Optional[str]):
+        groups = {}
+        for key in (("device", source_id), ("device_group", device_group), ("force_area", force_area)):
+            if key[1] is None:
+                continue
+            for group_id, force_area_subset in rules_by_key.get(key, ()):
+                subset = (force_area or "") if force_area_subset else None
+                # A rule allocating the whole group wins over a subset
+                if group_id in groups and (groups[group_id] is None or subset is not None):
+                    continue
+                groups[group_id] = subset
+        if groups:
+            by_source[source_id] = groups
+
+    for source_id, device_group, force_area in devices:
+        known_sources.add(source_id)
+        allocate(source_id, device_group, force_area)
+
+    # Devices named in a rule before they have first polled
+    for match_type, match_value in list(rules_by_key):
+        if match_type == "device" and match_value not in known_sources:
+            allocate(match_value, None, None)
+
+    return AllocationTable(ruled_groups, by_source, rule_count)
+
+
+def load_table() -> AllocationTable:
+    """Evaluate the stored rules against the stored devices"""
+    db = SessionLocal()
+    try:
+        rules = db.query(
+            HotlistAllocationRule.hotlist_group_id, HotlistAllocationRule.match_type,
+            HotlistAllocationRule.match_value, HotlistAllocationRule.force_area_subset
+        ).all()
+        if not rules:
+            return AllocationTable(set(), {})
+        devices = db.query(DeviceSource.source_id, DeviceSource.device_group, DeviceSource.force_area).filter(
+            DeviceSource.is_active == True
+        ).all()
+    finally:
+        db.close()
+    return evaluate(rules, devices)
+
+
+def write_allocated_flags(table: AllocationTable) -> int:
+    """Bring hotlist_revisions.is_allocated in line with the table, returning the rows changed"""
+    revisions = HotlistRevision.__table__
+    statement = revisions.update().where(revisions.c.id == bindparam("b_id")).values(
+        is_allocated=bindparam("b_is_allocated"),
+        # Not an acknowledgement, so not something for the fleet refresh to re-read
+        updated_at=revisions.c.updated_at,
+    )
+
+    db = SessionLocal()
+    try:
+        # Only rows of ruled groups, or left unallocated by an earlier rule, can be wrong
+        query = db.query(
+            HotlistRevision.id, HotlistRevision.hotlist_group_id, HotlistRevision.is_allocated, DeviceSource.source_id
+        ).join(DeviceSource, DeviceSource.id == HotlistRevision.device_source_id)
+        if table.ruled_groups:
+            query = query.filter(
+                (HotlistRevision.hotlist_group_id.in_(table.ruled_groups)) | (HotlistRevision.is_allocated == False)
+            )
+        else:
+            query = query.filter(HotlistRevision.is_allocated == False)
+
+        rows = []
+        for revision_id, group_id, is_allocated, source_id in query.all():
+            allocated = table.is_allocated(source_id, group_id)
+            if bool(is_allocated) != allocated:
+                rows.append({"b_id": revision_id, "b_is_allocated": allocated})
+        for start in range(0, len(rows), ALLOCATED_FLAG_CHUNK_SIZE):
+            db.execute(statement, rows[start:start + ALLOCATED_FLAG_CHUNK_SIZE])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return len(rows)
+
+
+def apply_allocations() -> dict:
+    """Re-evaluate after a rule or device change: rewrite is_allocated and tell every worker"""
+    started = time.perf_counter()
+    table = load_table()
+    changed = write_allocated_flags(table)
+    invalidation_channel.publish(ALLOCATIONS)
+    result = {
+        "rules": table.rule_count,
+        "ruled_groups": len(table.ruled_groups),
+        "devices_allocated": len(table.by_source),
+        "revisions_changed": changed,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    logger.info("Hotlist allocations applied", extra={"event": "hotlist_allocation.applied", **result})
+    return result
+
+
+class AllocationCache:
+    """The evaluated allocation table, re-evaluated when the rules or devices change in any worker"""
+
+    def __init__(self):
+        self._table: Optional[AllocationTable] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        invalidation_channel.subscribe(ALLOCATIONS, self.invalidate)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._table = None
+
+    def load(self) -> AllocationTable:
+        with self._lock:
+            generation = self._generation
+
+        table = load_table()
+
+        with self._lock:
+            if generation == self._generation:
+                self._table = table
+        return table
+
+    def table(self) -> AllocationTable:
+        invalidation_channel.poll()
+        table = self._table
+        if table is None:
+            _allocation_misses.inc()
+            return self.load()
+        _allocation_hits.inc()
+        return table
+
+
+allocation_cache = AllocationCache()
@@ -0,0 +1,219 @@
+"""
+In-memory caches for the ingest and sync hot paths.
+
+HotlistIndex replaces the per-read hotlist query with a dict lookup,
+DeviceSourceCache avoids a query per device poll and GroupRevisionCache answers
+conditional sync requests from memory. All are invalidated through cache_sync so
+every worker process stays coherent after an edit.
+"""
+from collections import namedtuple
+from typing import Dict, List, Optional
+import hashlib
+import logging
+import threading
+import time
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from cache_sync import invalidation_channel, HOTLISTS, DEVICE_SOURCES
+from database import SessionLocal
+from metrics import CACHE_REQUESTS
+from models import Hotlist, HotlistGroup, DeviceSource
+
+logger = logging.getLogger(__name__)
+
+_index_hits = CACHE_REQUESTS.labels("hotlist_index", "hit")
+_index_misses = CACHE_REQUESTS.labels("hotlist_index", "miss")
+_device_hits = CACHE_REQUESTS.labels("device_source", "hit")
+_device_misses = CACHE_REQUESTS.labels("device_source", "miss")
+_revision_hits = CACHE_REQUESTS.labels("group_revisions", "hit")
+_revision_misses = CACHE_REQUESTS.labels("group_revisions", "miss")
+
+GroupRevision = namedtuple("GroupRevision", ["id", "name", "revision", "is_active"])
+
+
+class HotlistIndex:
+    """VRM -> hotlist entry ID for active entries in active groups"""
+
+    def __init__(self):
+        self._plates: Optional[Dict[str, int]] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        invalidation_channel.subscribe(HOTLISTS, self.invalidate)
+
+    def __len__(self):
+        return len(self._plates or ())
+
+    @property
+    def loaded(self) -> bool:
+        return self._plates is not None
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._plates = None
+
+    def load(self) -> Dict[str, int]:
+        """Rebuild the index from the database"""
+        with self._lock:
+            generation = self._generation
+
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            rows = db.query(Hotlist.license_plate, Hotlist.id).outerjoin(HotlistGroup).filter(
+                Hotlist.is_active == True,
+                or_(HotlistGroup.is_active == True, Hotlist.hotlist_group_id == None)
+            ).order_by(Hotlist.id.desc()).all()
+        finally:
+            db.close()
+
+        # Descending IDs, so the oldest entry for a plate wins (as the old .first() query did)
+        plates = {license_plate: hotlist_id for license_plate, hotlist_id in rows}
+
+        with self._lock:
+            # Keep it only if nothing was invalidated while loading
+            if generation == self._generation:
+                self._plates = plates
+        logger.info("Hotlist index loaded: %s plates in %.1fms", len(plates), (time.perf_counter() - started) * 1000,
+                    extra={"event": "hotlist_cache.loaded"})
+        return plates
+
+    def match(self, vrm: str) -> Optional[int]:
+        """Hotlist entry ID for a VRM, or None"""
+        invalidation_channel.poll()
+        plates = self._plates
+        if plates is None:
+            _index_misses.inc()
+            plates = self.load()
+        else:
+            _index_hits.inc()
+        return plates.get(vrm)
+
+
+class DeviceSourceCache:
+    """BOF source ID -> device_sources.id, creating devices on first sight"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        invalidation_channel.subscribe(DEVICE_SOURCES, self.invalidate)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = {}
+
+    def load(self):
+        """Preload every known device"""
+        db = SessionLocal()
+        try:
+            ids = dict(db.query(DeviceSource.source_id, DeviceSource.id).all())
+        finally:
+            db.close()
+        with self._lock:
+            self._ids = ids
+
+    def get_id(self, db: Session, source_id: str) -> int:
+        invalidation_channel.poll()
+        device_id = self._ids.get(source_id)
+        if device_id is not None:
+            _device_hits.inc()
+            return device_id
+        _device_misses.inc()
+
+        device_id = db.query(DeviceSource.id).filter(DeviceSource.source_id == source_id).scalar()
+        if device_id is None:
+            device = DeviceSource(
+                source_id=source_id,
+                description=f"Auto-created device for source {source_id}"
+            )
+            db.add(device)
+            try:
+                db.commit()
+                device_id = device.id
+            except IntegrityError:
+                # Created concurrently by another worker
+                db.rollback()
+                device_id = db.query(DeviceSource.id).filter(DeviceSource.source_id == source_id).scalar()
+
+        with self._lock:
+            self._ids[source_id] = device_id
+        return device_id
+
+
+def revisions_tag(groups) -> str:
+    """Tag that changes whenever one of the groups is added, removed, renamed or revised"""
+    key = ";".join(f"{group.id}:{group.name}:{group.revision}" for group in groups)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+class GroupRevisionSnapshot:
+    """Every hotlist group's revision at one point in time"""
+
+    def __init__(self, groups: List[GroupRevision]):
+        self.by_id = {group.id: group for group in groups}
+        self.by_name = {group.name: group for group in groups}
+        self.active = [group for group in groups if group.is_active]
+        self.active_tag = revisions_tag(self.active)
+
+
+class GroupRevisionCache:
+    """Hotlist group revisions, so unchanged sync requests can be answered without a query"""
+
+    def __init__(self):
+        self._snapshot: Optional[GroupRevisionSnapshot] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        invalidation_channel.subscribe(HOTLISTS, self.invalidate)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def load(self) -> GroupRevisionSnapshot:
+        with self._lock:
+            generation = self._generation
+
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                HotlistGroup.id, HotlistGroup.name, HotlistGroup.revision, HotlistGroup.is_active
+            ).order_by(HotlistGroup.id).all()
+        finally:
+            db.close()
+        snapshot = GroupRevisionSnapshot([GroupRevision(*row) for row in rows])
+
+        with self._lock:
+            if generation == self._generation:
+                self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self) -> GroupRevisionSnapshot:
+        invalidation_channel.poll()
+        snapshot = self._snapshot
+        if snapshot is None:
+            _revision_misses.inc()
+            return self.load()
+        _revision_hits.inc()
+        return snapshot
+
+
+def warm_caches():
+    """Load hot state before taking traffic"""
+    started = time.perf_counter()
+    invalidation_channel.poll(force=True)
+    hotlist_index.load()
+    device_source_cache.load()
+    group_revision_cache.load()
+    logger.info("Caches warmed in %.1fms", (time.perf_counter() - started) * 1000, extra={"event": "cache.warmed"})
+
+
+hotlist_index = HotlistIndex()
+device_source_cache = DeviceSourceCache()
+group_revision_cache = GroupRevisionCache()
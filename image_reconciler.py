@@ -0,0 +1,319 @@
+"""
+Upload store reconciliation.
+
+Capture images are written to static/uploads before the read that points at
+them is committed, so a failed commit (or a deleted read) leaves files no row
+references, and a lost file leaves a row pointing at nothing. The reconciler
+finds both in two phases:
+
+- the upload directory is listed once per pass and sorted by name; names are
+  taken RECONCILE_CHUNK_FILES at a time and their exact paths looked up in
+  plate_image_path and context_image_path (two indexed IN queries per chunk,
+  no query per file), and a file with no row is an orphan,
+- then the reads with an upload path are walked by ID, RECONCILE_CHUNK_FILES
+  at a time, and a path whose file is not in the listing is missing.
+
+Paths are only ever compared for equality or by prefix, so the result does not
+depend on the database collation.
+
+Orphans older than RECONCILE_MIN_AGE_SECONDS (so images of captures still
+being stored are left alone) are moved to RECONCILE_QUARANTINE_DIR, deleted,
+or only reported, per RECONCILE_ORPHAN_ACTION. Missing images are reported in
+the run summary. Files are processed at RECONCILE_FILES_PER_SECOND at most so
+a pass can run alongside live ingest.
+
+The position (last file name, then last read ID checked) is kept in
+job_cursors after each chunk, so a pass interrupted by a restart resumes where
+it stopped, and its lease lets only one worker run a pass at a time (see
+job_cursor.py).
+"""
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+import logging
+import os
+import shutil
+import threading
+import time
+
+from sqlalchemy import or_
+
+from database import SessionLocal
+from job_cursor import JobLease
+from metrics import UPLOAD_IMAGES_RECONCILED
+from models import ANPRRead, PendingCaptureImage
+
+logger = logging.getLogger(__name__)
+
+# Where main.py writes capture images, and the file name prefixes it uses
+UPLOAD_DIR = Path("static/uploads")
+IMAGE_PREFIXES = ("plate_", "context_")
+
+# Seconds between scheduled passes (0 disables the schedule; passes can still be started from the admin API)
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("RECONCILE_INTERVAL_SECONDS", "86400"))
+
+# Files compared per chunk, and files per second at most
+RECONCILE_CHUNK_FILES = int(os.getenv("RECONCILE_CHUNK_FILES", "500"))
+RECONCILE_FILES_PER_SECOND = float(os.getenv("RECONCILE_FILES_PER_SECOND", "500"))
+
+# quarantine (move to RECONCILE_QUARANTINE_DIR), delete, or report
+RECONCILE_ORPHAN_ACTION = os.getenv("RECONCILE_ORPHAN_ACTION", "quarantine")
+RECONCILE_QUARANTINE_DIR = Path(os.getenv("RECONCILE_QUARANTINE_DIR", "quarantine/uploads"))
+
+# Unreferenced files younger than this may belong to a capture being stored
+RECONCILE_MIN_AGE_SECONDS = float(os.getenv("RECONCILE_MIN_AGE_SECONDS", "3600"))
+
+# Orphans and missing images listed in a run summary; the counts cover all of them
+RECONCILE_MAX_REPORTED = 1000
+
+JOB_NAME = "image_reconcile"
+# Position prefix once every file has been checked and the reads are being walked by ID
+READS_POSITION = "reads:"
+ORPHAN_ACTIONS = ("quarantine", "delete", "report")
+
+
+class ImageReconciler:
+    """Resumable, rate-limited comparison of the upload directory with the reads' image paths"""
+
+    def __init__(self, upload_dir: Path = UPLOAD_DIR, interval_seconds: float = RECONCILE_INTERVAL_SECONDS,
+                 chunk_files: int = RECONCILE_CHUNK_FILES, files_per_second: float = RECONCILE_FILES_PER_SECOND,
+                 orphan_action: str = RECONCILE_ORPHAN_ACTION, quarantine_dir: Path = RECONCILE_QUARANTINE_DIR,
+                 min_age_seconds: float = RECONCILE_MIN_AGE_SECONDS):
+        if orphan_action not in ORPHAN_ACTIONS:
+            raise ValueError(f"RECONCILE_ORPHAN_ACTION must be one of {', '.join(ORPHAN_ACTIONS)}")
+        self.upload_dir = upload_dir
+        self.interval_seconds = interval_seconds
+        self.chunk_files = max(chunk_files, 1)
+        self.files_per_second = files_per_second
+        self.orphan_action = orphan_action
+        self.quarantine_dir = quarantine_dir
+        self.min_age_seconds = min_age_seconds
+        self.lease = JobLease(JOB_NAME)
+        # Stored paths are str(upload_dir / name)
+        self._path_prefix = str(upload_dir) + os.sep
+        self.current: Optional[dict] = None
+        self.last_run: Optional[dict] = None
+        self.next_run_at: Optional[datetime] = None
+        self._run_lock = threading.Lock()
+        self._trigger = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="image-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._trigger.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def trigger(self) -> bool:
+        """Start a pass in the background now; False if one is already running here"""
+        if self.current is not None:
+            return False
+        self.start()
+        self._trigger.set()
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            # Passes are long, so the first scheduled one waits a full interval after startup
+            delay = self.interval_seconds if self.interval_seconds > 0 else None
+            self.next_run_at = datetime.utcnow() + timedelta(seconds=delay) if delay else None
+            self._trigger.wait(delay)
+            self._trigger.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.run_pass()
+            except Exception:
+                logger.exception("Upload reconciliation failed", extra={"event": "reconcile.failed"})
+
+    # Passes
+
+    def run_pass(self) -> Optional[dict]:
+        """Reconcile from the stored position to the end of the directory; None if another worker is running"""
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            position = self.lease.acquire()
+            if position is None:
+                logger.info("Upload reconciliation is running in another worker", extra={"event": "reconcile.skipped"})
+                return None
+            return self._run(position)
+        finally:
+            self.current = None
+            self._run_lock.release()
+
+    def _list(self) -> List[str]:
+        with os.scandir(self.upload_dir) as entries:
+            return sorted(entry.name for entry in entries
+                          if entry.name.startswith(IMAGE_PREFIXES) and entry.is_file(follow_symlinks=False))
+
+    def _run(self, position: str) -> dict:
+        started = time.perf_counter()
+        names = self._list()
+        listed = set(names)
+        if position.startswith(READS_POSITION):
+            # Interrupted while checking the reads: every file has been checked
+            offset, after_id = len(names), int(position[len(READS_POSITION):])
+        else:
+            offset, after_id = (bisect_right(names, position) if position else 0), 0
+        summary = self.current = {
+            "started_at": datetime.utcnow().isoformat(),
+            "resumed_from": position or None,
+            "files_total": len(names),
+            "files_checked": 0,
+            "references_checked": 0,
+            "orphans": 0,
+            "orphans_too_recent": 0,
+            "orphan_action": self.orphan_action,
+            "missing": 0,
+            "orphan_files": [],
+            "missing_images": [],
+            "completed": False,
+        }
+        logger.info("Upload reconciliation started at %s of %s files", offset, len(names),
+                    extra={"event": "reconcile.started", "resumed_from": position or None})
+
+        while True:
+            if self._stop.is_set():
+                # Shutting down: the next start resumes from here
+                self.lease.save(position, release=True)
+                break
+            chunk_started = time.monotonic()
+            if offset < len(names):
+                chunk = names[offset:offset + self.chunk_files]
+                self._check_files(chunk, summary)
+                offset += len(chunk)
+                position, checked = chunk[-1], len(chunk)
+            else:
+                after_id, checked = self._check_references(after_id, listed, summary)
+                if not checked:
+                    self.lease.save("", release=True)
+                    summary["completed"] = True
+                    break
+                position = f"{READS_POSITION}{after_id}"
+            if not self.lease.save(position):
+                logger.warning("Upload reconciliation lease lost, stopping", extra={"event": "reconcile.lease_lost"})
+                break
+            if self.files_per_second > 0:
+                self._stop.wait(max(checked / self.files_per_second - (time.monotonic() - chunk_started), 0))
+
+        summary["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        self.last_run = summary
+        logger.info(
+            "Upload reconciliation %s: %s files, %s orphans, %s missing", "completed" if summary["completed"] else "stopped",
+            summary["files_checked"], summary["orphans"], summary["missing"],
+            extra={"event": "reconcile.finished", **{key: value for key, value in summary.items()
+                                                     if not isinstance(value, list)}}
+        )
+        return summary
+
+    def _referenced(self, chunk: List[str]) -> Set[str]:
+        """Names in the chunk that a read's plate_image_path or context_image_path, or a held image, points at"""
+        paths = [self._path_prefix + name for name in chunk]
+        referenced: Set[str] = set()
+        db = SessionLocal()
+        try:
+            for column in (ANPRRead.plate_image_path, ANPRRead.context_image_path, PendingCaptureImage.image_path):
+                for (path,) in db.query(column).filter(column.in_(paths)):
+                    referenced.add(path[len(self._path_prefix):])
+        finally:
+            db.close()
+        return referenced
+
+    def _check_files(self, chunk: List[str], summary: dict):
+        """Handle the files in the chunk that no read points at"""
+        referenced = self._referenced(chunk)
+        summary["files_checked"] += len(chunk)
+
+        now = time.time()
+        for name in chunk:
+            if name in referenced:
+                continue
+            path = self.upload_dir / name
+            try:
+                if now - path.stat().st_mtime < self.min_age_seconds:
+                    summary["orphans_too_recent"] += 1
+                    continue
+            except FileNotFoundError:
+                continue
+            if self._handle_orphan(path):
+                summary["orphans"] += 1
+                if len(summary["orphan_files"]) < RECONCILE_MAX_REPORTED:
+                    summary["orphan_files"].append(name)
+
+    def _check_references(self, after_id: int, listed: Set[str], summary: dict) -> Tuple[int, int]:
+        """
+        Report image paths of the next reads by ID whose file is missing,
+        returning the last read ID and the number of reads checked
+        """
+        db = SessionLocal()
+        try:
+            rows = db.query(ANPRRead.id, ANPRRead.plate_image_path, ANPRRead.context_image_path).filter(
+                ANPRRead.id > after_id,
+                or_(ANPRRead.plate_image_path.startswith(self._path_prefix, autoescape=True),
+                    ANPRRead.context_image_path.startswith(self._path_prefix, autoescape=True))
+            ).order_by(ANPRRead.id).limit(self.chunk_files).all()
+        finally:
+            db.close()
+
+        for read_id, plate_image_path, context_image_path in rows:
+            for column_name, path in (("plate_image_path", plate_image_path),
+                                      ("context_image_path", context_image_path)):
+                if not path or not path.startswith(self._path_prefix):
+                    continue
+                summary["references_checked"] += 1
+                name = path[len(self._path_prefix):]
+                # Not in the listing; it may have been written since, so check before reporting
+                if name in listed or (self.upload_dir / name).exists():
+                    continue
+                summary["missing"] += 1
+                UPLOAD_IMAGES_RECONCILED.labels("missing").inc()
+                if len(summary["missing_images"]) < RECONCILE_MAX_REPORTED:
+                    summary["missing_images"].append({"read_id": read_id, "column": column_name, "path": path})
+        return (rows[-1][0] if rows else after_id), len(rows)
+
+    def _handle_orphan(self, path: Path) -> bool:
+        try:
+            if self.orphan_action == "delete":
+                path.unlink()
+            elif self.orphan_action == "quarantine":
+                self.quarantine_dir.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(path), str(self.quarantine_dir / path.name))
+        except FileNotFoundError:
+            # Removed meanwhile (another pass, or an operator)
+            return False
+        except OSError as e:
+            logger.warning("Could not %s orphan image %s: %s", self.orphan_action, path, e,
+                           extra={"event": "reconcile.orphan_failed"})
+            return False
+        UPLOAD_IMAGES_RECONCILED.labels(
+            {"delete": "orphan_deleted", "quarantine": "orphan_quarantined"}.get(self.orphan_action, "orphan_reported")
+        ).inc()
+        return True
+
+    def status(self) -> dict:
+        current = self.current
+        return {
+            "interval_seconds": self.interval_seconds,
+            "orphan_action": self.orphan_action,
+            "quarantine_dir": str(self.quarantine_dir),
+            "files_per_second": self.files_per_second,
+            "min_age_seconds": self.min_age_seconds,
+            "running": current is not None,
+            "progress": {key: value for key, value in current.items() if not isinstance(value, list)} if current else None,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at and self._thread else None,
+            "last_run": self.last_run,
+        }
+
+
+image_reconciler = ImageReconciler()
@@ -0,0 +1,396 @@
+"""
+Tiered retention for capture images.
+
+Capture images are written full size to static/uploads (the hot volume) and
+kept for as long as their reads. The tiering job moves aged ones to an
+archive store so the hot volume only holds recent images:
+
+- context images of reads older than TIERING_CONTEXT_AFTER_DAYS are
+  recompressed at TIERING_CONTEXT_QUALITY (kept as they are if that would not
+  make them smaller, or without Pillow) and moved,
+- plate images of reads older than TIERING_PLATE_AFTER_DAYS are moved
+  byte for byte, as the evidential record of the VRM.
+
+The archive is a local stand-in for an object store: each image gets a key
+derived from its file name (context/3f/context_3f....jpg) under
+TIERING_ARCHIVE_DIR, and the read's path becomes archive/uploads/<key>
+whatever the directory, so stored paths stay valid URLs
+(GET /archive/uploads/{key}) if the archive is moved.
+
+A pass walks the reads old enough to move in ID order, from where the last
+pass stopped to the end, in batches of TIERING_BATCH_ROWS. Reads too recent
+are skipped rather than ending the walk, as capture timestamps are not in ID
+order (backlog uploads, a camera with a wrong clock), and the next pass starts
+again just before the first of them. Per batch the archive copies are written (and synced) first, the paths are then
+updated in one statement, and only after that commit are the hot files
+removed, so a crash at any point leaves each image reachable from its read.
+Files are moved at TIERING_FILES_PER_SECOND at most. Positions and the lease
+are kept in job_cursors (see job_cursor.py).
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from sqlalchemy import bindparam, or_
+
+from database import SessionLocal
+from job_cursor import JobLease
+from metrics import UPLOAD_IMAGES_TIERED
+from models import ANPRRead
+
+logger = logging.getLogger(__name__)
+
+# Where main.py writes capture images
+UPLOAD_DIR = Path("static/uploads")
+
+# Seconds between scheduled passes (0 disables the schedule; passes can still be started from the admin API)
+TIERING_INTERVAL_SECONDS = float(os.getenv("TIERING_INTERVAL_SECONDS", "3600"))
+
+# Age of a read before its context / plate image is archived (0 keeps that image hot)
+TIERING_CONTEXT_AFTER_DAYS = float(os.getenv("TIERING_CONTEXT_AFTER_DAYS", "30"))
+TIERING_PLATE_AFTER_DAYS = float(os.getenv("TIERING_PLATE_AFTER_DAYS", "90"))
+
+# JPEG quality archived context images are recompressed at
+TIERING_CONTEXT_QUALITY = int(os.getenv("TIERING_CONTEXT_QUALITY", "60"))
+
+TIERING_ARCHIVE_DIR = Path(os.getenv("TIERING_ARCHIVE_DIR", "archive/uploads"))
+
+# Reads examined per batch, and images moved per second at most
+TIERING_BATCH_ROWS = int(os.getenv("TIERING_BATCH_ROWS", "200"))
+TIERING_FILES_PER_SECOND = float(os.getenv("TIERING_FILES_PER_SECOND", "50"))
+
+# Stored path prefix of archived images, independent of TIERING_ARCHIVE_DIR
+ARCHIVE_PATH_PREFIX = "archive/uploads/"
+
+JOB_NAME = "image_tiering"
+
+# Image column -> (file name prefix, recompressed)
+TIERED_COLUMNS = {
+    "context_image_path": ("context", True),
+    "plate_image_path": ("plate", False),
+}
+
+
+def archive_key(name: str) -> Optional[str]:
+    """Archive key of an upload file name, or None for names main.py does not write"""
+    for prefix, _ in TIERED_COLUMNS.values():
+        if name.startswith(prefix + "_") and len(name) > len(prefix) + 3:
+            return f"{prefix}/{name[len(prefix) + 1:len(prefix) + 3]}/{name}"
+    return None
+
+
+def archive_file(key: str, archive_dir: Path = TIERING_ARCHIVE_DIR) -> Optional[Path]:
+    """The archived file for a key (or upload file name), or None if it is not archived"""
+    if "/" not in key:
+        key = archive_key(key)
+        if key is None:
+            return None
+    root = archive_dir.resolve()
+    path = (root / key).resolve()
+    if not path.is_relative_to(root) or not path.is_file():
+        return None
+    return path
+
+
+def resolve_image(stored_path: Optional[str]) -> Optional[Path]:
+    """The file behind a read's stored image path, whichever tier it is on"""
+    if not stored_path:
+        return None
+    if stored_path.startswith(ARCHIVE_PATH_PREFIX):
+        return archive_file(stored_path[len(ARCHIVE_PATH_PREFIX):])
+    path = Path(stored_path)
+    if path.is_file():
+        return path
+    # Archived since the path was read
+    return archive_file(path.name)
+
+
+def recompress(data: bytes, quality: int) -> Optional[bytes]:
+    """JPEG data at the given quality, or None if Pillow is missing, the image cannot be decoded or it would not shrink"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            exif = image.info.get("exif")
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            # Keep the capture metadata with the image
+            image.save(buffer, "JPEG", quality=quality, optimize=True, **({"exif": exif} if exif else {}))
+    except Exception as e:
+        logger.warning("Could not recompress image: %s", e, extra={"event": "tiering.recompress_failed"})
+        return None
+    smaller = buffer.getvalue()
+    return smaller if len(smaller) < len(data) else None
+
+
+class ImageTiering:
+    """Resumable, rate-limited archiving of aged capture images"""
+
+    def __init__(self, upload_dir: Path = UPLOAD_DIR, archive_dir: Path = TIERING_ARCHIVE_DIR,
+                 interval_seconds: float = TIERING_INTERVAL_SECONDS,
+                 context_after_days: float = TIERING_CONTEXT_AFTER_DAYS, plate_after_days: float = TIERING_PLATE_AFTER_DAYS,
+                 context_quality: int = TIERING_CONTEXT_QUALITY, batch_rows: int = TIERING_BATCH_ROWS,
+                 files_per_second: float = TIERING_FILES_PER_SECOND):
+        self.upload_dir = upload_dir
+        self.archive_dir = archive_dir
+        self.interval_seconds = interval_seconds
+        self.after_days = {"context_image_path": context_after_days, "plate_image_path": plate_after_days}
+        self.context_quality = context_quality
+        self.batch_rows = max(batch_rows, 1)
+        self.files_per_second = files_per_second
+        self.lease = JobLease(JOB_NAME)
+        # Stored paths of hot images are str(upload_dir / name)
+        self._hot_prefix = str(upload_dir) + os.sep
+        self.current: Optional[dict] = None
+        self.last_run: Optional[dict] = None
+        self.next_run_at: Optional[datetime] = None
+        self._run_lock = threading.Lock()
+        self._trigger = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="image-tiering", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._trigger.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def trigger(self) -> bool:
+        """Start a pass in the background now; False if one is already running here"""
+        if self.current is not None:
+            return False
+        self.start()
+        self._trigger.set()
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            delay = self.interval_seconds if self.interval_seconds > 0 else None
+            self.next_run_at = datetime.utcnow() + timedelta(seconds=delay) if delay else None
+            self._trigger.wait(delay)
+            self._trigger.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.run_pass()
+            except Exception:
+                logger.exception("Image tiering failed", extra={"event": "tiering.failed"})
+
+    # Passes
+
+    def run_pass(self) -> Optional[dict]:
+        """Archive every image old enough, from the stored positions on; None if another worker is running"""
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            position = self.lease.acquire()
+            if position is None:
+                logger.info("Image tiering is running in another worker", extra={"event": "tiering.skipped"})
+                return None
+            return self._run(json.loads(position) if position else {})
+        finally:
+            self.current = None
+            self._run_lock.release()
+
+    def _run(self, positions: Dict[str, int]) -> dict:
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        summary = self.current = {
+            "started_at": now.isoformat(),
+            "resumed_from": dict(positions),
+            "reads_examined": 0,
+            "archived": 0,
+            "recompressed": 0,
+            "missing": 0,
+            "failed": 0,
+            "bytes_before": 0,
+            "bytes_after": 0,
+            "completed": False,
+        }
+
+        stopped = False
+        for column, days in self.after_days.items():
+            if days <= 0:
+                continue
+            cutoff = now - timedelta(days=days)
+            after_id = positions.get(column, 0)
+            # The walk skips reads too recent now; the next pass comes back for them
+            recent_id = self._first_recent(column, after_id, cutoff)
+            while not stopped:
+                batch_started = time.monotonic()
+                after_id, moved, caught_up = self._tier_batch(column, after_id, cutoff, summary)
+                positions[column] = after_id if recent_id is None else min(after_id, recent_id - 1)
+                if not self.lease.save(json.dumps(positions, sort_keys=True)):
+                    logger.warning("Image tiering lease lost, stopping", extra={"event": "tiering.lease_lost"})
+                    stopped = True
+                    break
+                if caught_up:
+                    break
+                if self._stop.is_set():
+                    stopped = True
+                    break
+                if self.files_per_second > 0:
+                    self._stop.wait(max(moved / self.files_per_second - (time.monotonic() - batch_started), 0))
+
+        self.lease.save(json.dumps(positions, sort_keys=True), release=True)
+        summary["completed"] = not stopped
+        summary["positions"] = dict(positions)
+        summary["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        self.last_run = summary
+        logger.info(
+            "Image tiering %s: %s images archived (%s recompressed), %s bytes freed",
+            "completed" if summary["completed"] else "stopped", summary["archived"], summary["recompressed"],
+            summary["bytes_before"] - summary["bytes_after"],
+            extra={"event": "tiering.finished", **{key: value for key, value in summary.items()
+                                                   if not isinstance(value, dict)}}
+        )
+        return summary
+
+    def _first_recent(self, column: str, after_id: int, cutoff: datetime) -> Optional[int]:
+        """ID of the first read after after_id with a hot image in column that is too recent to move"""
+        image_path = getattr(ANPRRead, column)
+        db = SessionLocal()
+        try:
+            return db.query(ANPRRead.id).filter(
+                ANPRRead.id > after_id,
+                ANPRRead.timestamp >= cutoff,
+                image_path.startswith(self._hot_prefix, autoescape=True)
+            ).order_by(ANPRRead.id).limit(1).scalar()
+        finally:
+            db.close()
+
+    def _tier_batch(self, column: str, after_id: int, cutoff: datetime, summary: dict) -> Tuple[int, int, bool]:
+        """
+        Archive the images in column of the next batch of reads after after_id old enough to move.
+        Returns (last read ID done, images moved, whether the walk reached the end).
+        """
+        image_path = getattr(ANPRRead, column)
+        db = SessionLocal()
+        try:
+            rows = db.query(ANPRRead.id, image_path).filter(
+                ANPRRead.id > after_id,
+                or_(ANPRRead.timestamp == None, ANPRRead.timestamp < cutoff),
+                image_path.startswith(self._hot_prefix, autoescape=True)
+            ).order_by(ANPRRead.id).limit(self.batch_rows).all()
+        finally:
+            db.close()
+
+        last_id = rows[-1][0] if rows else after_id
+        caught_up = len(rows) < self.batch_rows
+        summary["reads_examined"] += len(rows)
+        moves: List[Tuple[int, str, str, Optional[Path]]] = []
+        for read_id, path in rows:
+            move = self._archive(path, TIERED_COLUMNS[column][1], summary)
+            if move is not None:
+                moves.append((read_id, path) + move)
+
+        if moves:
+            self._repoint(column, moves)
+            for _, _, _, source in moves:
+                if source is None:
+                    continue
+                try:
+                    source.unlink()
+                except FileNotFoundError:
+                    pass
+        return last_id, len(moves), caught_up
+
+    def _archive(self, stored_path: str, recompressed: bool, summary: dict) -> Optional[Tuple[str, Optional[Path]]]:
+        """Copy one hot image into the archive: (new stored path, hot file to remove once repointed), or None"""
+        source = Path(stored_path)
+        key = archive_key(source.name)
+        if key is None:
+            return None
+        target = self.archive_dir / key
+        try:
+            data = source.read_bytes()
+        except FileNotFoundError:
+            if target.is_file():
+                # Archived by an earlier pass that stopped before repointing this read
+                return ARCHIVE_PATH_PREFIX + key, None
+            summary["missing"] += 1
+            UPLOAD_IMAGES_TIERED.labels("missing").inc()
+            return None
+
+        smaller = recompress(data, self.context_quality) if recompressed else None
+        tmp_path = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(smaller or data)
+                f.flush()
+                os.fsync(f.fileno())
+            shutil.copystat(source, tmp_path)
+            os.replace(tmp_path, target)
+        except OSError as e:
+            logger.warning("Could not archive image %s: %s", stored_path, e, extra={"event": "tiering.archive_failed"})
+            try:
+                tmp_path.unlink()
+            except FileNotFoundError:
+                pass
+            summary["failed"] += 1
+            UPLOAD_IMAGES_TIERED.labels("failed").inc()
+            return None
+
+        summary["archived"] += 1
+        summary["bytes_before"] += len(data)
+        summary["bytes_after"] += len(smaller or data)
+        if smaller is not None:
+            summary["recompressed"] += 1
+        UPLOAD_IMAGES_TIERED.labels("recompressed" if smaller is not None else "archived").inc()
+        return ARCHIVE_PATH_PREFIX + key, source
+
+    def _repoint(self, column: str, moves: List[Tuple[int, str, str, Optional[Path]]]):
+        """Point the reads at their archived images, in one statement"""
+        table = ANPRRead.__table__
+        statement = table.update().where(
+            table.c.id == bindparam("b_id"),
+            # Unless the read's image was replaced meanwhile
+            table.c[column] == bindparam("b_old"),
+        ).values({column: bindparam("b_new")})
+        db = SessionLocal()
+        try:
+            db.execute(statement, [{"b_id": read_id, "b_old": old, "b_new": new} for read_id, old, new, _ in moves])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def status(self) -> dict:
+        current = self.current
+        return {
+            "interval_seconds": self.interval_seconds,
+            "context_after_days": self.after_days["context_image_path"],
+            "plate_after_days": self.after_days["plate_image_path"],
+            "context_quality": self.context_quality,
+            "archive_dir": str(self.archive_dir),
+            "files_per_second": self.files_per_second,
+            "running": current is not None,
+            "progress": dict(current) if current else None,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at and self._thread else None,
+            "last_run": self.last_run,
+        }
+
+
+image_tiering = ImageTiering()
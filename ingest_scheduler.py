@@ -0,0 +1,209 @@
+"""
+Live-vs-backlog priority for capture ingest.
+
+Each capture is put in a lane by its age, captureDate against the time it was
+received: captures up to INGEST_LIVE_MAX_AGE_SECONDS old are live, older ones
+(a roadside unit flushing hours of buffered reads after reconnecting) are
+backlog. Live captures, and their hotlist matching, are stored straight away.
+Backlog captures wait for admission:
+
+- while a live capture is being stored, only at INGEST_BACKLOG_MIN_RATE
+  captures per second, so a reconnect backlog still drains under sustained
+  live load,
+- at most INGEST_BACKLOG_CONCURRENCY backlog requests at a time,
+- at INGEST_BACKLOG_RATE captures per second (token bucket, 0 for no limit),
+- taking turns between sources, so one unit's flush does not hold up another's.
+
+A request carrying several captures (sendCompoundCapture, a sendCaptureStream
+chunk) is live if any of its captures is, and takes one token per capture.
+
+The scheduler runs in each worker's event loop. The ingest handlers hold their
+admission while their database work runs in the threadpool, so a live write in
+progress holds backlog to its minimum rate and live captures skip ahead of
+backlog in that worker.
+Lane depths are in status() and the anpr_ingest_lane_* metrics.
+"""
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Deque, Dict, Optional, Tuple
+import asyncio
+import os
+import time
+
+from metrics import INGEST_LANE_CAPTURES, INGEST_LANE_WAIT_SECONDS
+
+LIVE = "live"
+BACKLOG = "backlog"
+
+# Captures older than this when received are backlog
+INGEST_LIVE_MAX_AGE_SECONDS = float(os.getenv("INGEST_LIVE_MAX_AGE_SECONDS", "300"))
+
+# Backlog captures admitted per second per worker (0 for no limit)
+INGEST_BACKLOG_RATE = float(os.getenv("INGEST_BACKLOG_RATE", "200"))
+
+# Backlog requests being stored at once per worker
+INGEST_BACKLOG_CONCURRENCY = int(os.getenv("INGEST_BACKLOG_CONCURRENCY", "1"))
+
+# Backlog captures admitted per second per worker while live writes are running
+# (0: none until live is idle)
+INGEST_BACKLOG_MIN_RATE = float(os.getenv("INGEST_BACKLOG_MIN_RATE", "20"))
+
+
+def capture_age_seconds(capture_time: datetime, received_at: Optional[datetime] = None) -> float:
+    """Seconds between capture and receipt (negative for capture times ahead of the server clock)"""
+    if capture_time.tzinfo is not None:
+        capture_time = capture_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return ((received_at or datetime.utcnow()) - capture_time).total_seconds()
+
+
+class IngestScheduler:
+    """Admission of capture writes by lane: live first, backlog rate limited and fair across sources"""
+
+    def __init__(self, live_max_age: float = INGEST_LIVE_MAX_AGE_SECONDS, backlog_rate: float = INGEST_BACKLOG_RATE,
+                 backlog_concurrency: int = INGEST_BACKLOG_CONCURRENCY,
+                 backlog_min_rate: float = INGEST_BACKLOG_MIN_RATE):
+        self.live_max_age = live_max_age
+        self.backlog_rate = backlog_rate
+        self.backlog_concurrency = max(backlog_concurrency, 1)
+        self.backlog_min_rate = backlog_min_rate
+        self.live_active = 0
+        self.backlog_active = 0
+        # Waiting backlog requests by source, in turn order: (future, captures, enqueued at)
+        self._waiting: "OrderedDict[str, Deque[Tuple[asyncio.Future, int, float]]]" = OrderedDict()
+        self._waiting_captures = 0
+        self._tokens = self._capacity
+        self._refilled_at = time.monotonic()
+        # When backlog may next be admitted alongside live writes
+        self._live_turn_at = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.admitted: Dict[str, int] = {LIVE: 0, BACKLOG: 0}
+
+    @property
+    def _capacity(self) -> float:
+        # A tenth of a second of burst, so a flush cannot start with a run of backlog writes;
+        # at least one token, so low rates still admit single captures
+        return max(self.backlog_rate / 10, 1.0)
+
+    def lane_for(self, capture_time: Optional[datetime], received_at: Optional[datetime] = None) -> str:
+        if capture_time is None:
+            return LIVE
+        return BACKLOG if capture_age_seconds(capture_time, received_at) > self.live_max_age else LIVE
+
+    def lane_for_date(self, capture_date: Optional[str]) -> str:
+        """Lane of an ISO captureDate as sent by a unit; unparseable dates are left to the handler (live)"""
+        try:
+            capture_time = datetime.fromisoformat(capture_date.strip().replace('Z', '+00:00'))
+        except (AttributeError, ValueError):
+            return LIVE
+        return self.lane_for(capture_time)
+
+    @asynccontextmanager
+    async def admit(self, lane: str, source, captures: int = 1):
+        """Hold a lane slot for the duration of a write; backlog waits for its turn"""
+        if lane == LIVE:
+            self.live_active += 1
+            INGEST_LANE_CAPTURES.labels(LIVE).inc(captures)
+            INGEST_LANE_WAIT_SECONDS.labels(LIVE).observe(0.0)
+            self.admitted[LIVE] += captures
+            try:
+                yield
+            finally:
+                self.live_active -= 1
+                self._dispatch()
+            return
+
+        await self._wait_turn(str(source), captures)
+        try:
+            yield
+        finally:
+            self.backlog_active -= 1
+            self._dispatch()
+
+    async def _wait_turn(self, source: str, captures: int):
+        future = asyncio.get_running_loop().create_future()
+        enqueued_at = time.monotonic()
+        self._waiting.setdefault(source, deque()).append((future, captures, enqueued_at))
+        self._waiting_captures += captures
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the request went away
+                self.backlog_active -= 1
+                self._dispatch()
+            raise
+        INGEST_LANE_CAPTURES.labels(BACKLOG).inc(captures)
+        INGEST_LANE_WAIT_SECONDS.labels(BACKLOG).observe(time.monotonic() - enqueued_at)
+        self.admitted[BACKLOG] += captures
+
+    def _refill(self, now: float):
+        if self.backlog_rate > 0:
+            self._tokens = min(self._capacity, self._tokens + (now - self._refilled_at) * self.backlog_rate)
+        self._refilled_at = now
+
+    def _dispatch(self):
+        """Admit waiting backlog requests as tokens allow, at no more than the minimum rate during live writes"""
+        while self._waiting and self.backlog_active < self.backlog_concurrency:
+            now = time.monotonic()
+            self._refill(now)
+            delay = 0.0
+            if self.backlog_rate > 0 and self._tokens <= 0:
+                delay = -self._tokens / self.backlog_rate + 0.001
+            if self.live_active:
+                if self.backlog_min_rate <= 0:
+                    # The last live write to finish dispatches again
+                    return
+                delay = max(delay, self._live_turn_at - now)
+            if delay > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+                return
+            # Next source in turn; it goes to the back of the rotation if it has more waiting
+            source, queue = next(iter(self._waiting.items()))
+            future, captures, _ = queue.popleft()
+            if queue:
+                self._waiting.move_to_end(source)
+            else:
+                del self._waiting[source]
+            self._waiting_captures -= captures
+            if future.done():
+                continue
+            # A large request may overdraw the bucket; later ones wait the debt off
+            self._tokens -= captures
+            if self.backlog_min_rate > 0:
+                self._live_turn_at = now + captures / self.backlog_min_rate
+            self.backlog_active += 1
+            future.set_result(None)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def status(self) -> dict:
+        return {
+            "live_max_age_seconds": self.live_max_age,
+            "backlog_rate": self.backlog_rate,
+            "backlog_concurrency": self.backlog_concurrency,
+            "backlog_min_rate": self.backlog_min_rate,
+            "lanes": {
+                LIVE: {"in_flight": self.live_active, "waiting": 0, "admitted_captures": self.admitted[LIVE]},
+                BACKLOG: {
+                    "in_flight": self.backlog_active,
+                    "waiting": sum(len(queue) for queue in self._waiting.values()),
+                    "waiting_captures": self._waiting_captures,
+                    "admitted_captures": self.admitted[BACKLOG],
+                },
+            },
+            "backlog_waiting_by_source": {
+                source: sum(captures for _, captures, _ in queue) for source, queue in self._waiting.items()
+            },
+        }
+
+    @property
+    def backlog_waiting_captures(self) -> int:
+        return self._waiting_captures
+
+
+ingest_scheduler = IngestScheduler()
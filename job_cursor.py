@@ -0,0 +1,73 @@
+"""
+Leases and resume positions for long-running background jobs.
+
+A job keeps one row in job_cursors: where it got to, and which worker holds
+the lease to run it. A pass takes the lease, saves its position (renewing the
+lease) as it goes, and releases it at the end, so with several workers only
+one runs the job at a time and a pass interrupted by a restart resumes where
+it stopped. A crashed worker's lease runs out after LEASE_SECONDS.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import os
+import socket
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import JobCursor
+
+# A pass holding the lease renews it with every save
+LEASE_SECONDS = 300
+
+
+class JobLease:
+    """The job_cursors row of one job, as seen by this worker"""
+
+    def __init__(self, name: str, lease_seconds: float = LEASE_SECONDS):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}/{os.getpid()}"
+
+    def acquire(self) -> Optional[str]:
+        """Take the lease and return the position to resume from, or None if another worker holds it"""
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        db = SessionLocal()
+        try:
+            taken = db.query(JobCursor).filter(
+                JobCursor.name == self.name,
+                or_(JobCursor.lease_owner == None, JobCursor.lease_owner == self.owner, JobCursor.lease_until < now)
+            ).update({JobCursor.lease_owner: self.owner, JobCursor.lease_until: lease_until},
+                     synchronize_session=False)
+            if not taken:
+                if db.query(JobCursor.name).filter(JobCursor.name == self.name).first() is not None:
+                    return None
+                db.add(JobCursor(name=self.name, position="", lease_owner=self.owner,
+                                 lease_until=lease_until, updated_at=now))
+            db.commit()
+            return db.query(JobCursor.position).filter(JobCursor.name == self.name).scalar() or ""
+        except IntegrityError:
+            # Created by another worker first
+            db.rollback()
+            return None
+        finally:
+            db.close()
+
+    def save(self, position: str, release: bool = False) -> bool:
+        """Store the position and renew (or release) the lease; False if the lease was lost"""
+        now = datetime.utcnow()
+        values = {JobCursor.position: position, JobCursor.updated_at: now,
+                  JobCursor.lease_until: now if release else now + timedelta(seconds=self.lease_seconds)}
+        if release:
+            values[JobCursor.lease_owner] = None
+        db = SessionLocal()
+        try:
+            kept = db.query(JobCursor).filter(JobCursor.name == self.name, JobCursor.lease_owner == self.owner).update(
+                values, synchronize_session=False
+            )
+            db.commit()
+            return bool(kept)
+        finally:
+            db.close()
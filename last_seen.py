@@ -0,0 +1,154 @@
+"""
+Bulk "last seen" lookup for VRM lists.
+
+"Last sighting of each of these 20,000 VRMs" is answered with one set-based
+query instead of a search per VRM. The list is loaded into a temporary table
+on one connection and joined to anpr_reads through the (license_plate,
+timestamp) index:
+
+- per VRM, the sightings within the window are counted over a range of that
+  index, and the latest one is the last entry of the range,
+- that read is joined back by ID for its camera, location and position,
+- VRMs with no sighting are kept by an outer join, in the order they were given.
+
+Results are streamed (NDJSON or CSV) as the rows come back, so the response
+starts before the whole list is resolved and memory stays flat.
+"""
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional
+import csv
+import io
+import json
+import os
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, func, select
+
+from database import engine
+from models import ANPRRead
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# VRMs accepted per lookup
+LAST_SEEN_MAX_VRMS = int(os.getenv("LAST_SEEN_MAX_VRMS", "100000"))
+
+# Result rows fetched from the database (and encoded) at a time
+LAST_SEEN_FETCH_ROWS = 1000
+
+# Temporary table rows per INSERT batch
+INSERT_BATCH_ROWS = 5000
+
+RESULT_FIELDS = (
+    "vrm", "sightings", "last_seen", "read_id", "camera_id", "location", "latitude", "longitude",
+    "confidence", "hotlist_match",
+)
+
+# Header names recognised in the first line of an uploaded list
+VRM_HEADERS = ("vrm", "license_plate", "licence_plate", "plate", "registration")
+
+# Private to the connection that creates it, so concurrent lookups do not collide
+lookup_table = Table(
+    "last_seen_vrms", MetaData(),
+    Column("position", Integer, primary_key=True),
+    Column("vrm", String(20), nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+
+def normalise_vrms(vrms: Iterable[str]) -> List[str]:
+    """Stripped, upper-cased VRMs in order of first appearance, without blanks or repeats"""
+    seen = {}
+    for vrm in vrms:
+        vrm = vrm.strip().upper()
+        if vrm and vrm not in seen:
+            seen[vrm] = None
+    return list(seen)
+
+
+def parse_vrm_list(content: bytes) -> List[str]:
+    """VRMs from an uploaded list: one per line, or the first column of a CSV, with an optional header"""
+    text = content.decode("utf-8-sig")
+    rows = csv.reader(io.StringIO(text))
+    vrms = []
+    for line_number, row in enumerate(rows):
+        if not row:
+            continue
+        value = row[0]
+        if line_number == 0 and value.strip().lower() in VRM_HEADERS:
+            continue
+        vrms.append(value)
+    return normalise_vrms(vrms)
+
+
+def _dumps(content: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=lambda value: value.isoformat(), separators=(",", ":")).encode("utf-8")
+
+
+def _lookup_query(start_time: Optional[datetime], end_time: Optional[datetime]):
+    reads = ANPRRead.__table__
+    window = [reads.c.license_plate == lookup_table.c.vrm]
+    if start_time is not None:
+        window.append(reads.c.timestamp >= start_time)
+    if end_time is not None:
+        window.append(reads.c.timestamp <= end_time)
+
+    # Per VRM, both are seeks into the (license_plate, timestamp) index: a count over the
+    # window's range, and the last entry of that range
+    sightings = select(func.count()).select_from(reads).where(*window).scalar_subquery()
+    latest_id = select(reads.c.id).where(*window).order_by(
+        reads.c.timestamp.desc(), reads.c.id.desc()
+    ).limit(1).scalar_subquery()
+    latest = select(
+        lookup_table.c.position, lookup_table.c.vrm,
+        sightings.label("sightings"), latest_id.label("read_id"),
+    ).subquery("latest")
+
+    sighting = reads.alias("sighting")
+    return select(
+        latest.c.vrm, latest.c.sightings, sighting.c.timestamp, sighting.c.id, sighting.c.camera_id,
+        sighting.c.location, sighting.c.latitude, sighting.c.longitude, sighting.c.confidence,
+        sighting.c.hotlist_match,
+    ).select_from(
+        latest.outerjoin(sighting, sighting.c.id == latest.c.read_id)
+    ).order_by(latest.c.position)
+
+
+def iter_last_seen(vrms: List[str], start_time: Optional[datetime] = None, end_time: Optional[datetime] = None,
+                   format: str = "ndjson") -> Iterator[bytes]:
+    """Encoded results, one per VRM in the order given; sightings 0 and nulls for VRMs not seen"""
+    with engine.begin() as conn:
+        lookup_table.create(conn)
+        try:
+            for start in range(0, len(vrms), INSERT_BATCH_ROWS):
+                conn.execute(lookup_table.insert(), [
+                    {"position": position, "vrm": vrm}
+                    for position, vrm in enumerate(vrms[start:start + INSERT_BATCH_ROWS], start)
+                ])
+
+            if format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(RESULT_FIELDS)
+                yield buffer.getvalue().encode("utf-8")
+
+            result = conn.execution_options(stream_results=True).execute(_lookup_query(start_time, end_time))
+            while True:
+                rows = result.fetchmany(LAST_SEEN_FETCH_ROWS)
+                if not rows:
+                    break
+                if format == "csv":
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(
+                        tuple(value.isoformat() if isinstance(value, datetime) else value for value in row)
+                        for row in rows
+                    )
+                    yield buffer.getvalue().encode("utf-8")
+                else:
+                    yield b"\n".join(_dumps(dict(zip(RESULT_FIELDS, row))) for row in rows) + b"\n"
+        finally:
+            # The connection goes back to the pool, so the table must not outlive the lookup
+            lookup_table.drop(conn)
@@ -0,0 +1,158 @@
+"""
+Structured, queue-backed logging.
+
+Handlers on the request path only put the LogRecord on an in-memory queue; a
+QueueListener thread formats it (JSON by default) and does the write, so slow
+stdout or files never stall the event loop. Records are not formatted before
+they are queued, so ``logger.info("... %s", value)`` costs no string work when
+the record is dropped. High-volume info events can be sampled or rate limited
+per event name; warnings and errors always pass.
+
+Log with an event name and structured fields:
+
+    logger.info("Created ANPR read for plate %s", vrm, extra={"event": "capture.stored", "vrm": vrm})
+"""
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# json: one JSON object per line, text: the classic human readable format
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# event=rate pairs: keep this fraction of info/debug records for the event
+DEFAULT_SAMPLE_RATES = {
+    "capture.stored": 0.01,
+    "compound.stored": 0.1,
+    "binary.saved": 0.01,
+    "binary.held": 0.1,
+}
+
+# Maximum info/debug records per second for any one event (0 disables the limit)
+LOG_EVENT_RATE_LIMIT = float(os.getenv("LOG_EVENT_RATE_LIMIT", "20"))
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+def parse_sample_rates(value: Optional[str]) -> Dict[str, float]:
+    """Parse LOG_SAMPLE_RATES ("capture.stored=0.01,binary.saved=0") over the defaults"""
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for pair in (value or "").split(","):
+        if "=" not in pair:
+            continue
+        event, rate = pair.split("=", 1)
+        rates[event.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with extra= fields at the top level"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class EventSampler(logging.Filter):
+    """
+    Drop a share of info/debug records per event name (extra={"event": ...}),
+    and cap each event's rate. The number dropped since the last record that
+    got through is attached to it as ``dropped``.
+    """
+
+    def __init__(self, sample_rates: Dict[str, float], rate_limit: float = LOG_EVENT_RATE_LIMIT):
+        super().__init__()
+        self.sample_rates = sample_rates
+        self.rate_limit = rate_limit
+        # event -> [window start, records in window, dropped since last emitted]
+        self._windows: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+
+        keep = random.random() < self.sample_rates.get(event, 1.0)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(event)
+            if window is None:
+                window = self._windows[event] = [now, 0, 0]
+            if now - window[0] >= 1.0:
+                window[0], window[1] = now, 0
+            if keep and self.rate_limit and window[1] >= self.rate_limit:
+                keep = False
+            if not keep:
+                window[2] += 1
+                return False
+            window[1] += 1
+            dropped, window[2] = window[2], 0
+        if dropped:
+            record.dropped = dropped
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Tracebacks reference live frames, so render them before handing off
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT):
+    """Route the root logger through a queue to a stdout handler on a background thread"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if log_format == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(EventSampler(parse_sample_rates(os.getenv("LOG_SAMPLE_RATES"))))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    # Flush whatever is still queued on shutdown
+    atexit.register(_listener.stop)
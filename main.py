@@ -1,51 +1,167 @@
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Request
-from fastapi.responses import HTMLResponse
+# Imported first, so the startup timing covers the whole import of the app
+from readiness import startup_state
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Request, BackgroundTasks, Query
+from fastapi.responses import HTMLResponse, FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
-from typing import List, Optional
+from sqlalchemy.exc import OperationalError, InterfaceError
+from pydantic import ValidationError
+from typing import Dict, List, Optional, Set, Tuple
 from pathlib import Path
+from contextlib import asynccontextmanager
+from functools import lru_cache
 import logging
 import io
 import csv
 import base64
 import uuid
+import os
+import asyncio
 import zipfile
+import hashlib
 from datetime import datetime
-import uvicorn
+from urllib.parse import quote
 
-from database import SessionLocal, engine
-from models import Base, Hotlist, ANPRRead, HotlistGroup, DeviceSource, HotlistRevision
+from database import SessionLocal, engine, ensure_schema
+from models import (
+    Base, Hotlist, ANPRRead, HotlistGroup, DeviceSource, HotlistRevision, ConvoyAnalysis, HotlistWeedLog,
+    HotlistAllocationRule
+)
 from schemas import (
     HotlistGroupCreate, HotlistGroupUpdate, HotlistGroupResponse,
     VehicleCreate, VehicleResponse,
     ANPRReadCreate, ANPRReadResponse, SystemStats,
     BofHotlistRevisions, BofHotlistData, BofRepoStatusResponse, BofHotlistStatusResponse, BofCaptureResponse,
     BofSendCaptureRequest, BofSendCompactCaptureRequest, BofSendCompoundCaptureRequest,
-    BofAddBinaryCaptureDataRequest, ANPRConfiguration, ConnectivityStatus
+    BofAddBinaryCaptureDataRequest, ANPRConfiguration, ConnectivityStatus,
+    ConvoyAnalysisCreate, ConvoyAnalysisResponse, CameraHealth, CameraHealthSummary,
+    ProfilingSettingsUpdate, HotlistWeedLogResponse,
+    BofSetHotlistStatusRequest, FleetSyncSummary, FleetDeviceSync, LastSeenLookup,
+    HotlistAllocationRuleCreate, HotlistAllocationRuleResponse, DeviceSourceUpdate, DeviceSourceResponse
+)
+from convoy import run_convoy_analysis
+from camera_health import camera_monitor
+from capture_dedup import capture_deduplicator
+from capture_correlation import capture_correlator
+from cache_sync import invalidation_channel, HOTLISTS, FLEET_SYNC
+from hotlist_cache import hotlist_index, device_source_cache, group_revision_cache, revisions_tag, warm_caches
+from fleet_sync import fleet_monitor, FLEET_DEVICE_STATUSES
+from hotlist_allocation import allocation_cache, apply_allocations, ALLOCATION_MATCH_TYPES
+from thumbnails import thumbnail_cache, ThumbnailCache, THUMBNAIL_SIZES, THUMBNAILS_EAGER
+from log_config import configure_logging
+from metrics import registry, MetricsMiddleware, GaugeFunction, instrument_engine, stage_timer, HOTLIST_CHECKS
+import profiling
+from serialization import FastJSONResponse, read_query, rows_to_dicts, READ_FIELDS, group_query, groups_with_vehicles
+from profiling import request_profiler, ProfilingMiddleware
+from weeding import hotlist_weeder
+from image_reconciler import image_reconciler
+from image_tiering import image_tiering, archive_file, archive_key, ARCHIVE_PATH_PREFIX
+from ingest_journal import ingest_journal, RejectedRecord
+from bulk_ingest import (
+    iter_lines, BulkIngestResult, BULK_INGEST_CHUNK_LINES, BULK_INGEST_MAX_LINE_BYTES, NDJSON_MEDIA_TYPE,
+    RESULT_CREATED, RESULT_DUPLICATE, RESULT_JOURNALLED, RESULT_ERROR
+)
+from ingest_scheduler import ingest_scheduler, LIVE, BACKLOG
+from last_seen import iter_last_seen, normalise_vrms, parse_vrm_list, LAST_SEEN_MAX_VRMS
+from geo import geo_fields, covering_cells, cell_filter, radius_bbox, distance_m
+from transport import (
+    CompressionMiddleware, wants_binary, zip_response, multipart_response, ZIP_MEDIA_TYPE, MULTIPART_MEDIA_TYPE
 )
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Setup logging (structured, written off the request path)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
 # Create uploads directory if it doesn't exist
 UPLOAD_DIR = Path("static/uploads")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Migrate the database if the models changed, start background jobs, and warm the
+    caches in the background; /readyz reports ready once they are warm
+    """
+    startup_state.mark_imported()
+    with startup_state.phase("schema"):
+        startup_state.migrated = await run_in_threadpool(ensure_schema, Base.metadata)
+    hotlist_weeder.start()
+    ingest_journal.start(apply_journal_record)
+    fleet_monitor.start()
+    image_reconciler.start()
+    image_tiering.start()
+    startup_state.warm_in_background(warm_caches)
+    yield
+    startup_state.stop()
+    hotlist_weeder.stop()
+    ingest_journal.stop()
+    fleet_monitor.stop()
+    image_reconciler.stop()
+    image_tiering.stop()
+
 app = FastAPI(
     title="ANPR Management System",
     description="Automatic Number Plate Recognition system for vehicle hotlist management and camera integration",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Mount static files and templates
+# gzip/brotli for large JSON and text responses, innermost so metrics include the encoding time
+app.add_middleware(CompressionMiddleware)
+
+# Metrics: per-route latency and SQL statement counts, plus queue depths read at scrape time
+instrument_engine(engine)
+app.add_middleware(MetricsMiddleware)
+GaugeFunction("anpr_db_pool_checked_out", "Database connections in use by this worker",
+              lambda: engine.pool.checkedout() if hasattr(engine.pool, "checkedout") else None)
+GaugeFunction("anpr_hotlist_index_plates", "Plates in the in-memory hotlist index", lambda: len(hotlist_index))
+GaugeFunction("anpr_device_source_cache_entries", "Devices in the device source cache", lambda: len(device_source_cache))
+GaugeFunction("anpr_dedup_entries", "Recent captures remembered for duplicate suppression", lambda: len(capture_deduplicator))
+GaugeFunction("anpr_capture_guid_entries", "Capture GUIDs remembered for addBinaryCaptureData", lambda: len(capture_correlator))
+GaugeFunction("anpr_pending_images", "Images waiting for their capture record",
+              lambda: capture_correlator.pending_totals()[0])
+GaugeFunction("anpr_pending_image_bytes", "Bytes held in pending images", lambda: capture_correlator.pending_totals()[1])
+GaugeFunction("anpr_thumbnail_queue_depth", "Thumbnails queued for background generation", lambda: thumbnail_cache.queue_depth)
+GaugeFunction("anpr_thumbnail_cache_bytes", "Bytes in the on-disk thumbnail cache", lambda: thumbnail_cache.total_bytes)
+GaugeFunction("anpr_ingest_lane_backlog_waiting", "Backlog captures waiting for admission",
+              lambda: ingest_scheduler.backlog_waiting_captures)
+GaugeFunction("anpr_ingest_lane_live_in_flight", "Live capture writes in progress", lambda: ingest_scheduler.live_active)
+GaugeFunction("anpr_ingest_journal_lag_bytes", "Journalled capture bytes not yet applied to the database",
+              lambda: ingest_journal.applier.lag_bytes() if ingest_journal.applier else None)
+GaugeFunction("anpr_fleet_devices", "Devices known to the fleet sync monitor", lambda: fleet_monitor.counts()["total"])
+GaugeFunction("anpr_fleet_devices_behind", "Devices behind the latest revision of an active hotlist group",
+              lambda: fleet_monitor.counts()["behind"])
+GaugeFunction("anpr_fleet_devices_stale", "Devices behind for longer than FLEET_STALE_AFTER_SECONDS",
+              lambda: fleet_monitor.counts()["stale"])
+GaugeFunction("anpr_fleet_devices_silent", "Devices that have not polled for FLEET_SILENT_AFTER_SECONDS",
+              lambda: fleet_monitor.counts()["silent"])
+
+# Opt-in profiling (X-Profile header or sample rate), outermost so its own cost stays out of the metrics
+profiling.instrument_engine(engine)
+app.add_middleware(ProfilingMiddleware)
+
+# Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+
+@lru_cache(maxsize=1)
+def get_templates():
+    """Page templates, loaded on the first page view (the API does not need Jinja2)"""
+    from fastapi.templating import Jinja2Templates
+    return Jinja2Templates(directory="templates")
+
+# Probes
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the worker is serving requests"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: schema checked and caches warm (503 until then), with startup phase timings"""
+    return FastJSONResponse(startup_state.status(), status_code=200 if startup_state.ready else 503)
 
 # Dependency to get database session
 def get_db():
@@ -56,20 +172,23 @@ def get_db():
         db.close()
 
 # Helper functions for BOF hotlist operations
-def get_or_create_device_source(db: Session, source_id: str) -> DeviceSource:
-    """Get or create a device source for BOF integration"""
-    device = db.query(DeviceSource).filter(DeviceSource.source_id == source_id).first()
-    if not device:
-        device = DeviceSource(
-            source_id=source_id,
-            description=f"Auto-created device for source {source_id}"
-        )
-        db.add(device)
-        db.commit()
-        db.refresh(device)
-    return device
+def get_or_create_device_source_id(db: Session, source_id: str) -> int:
+    """Get or create a device source for BOF integration, returning its ID"""
+    return device_source_cache.get_id(db, source_id)
+
+def apply_hotlist_match(anpr_read: ANPRRead):
+    """Flag a read that matches an active hotlist entry (in-memory index lookup)"""
+    with stage_timer("hotlist_match"):
+        hotlist_id = hotlist_index.match(anpr_read.license_plate)
+    if hotlist_id is not None:
+        anpr_read.hotlist_match = True
+        anpr_read.hotlist_id = hotlist_id
+        HOTLIST_CHECKS.labels("match").inc()
+    else:
+        HOTLIST_CHECKS.labels("no_match").inc()
 
-def get_or_create_hotlist_revision(db: Session, hotlist_group_id: int, device_source_id: int, hotlist_name: str) -> HotlistRevision:
+def get_or_create_hotlist_revision(db: Session, hotlist_group_id: int, device_source_id: int, hotlist_name: str,
+                                   is_allocated: bool = True) -> HotlistRevision:
     """Get or create a hotlist revision tracking entry"""
     revision = db.query(HotlistRevision).filter(
         HotlistRevision.hotlist_group_id == hotlist_group_id,
@@ -88,7 +207,8 @@ def get_or_create_hotlist_revision(db: Session, hotlist_group_id: int, device_so
             device_source_id=device_source_id,
             hotlist_name=hotlist_name,
             latest_revision=latest_hotlist_revision.revision if latest_hotlist_revision else 1,
-            external_system_revision=-1
+            external_system_revision=-1,
+            is_allocated=is_allocated
         )
         db.add(revision)
         db.commit()
@@ -138,49 +258,224 @@ def create_hotlist_zip(hotlist_name: str, source_id: str, csv_data: str, operati
     zip_buffer.seek(0)
     return zip_buffer.read()
 
+# Image type (BOF addBinaryCaptureData) -> (filename prefix, ANPRRead column)
+CAPTURE_IMAGE_COLUMNS = {
+    "P": ("plate", "plate_image_path"),
+    "C": ("context", "context_image_path"),
+}
+
+def write_capture_image(image_data: bytes, prefix: str) -> str:
+    """Write capture image bytes into the uploads directory and return the path"""
+    filepath = UPLOAD_DIR / f"{prefix}_{uuid.uuid4()}.jpg"
+    with stage_timer("image_write"), open(filepath, "wb") as f:
+        f.write(image_data)
+    if THUMBNAILS_EAGER:
+        thumbnail_cache.generate_in_background(filepath)
+    return str(filepath)
+
+def save_capture_image(image_b64: str, prefix: str) -> str:
+    """Decode a base64 capture image into the uploads directory and return its path"""
+    with stage_timer("image_decode"):
+        image_data = base64.b64decode(image_b64)
+    return write_capture_image(image_data, prefix)
+
+def attach_capture_image(db: Session, read_id: int, image_type: str, image_data: bytes) -> str:
+    """Store an image and point the read at it with a keyed update (caller commits)"""
+    prefix, column = CAPTURE_IMAGE_COLUMNS[image_type]
+    filepath = write_capture_image(image_data, prefix)
+    db.query(ANPRRead).filter(ANPRRead.id == read_id).update(
+        {column: filepath}, synchronize_session=False
+    )
+    return filepath
+
+def attach_pending_images(db: Session, read_ids: Dict[str, int], replace: bool = True) -> Tuple[Set[int], List[str]]:
+    """
+    Point committed reads (capture GUID -> read ID) at the images held for their GUIDs (caller commits).
+    Without replace an image already on a read is kept. Returns the reads given an
+    image and the held files left unused, for the caller to remove once committed.
+    """
+    attached, unused = set(), []
+    for guid, images in capture_correlator.take_pending_many(db, list(read_ids)).items():
+        for image_type, image_path in images:
+            _, column = CAPTURE_IMAGE_COLUMNS[image_type]
+            query = db.query(ANPRRead).filter(ANPRRead.id == read_ids[guid])
+            if not replace:
+                query = query.filter(getattr(ANPRRead, column) == None)
+            if query.update({column: image_path}, synchronize_session=False):
+                attached.add(read_ids[guid])
+            else:
+                unused.append(image_path)
+    return attached, unused
+
+def remove_unused_images(paths: List[str]):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+def handle_duplicate_capture(
+    db: Session,
+    entry,
+    vrm: str,
+    confidence: Optional[int] = None,
+    plate_image: Optional[str] = None,
+    overview_image: Optional[str] = None,
+    written: Optional[list] = None
+) -> Optional[ANPRRead]:
+    """
+    Apply the configured de-duplication mode to a repeated capture.
+    In merge mode the capture's confidence and missing images are folded into the
+    original read. Returns the original read: None if it was never stored, or is
+    still being stored after DEDUP_INFLIGHT_WAIT_SECONDS (blocking meanwhile).
+    With written, the merge is left to the caller's transaction and the images
+    it writes are appended to written.
+    """
+    read_id = capture_deduplicator.wait_stored(entry)
+    if read_id is None:
+        return None
+    
+    existing = db.query(ANPRRead).filter(ANPRRead.id == read_id).first()
+    if existing is None or capture_deduplicator.mode != "merge":
+        return existing
+    
+    if confidence and confidence > (existing.confidence or 0):
+        existing.confidence = confidence
+    try:
+        if plate_image and not existing.plate_image_path:
+            existing.plate_image_path = save_capture_image(plate_image, "plate")
+            if written is not None:
+                written.append(existing.plate_image_path)
+        if overview_image and not existing.context_image_path:
+            existing.context_image_path = save_capture_image(overview_image, "context")
+            if written is not None:
+                written.append(existing.context_image_path)
+    except Exception as e:
+        logger.error("Error merging duplicate capture image for plate %s: %s", vrm, e,
+                     extra={"event": "capture.merge_failed", "vrm": vrm})
+    if written is None:
+        db.commit()
+    
+    return existing
+
+def tag_duplicate(anpr_read: ANPRRead, entry, pending_reads: dict, tagged: list):
+    """Point a repeat stored in tag mode at its original; one from the same batch is linked after the flush"""
+    original = pending_reads.get(id(entry))
+    if original is not None:
+        tagged.append((anpr_read, original))
+    else:
+        anpr_read.duplicate_of_id = capture_deduplicator.wait_stored(entry)
+
+def duplicate_capture_response(db: Session, entry, vrm: str, **merge_fields) -> BofCaptureResponse:
+    """BOF response for a capture dropped or merged as a duplicate"""
+    existing = handle_duplicate_capture(db, entry, vrm, **merge_fields)
+    action = "merged into existing read" if capture_deduplicator.mode == "merge" else "ignored"
+    return BofCaptureResponse(
+        success=True,
+        message=f"Duplicate capture for plate {vrm} {action}",
+        read_id=existing.id if existing else entry.read_id
+    )
+
+# Sync and hotlist responses may be stored, but must be revalidated with If-None-Match
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+def hotlist_group_etag(group_id: int, revision: int, binary: bool = False, subset: Optional[str] = None) -> str:
+    # The raw ZIP and a device's force area subset are different representations, so they get their own validators
+    suffix = "-zip" if binary else ""
+    if subset is not None:
+        suffix += "-area-" + hashlib.sha1(subset.encode()).hexdigest()[:8]
+    return f'W/"group-{group_id}-r{revision}{suffix}"'
+
+def hotlist_status_etag(allocated_tag: str, ack_tag: str) -> str:
+    # The body carries the device's acknowledged revisions as well as its allocated groups' revisions
+    return f'W/"status-{allocated_tag}-{ack_tag}"'
+
+def not_modified(etag: str, vary: Optional[str] = None) -> Response:
+    """304 response carrying the validator and caching policy (and the 200's Vary, if it has one)"""
+    headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if vary:
+        headers["Vary"] = vary
+    return Response(status_code=304, headers=headers)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in candidates)
+
 # Web UI Routes
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
     """Main dashboard page"""
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return get_templates().TemplateResponse("dashboard.html", {"request": request})
 
 @app.get("/hotlists", response_class=HTMLResponse)
 async def hotlists_page(request: Request):
     """Hotlists management page"""
-    return templates.TemplateResponse("hotlists.html", {"request": request})
+    return get_templates().TemplateResponse("hotlists.html", {"request": request})
 
 @app.get("/anpr-reads", response_class=HTMLResponse)
 async def anpr_reads_page(request: Request):
     """ANPR reads monitoring page"""
-    return templates.TemplateResponse("anpr_reads.html", {"request": request})
+    return get_templates().TemplateResponse("anpr_reads.html", {"request": request})
+
+# Capture image thumbnails for the reads UI
+THUMBNAIL_CACHE_CONTROL = "public, max-age=86400"
+
+@app.get("/thumbnails/{size}/{filename}")
+async def get_thumbnail(size: str, filename: str, request: Request):
+    """Serve a thumbnail of an uploaded capture image, generating it on first request"""
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=404, detail="Unknown thumbnail size")
+    
+    if Path(filename).name != filename:
+        raise HTTPException(status_code=404, detail="Image not found")
+    source = UPLOAD_DIR / filename
+    if not source.is_file():
+        # Moved to the archive by the tiering job
+        source = archive_file(filename)
+        if source is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+    
+    etag = ThumbnailCache.etag(source, size)
+    headers = {"ETag": etag, "Cache-Control": THUMBNAIL_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    thumbnail = await run_in_threadpool(thumbnail_cache.get, source, size)
+    # Without Pillow (or for an undecodable file) fall back to the original
+    return FileResponse(thumbnail or source, media_type="image/jpeg", headers=headers)
+
+# Capture images moved off the hot volume by the tiering job (stored as archive/uploads/<key>)
+ARCHIVE_CACHE_CONTROL = "public, max-age=86400"
+
+@app.get("/" + ARCHIVE_PATH_PREFIX + "{key:path}")
+async def get_archived_image(key: str):
+    """Serve an archived capture image by its key"""
+    path = archive_file(key) if "/" in key else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": ARCHIVE_CACHE_CONTROL})
 
 # API Routes - Hotlist Groups (New structured hotlists)
 @app.post("/api/hotlist-groups", response_model=HotlistGroupResponse)
 async def create_hotlist_group(hotlist_group: HotlistGroupCreate, db: Session = Depends(get_db)):
     """Create a new hotlist group with multiple vehicles"""
-    print(f"DEBUG: Starting to create hotlist group: {hotlist_group.name}")
-    
     # Create the hotlist group with only the simplified fields
     db_hotlist_group = HotlistGroup(
         name=hotlist_group.name,
         is_active=hotlist_group.is_active
     )
-    print(f"DEBUG: Created HotlistGroup object")
     
     db.add(db_hotlist_group)
-    print(f"DEBUG: Added to session")
-    
     db.commit()
-    print(f"DEBUG: Committed hotlist group")
-    
     db.refresh(db_hotlist_group)
-    print(f"DEBUG: Refreshed, ID: {db_hotlist_group.id}")
     
     # Add vehicles to the group
-    print(f"DEBUG: Adding {len(hotlist_group.vehicles)} vehicles")
-    for i, vehicle_data in enumerate(hotlist_group.vehicles):
-        print(f"DEBUG: Creating vehicle {i+1}: {vehicle_data.license_plate}")
-        
+    for vehicle_data in hotlist_group.vehicles:
         # Get all vehicle data and filter out None values
         vehicle_dict = vehicle_data.model_dump(exclude_none=True)
         
@@ -189,19 +484,22 @@ async def create_hotlist_group(hotlist_group: HotlistGroupCreate, db: Session =
             hotlist_group_id=db_hotlist_group.id,
             **vehicle_dict
         )
-        print(f"DEBUG: Created Hotlist object for vehicle {i+1}")
         
         db.add(db_vehicle)
-        print(f"DEBUG: Added vehicle {i+1} to session")
     
     db.commit()
     db.refresh(db_hotlist_group)
+    logger.info(
+        "Created hotlist group %s with %d vehicles", db_hotlist_group.name, len(hotlist_group.vehicles),
+        extra={"event": "hotlist_group.created", "hotlist_group_id": db_hotlist_group.id}
+    )
     
     # Revision tracking is simplified - no global repository revision needed
+    invalidation_channel.publish(HOTLISTS)
     
     return db_hotlist_group
 
-@app.get("/api/hotlist-groups", response_model=List[HotlistGroupResponse])
+@app.get("/api/hotlist-groups", response_model=List[HotlistGroupResponse], response_class=FastJSONResponse)
 async def get_hotlist_groups(
     skip: int = 0, 
     limit: int = 100, 
@@ -209,22 +507,31 @@ async def get_hotlist_groups(
     db: Session = Depends(get_db)
 ):
     """Get all hotlist groups with optional search"""
-    query = db.query(HotlistGroup)
+    # Column tuples serialized directly, vehicles for the whole page in one query
+    query = group_query(db)
     
     if search:
         query = query.filter(
             HotlistGroup.name.ilike(f"%{search}%")
         )
     
-    hotlist_groups = query.offset(skip).limit(limit).all()
-    return hotlist_groups
+    group_rows = query.order_by(HotlistGroup.id).offset(skip).limit(limit).all()
+    return FastJSONResponse(groups_with_vehicles(db, group_rows))
 
 @app.get("/api/hotlist-groups/{group_id}", response_model=HotlistGroupResponse)
-async def get_hotlist_group(group_id: int, db: Session = Depends(get_db)):
-    """Get a specific hotlist group by ID"""
+async def get_hotlist_group(group_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    """Get a specific hotlist group by ID (supports If-None-Match)"""
+    # Unchanged since the client's copy: answer from the cached revision, no query
+    cached = group_revision_cache.snapshot().by_id.get(group_id)
+    if cached and etag_matches(request.headers.get("if-none-match"), hotlist_group_etag(group_id, cached.revision)):
+        return not_modified(hotlist_group_etag(group_id, cached.revision))
+    
     hotlist_group = db.query(HotlistGroup).filter(HotlistGroup.id == group_id).first()
     if not hotlist_group:
         raise HTTPException(status_code=404, detail="Hotlist group not found")
+    
+    response.headers["ETag"] = hotlist_group_etag(hotlist_group.id, hotlist_group.revision)
+    response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
     return hotlist_group
 
 @app.put("/api/hotlist-groups/{group_id}", response_model=HotlistGroupResponse)
@@ -263,6 +570,7 @@ async def update_hotlist_group(group_id: int, hotlist_group_update: HotlistGroup
     db.refresh(hotlist_group)
     
     # Revision tracking is simplified - no global repository revision needed
+    invalidation_channel.publish(HOTLISTS)
     
     return hotlist_group
 
@@ -275,12 +583,18 @@ async def delete_hotlist_group(group_id: int, db: Session = Depends(get_db)):
     
     # Delete all vehicles in the group
     db.query(Hotlist).filter(Hotlist.hotlist_group_id == group_id).delete()
+    # And its per-device revision tracking and allocation rules
+    db.query(HotlistRevision).filter(HotlistRevision.hotlist_group_id == group_id).delete()
+    rules_deleted = db.query(HotlistAllocationRule).filter(HotlistAllocationRule.hotlist_group_id == group_id).delete()
     
     # Delete the group
     db.delete(hotlist_group)
     db.commit()
     
     # Revision tracking is simplified - no global repository revision needed
+    invalidation_channel.publish(HOTLISTS)
+    if rules_deleted:
+        apply_allocations()
     
     return {"message": "Hotlist group deleted successfully"}
 
@@ -350,10 +664,16 @@ async def upload_csv_to_hotlist(
             db.add(db_vehicle)
             vehicles_added += 1
         
+        # New vehicles are a new revision for devices
+        if vehicles_added:
+            hotlist_group.revision += 1
+            hotlist_group.updated_at = datetime.utcnow()
+        
         # Commit all vehicles
         db.commit()
         
         # Revision tracking is simplified - no global repository revision needed
+        invalidation_channel.publish(HOTLISTS)
         
         return {
             "message": f"Successfully uploaded {vehicles_added} vehicles to hotlist group '{hotlist_group.name}'",
@@ -367,17 +687,45 @@ async def upload_csv_to_hotlist(
 @app.post("/anpr/reads", response_model=ANPRReadResponse)
 async def ingest_anpr_read(anpr_read: ANPRReadCreate, db: Session = Depends(get_db)):
     """Ingest ANPR read record from camera and process through BOF protocol"""
-    db_anpr_read = ANPRRead(**anpr_read.model_dump())
+    with stage_timer("dedup"):
+        entry, duplicate = capture_deduplicator.claim(
+            anpr_read.license_plate, anpr_read.camera_id, anpr_read.location, anpr_read.timestamp
+        )
+    if duplicate:
+        # Wait off the event loop for an original still being stored by another request
+        await run_in_threadpool(capture_deduplicator.wait_stored, entry)
+        if entry.read_id is None and not entry.released:
+            raise HTTPException(status_code=503, detail="Original capture is still being stored, retry later")
+    if duplicate and capture_deduplicator.mode != "tag":
+        existing = handle_duplicate_capture(db, entry, anpr_read.license_plate, anpr_read.confidence)
+        if existing:
+            return ANPRReadResponse.model_validate(existing)
     
-    # Check if this plate is on any hotlist
-    hotlist_match = db.query(Hotlist).filter(Hotlist.license_plate == anpr_read.license_plate).first()
-    if hotlist_match:
-        db_anpr_read.hotlist_match = True
-        db_anpr_read.hotlist_id = hotlist_match.id
+    db_anpr_read = ANPRRead(**dict(anpr_read.model_dump(), **geo_fields(anpr_read.latitude, anpr_read.longitude)))
+    if duplicate:
+        db_anpr_read.duplicate_of_id = entry.read_id
     
-    db.add(db_anpr_read)
-    db.commit()
+    # Check for hotlist match
+    apply_hotlist_match(db_anpr_read)
+    
+    try:
+        with stage_timer("db_insert"):
+            db.add(db_anpr_read)
+            db.flush()
+        with stage_timer("commit"):
+            db.commit()
+    except Exception:
+        if not duplicate:
+            capture_deduplicator.release(entry)
+        raise
     db.refresh(db_anpr_read)
+    if entry and not duplicate:
+        capture_deduplicator.stored(entry, db_anpr_read.id)
+    
+    camera_monitor.record_read(
+        db_anpr_read.camera_id, db_anpr_read.confidence, db_anpr_read.timestamp,
+        has_images=bool(db_anpr_read.plate_image_path or db_anpr_read.context_image_path)
+    )
     
     # Convert to response model
     anpr_response = ANPRReadResponse.model_validate(db_anpr_read)
@@ -396,7 +744,7 @@ async def ingest_anpr_read_with_images(
     # This endpoint can be simplified or removed if not needed
     raise HTTPException(status_code=501, detail="Endpoint not implemented")
 
-@app.get("/anpr/reads", response_model=List[ANPRReadResponse])
+@app.get("/anpr/reads", response_model=List[ANPRReadResponse], response_class=FastJSONResponse)
 async def get_anpr_reads(
     skip: int = 0, 
     limit: int = 100, 
@@ -405,7 +753,8 @@ async def get_anpr_reads(
     db: Session = Depends(get_db)
 ):
     """Get ANPR reads with optional filtering"""
-    query = db.query(ANPRRead)
+    # Column tuples serialized directly, skipping ORM hydration and response validation
+    query = read_query(db)
     
     if hotlist_only:
         query = query.filter(ANPRRead.hotlist_match == True)
@@ -417,17 +766,320 @@ async def get_anpr_reads(
             ANPRRead.location.ilike(f"%{search}%")
         )
     
-    anpr_reads = query.order_by(ANPRRead.timestamp.desc()).offset(skip).limit(limit).all()
-    return anpr_reads
+    rows = query.order_by(ANPRRead.timestamp.desc()).offset(skip).limit(limit).all()
+    return FastJSONResponse(rows_to_dicts(READ_FIELDS, rows))
+
+# Area queries: geohash cells covering the area, then exact coordinates (geo.py)
+def reads_in_bbox_query(db: Session, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                        start: Optional[datetime], end: Optional[datetime]):
+    """Reads with a GPS fix inside a bounding box and time window, newest first"""
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="min_lat/min_lon must not be greater than max_lat/max_lon")
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    cells, exact = covering_cells(min_lat, min_lon, max_lat, max_lon)
+    query = read_query(db).filter(
+        cell_filter(ANPRRead.geo_cell, cells, exact),
+        ANPRRead.latitude.between(min_lat, max_lat),
+        ANPRRead.longitude.between(min_lon, max_lon)
+    )
+    if start:
+        query = query.filter(ANPRRead.timestamp >= start)
+    if end:
+        query = query.filter(ANPRRead.timestamp <= end)
+    return query.order_by(ANPRRead.timestamp.desc())
+
+@app.get("/anpr/reads/within", response_model=List[ANPRReadResponse], response_class=FastJSONResponse)
+async def get_anpr_reads_within(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """Get ANPR reads captured inside a bounding box, optionally within a time window"""
+    rows = reads_in_bbox_query(db, min_lat, min_lon, max_lat, max_lon, start, end).limit(limit).all()
+    return FastJSONResponse(rows_to_dicts(READ_FIELDS, rows))
+
+@app.get("/anpr/reads/near", response_class=FastJSONResponse)
+async def get_anpr_reads_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(..., gt=0, le=100000),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """Get ANPR reads captured within radius_m metres of a point, newest first, with their distance"""
+    query = reads_in_bbox_query(db, *radius_bbox(lat, lon, radius_m), start, end)
+    
+    # The box's corners lie outside the circle, so filter while streaming until the page is full
+    results = []
+    for row in query.yield_per(500):
+        distance = distance_m(lat, lon, row.latitude, row.longitude)
+        if distance <= radius_m:
+            read = dict(zip(READ_FIELDS, row))
+            read["distance_m"] = round(distance, 1)
+            results.append(read)
+            if len(results) >= limit:
+                break
+    return FastJSONResponse(results)
+
+def last_seen_response(vrms: List[str], start_time: Optional[datetime], end_time: Optional[datetime],
+                       format: str) -> StreamingResponse:
+    """Streamed latest sighting and sighting count of each VRM"""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    if not vrms:
+        raise HTTPException(status_code=400, detail="No VRMs given")
+    if len(vrms) > LAST_SEEN_MAX_VRMS:
+        raise HTTPException(status_code=413, detail=f"At most {LAST_SEEN_MAX_VRMS} VRMs per lookup")
+    
+    headers = {"X-VRM-Count": str(len(vrms))}
+    if format == "csv":
+        headers["Content-Disposition"] = 'attachment; filename="last_seen.csv"'
+    return StreamingResponse(
+        iter_last_seen(vrms, start_time, end_time, format),
+        media_type="text/csv" if format == "csv" else NDJSON_MEDIA_TYPE,
+        headers=headers
+    )
+
+@app.post("/anpr/reads/last-seen")
+async def lookup_last_seen(lookup: LastSeenLookup, format: str = "ndjson"):
+    """
+    Latest read and sighting count (within start_time/end_time) of each VRM in a list,
+    resolved with one join against the reads. One NDJSON line (or CSV row with
+    format=csv) per distinct VRM in the order given; sightings 0 for VRMs not seen.
+    """
+    return last_seen_response(normalise_vrms(lookup.vrms), lookup.start_time, lookup.end_time, format)
+
+@app.post("/anpr/reads/last-seen/upload")
+async def lookup_last_seen_upload(
+    file: UploadFile = File(...),
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    format: str = "ndjson"
+):
+    """As /anpr/reads/last-seen, for an uploaded list: one VRM per line or a CSV with VRMs in the first column"""
+    try:
+        vrms = parse_vrm_list(await file.read())
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="VRM list must be UTF-8 text")
+    return last_seen_response(vrms, start_time, end_time, format)
 
 @app.get("/anpr/reads/{read_id}", response_model=ANPRReadResponse)
 async def get_anpr_read(read_id: int, db: Session = Depends(get_db)):
-    """Get a specific ANPR read by ID"""
+    """Get a specific ANPR read by ID (image paths point at the archive once the images are tiered)"""
     anpr_read = db.query(ANPRRead).filter(ANPRRead.id == read_id).first()
     if not anpr_read:
         raise HTTPException(status_code=404, detail="ANPR read not found")
+    
+    # Archived after the read was loaded: hand out the archive path rather than a dead one
+    moved = {}
+    for column in ("plate_image_path", "context_image_path"):
+        path = getattr(anpr_read, column)
+        if path and not path.startswith(ARCHIVE_PATH_PREFIX) and not Path(path).is_file():
+            key = archive_key(Path(path).name)
+            if key is not None and archive_file(key) is not None:
+                moved[column] = ARCHIVE_PATH_PREFIX + key
+    if moved:
+        return ANPRReadResponse.model_validate(anpr_read).model_copy(update=moved)
     return anpr_read
 
+# API Routes - Analysis
+@app.post("/api/analysis/convoy", response_model=ConvoyAnalysisResponse)
+async def create_convoy_analysis(
+    analysis_request: ConvoyAnalysisCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """Queue a co-travelling vehicle analysis for a target VRM"""
+    if analysis_request.start_time and analysis_request.end_time and analysis_request.start_time > analysis_request.end_time:
+        raise HTTPException(status_code=400, detail="start_time must be before end_time")
+    
+    analysis = ConvoyAnalysis(
+        target_vrm=analysis_request.target_vrm.strip().upper(),
+        window_seconds=analysis_request.window_seconds,
+        start_time=analysis_request.start_time,
+        end_time=analysis_request.end_time,
+        min_cameras=analysis_request.min_cameras,
+        max_results=analysis_request.max_results,
+        status="pending"
+    )
+    db.add(analysis)
+    db.commit()
+    db.refresh(analysis)
+    
+    # Runs after the response is sent, with its own session
+    background_tasks.add_task(run_convoy_analysis, analysis.id)
+    
+    return analysis
+
+@app.get("/api/analysis/convoy", response_model=List[ConvoyAnalysisResponse])
+async def get_convoy_analyses(
+    skip: int = 0,
+    limit: int = 20,
+    target_vrm: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Get convoy analyses, most recent first"""
+    query = db.query(ConvoyAnalysis)
+    
+    if target_vrm:
+        query = query.filter(ConvoyAnalysis.target_vrm == target_vrm.strip().upper())
+    
+    return query.order_by(ConvoyAnalysis.created_at.desc()).offset(skip).limit(limit).all()
+
+@app.get("/api/analysis/convoy/{analysis_id}", response_model=ConvoyAnalysisResponse)
+async def get_convoy_analysis(analysis_id: int, db: Session = Depends(get_db)):
+    """Get a convoy analysis with its ranked candidates"""
+    analysis = db.query(ConvoyAnalysis).filter(ConvoyAnalysis.id == analysis_id).first()
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Convoy analysis not found")
+    return analysis
+
+# API Routes - Camera Health
+@app.get("/api/cameras/health", response_model=CameraHealthSummary)
+async def get_camera_health(alerts_only: bool = False):
+    """Get per-camera health and throughput stats, flagged cameras first"""
+    cameras = camera_monitor.get_all()
+    
+    summary = CameraHealthSummary(
+        total_cameras=len(cameras),
+        alerting_cameras=sum(1 for c in cameras if c["status"] == "alert"),
+        silent_cameras=sum(1 for c in cameras if "silent" in c["flags"]),
+        low_confidence_cameras=sum(1 for c in cameras if "low_confidence" in c["flags"]),
+        cameras=[c for c in cameras if c["status"] == "alert"] if alerts_only else cameras
+    )
+    return summary
+
+@app.get("/api/cameras/{camera_id}/health", response_model=CameraHealth)
+async def get_single_camera_health(camera_id: str):
+    """Get health stats for a specific camera"""
+    camera = camera_monitor.get_camera(camera_id)
+    if not camera:
+        raise HTTPException(status_code=404, detail="No reads recorded for this camera")
+    return camera
+
+# API Routes - Fleet Hotlist Sync
+@app.get("/api/fleet/sync", response_model=FleetSyncSummary)
+async def get_fleet_sync(
+    status: str = "alert",
+    limit: int = Query(100, ge=1, le=10000)
+):
+    """
+    Hotlist sync state of the device fleet: counts, devices on the latest revision
+    of each active group, and the devices with the given status (alert: behind or
+    silent), longest out of sync first
+    """
+    if status not in FLEET_DEVICE_STATUSES:
+        raise HTTPException(status_code=400, detail="status must be alert, behind, stale, silent or all")
+    return fleet_monitor.summary(status, limit)
+
+@app.get("/api/fleet/devices/{source_id}", response_model=FleetDeviceSync)
+async def get_fleet_device(source_id: str):
+    """Sync state of one device, with its acknowledged revision of each active group"""
+    device = fleet_monitor.get_device(source_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="No hotlist polls or acknowledgements recorded for this device")
+    return device
+
+# API Routes - Hotlist Allocation
+@app.get("/api/hotlist-groups/{group_id}/allocation-rules", response_model=List[HotlistAllocationRuleResponse])
+async def get_allocation_rules(group_id: int, db: Session = Depends(get_db)):
+    """Allocation rules of a hotlist group (none: allocated to every device)"""
+    if not db.query(HotlistGroup.id).filter(HotlistGroup.id == group_id).first():
+        raise HTTPException(status_code=404, detail="Hotlist group not found")
+    return db.query(HotlistAllocationRule).filter(
+        HotlistAllocationRule.hotlist_group_id == group_id
+    ).order_by(HotlistAllocationRule.id).all()
+
+@app.post("/api/hotlist-groups/{group_id}/allocation-rules", response_model=HotlistAllocationRuleResponse)
+async def create_allocation_rule(group_id: int, rule: HotlistAllocationRuleCreate, db: Session = Depends(get_db)):
+    """
+    Allocate a hotlist group to the devices matching a rule. Once a group has a
+    rule, devices no rule matches no longer get it.
+    """
+    if rule.match_type not in ALLOCATION_MATCH_TYPES:
+        raise HTTPException(status_code=400, detail="match_type must be device, device_group or force_area")
+    if not db.query(HotlistGroup.id).filter(HotlistGroup.id == group_id).first():
+        raise HTTPException(status_code=404, detail="Hotlist group not found")
+    
+    db_rule = HotlistAllocationRule(hotlist_group_id=group_id, **rule.model_dump())
+    db.add(db_rule)
+    db.commit()
+    db.refresh(db_rule)
+    
+    applied = apply_allocations()
+    logger.info(
+        "Added allocation rule %s=%s to hotlist group %s", rule.match_type, rule.match_value, group_id,
+        extra={"event": "hotlist_allocation.rule_created", "hotlist_group_id": group_id, **applied}
+    )
+    return db_rule
+
+@app.delete("/api/hotlist-groups/{group_id}/allocation-rules/{rule_id}")
+async def delete_allocation_rule(group_id: int, rule_id: int, db: Session = Depends(get_db)):
+    """Delete an allocation rule (a group left without rules goes to every device again)"""
+    db_rule = db.query(HotlistAllocationRule).filter(
+        HotlistAllocationRule.id == rule_id,
+        HotlistAllocationRule.hotlist_group_id == group_id
+    ).first()
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Allocation rule not found")
+    
+    db.delete(db_rule)
+    db.commit()
+    
+    applied = apply_allocations()
+    return {"message": "Allocation rule deleted successfully", **applied}
+
+def device_source_response(device: DeviceSource) -> dict:
+    """A device with the active hotlist groups currently allocated to it"""
+    allocations = allocation_cache.table()
+    return {
+        "source_id": device.source_id,
+        "description": device.description,
+        "device_group": device.device_group,
+        "force_area": device.force_area,
+        "is_active": device.is_active,
+        "last_poll_at": device.last_poll_at,
+        "hotlists": [
+            {
+                "hotlist_name": group.name,
+                "latest_revision": group.revision,
+                "force_area_subset": allocations.subset(device.source_id, group.id),
+            }
+            for group in allocations.allocated(device.source_id, group_revision_cache.snapshot())
+        ],
+    }
+
+@app.get("/api/devices/{source_id}", response_model=DeviceSourceResponse)
+async def get_device_source(source_id: str, db: Session = Depends(get_db)):
+    """A device's attributes and its allocated hotlist groups"""
+    device = db.query(DeviceSource).filter(DeviceSource.source_id == source_id).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return device_source_response(device)
+
+@app.put("/api/devices/{source_id}", response_model=DeviceSourceResponse)
+async def update_device_source(source_id: str, device_update: DeviceSourceUpdate, db: Session = Depends(get_db)):
+    """Set a device's attributes (created if it has not polled yet) and re-evaluate allocations"""
+    device_source_id = get_or_create_device_source_id(db, source_id)
+    device = db.query(DeviceSource).filter(DeviceSource.id == device_source_id).first()
+    
+    for field, value in device_update.model_dump(exclude_unset=True).items():
+        setattr(device, field, value)
+    db.commit()
+    db.refresh(device)
+    
+    apply_allocations()
+    return device_source_response(device)
+
 # API Routes - Statistics
 @app.get("/api/stats")
 async def get_stats(db: Session = Depends(get_db)):
@@ -443,6 +1095,97 @@ async def get_stats(db: Session = Depends(get_db)):
         "match_rate": (hotlist_matches / total_reads * 100) if total_reads > 0 else 0
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for this worker process"""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Admin - Request Profiling
+@app.get("/admin/profiling")
+async def get_profiling_settings():
+    """Current profiling settings for this worker"""
+    return request_profiler.settings()
+
+@app.put("/admin/profiling")
+async def update_profiling_settings(settings: ProfilingSettingsUpdate):
+    """Change the profiling sample rate and path filter for this worker without a restart"""
+    request_profiler.configure(settings.sample_rate, settings.path_prefix)
+    logger.info("Profiling sample rate set to %s for %s", settings.sample_rate, settings.path_prefix or "all paths",
+                extra={"event": "profiling.configured"})
+    return request_profiler.settings()
+
+@app.get("/admin/profiles")
+async def list_profiles():
+    """Recent request profiles, newest first (summary only)"""
+    return request_profiler.list()
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: int):
+    """A request profile with its top functions and SQL statements"""
+    profile = request_profiler.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found (it may have been evicted)")
+    return profile
+
+@app.delete("/admin/profiles")
+async def clear_profiles():
+    """Discard all stored profiles"""
+    request_profiler.clear()
+    return {"message": "Profiles cleared"}
+
+# Admin - Hotlist Weeding
+@app.get("/admin/weeding")
+async def get_weeding_status():
+    """Weeding schedule and the last run in this worker"""
+    return hotlist_weeder.status()
+
+@app.post("/admin/weeding/run")
+async def run_weeding():
+    """Weed hotlist entries past their weed date now, without waiting for the schedule"""
+    return await run_in_threadpool(hotlist_weeder.run_once)
+
+@app.get("/admin/weeding/log", response_model=List[HotlistWeedLogResponse])
+async def get_weed_log(limit: int = 100, group_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Most recently weeded hotlist entries first"""
+    query = db.query(HotlistWeedLog)
+    if group_id is not None:
+        query = query.filter(HotlistWeedLog.hotlist_group_id == group_id)
+    return query.order_by(HotlistWeedLog.id.desc()).limit(limit).all()
+
+@app.get("/admin/images/reconcile")
+async def get_image_reconcile_status():
+    """Upload store reconciliation: schedule, the pass in progress in this worker, and the last pass"""
+    return image_reconciler.status()
+
+@app.post("/admin/images/reconcile/run", status_code=202)
+async def run_image_reconcile():
+    """Start a reconciliation pass in the background (resuming an interrupted one)"""
+    if not image_reconciler.trigger():
+        raise HTTPException(status_code=409, detail="A reconciliation pass is already running")
+    return image_reconciler.status()
+
+@app.get("/admin/images/tiering")
+async def get_image_tiering_status():
+    """Image tiering: thresholds, the pass in progress in this worker, and the last pass"""
+    return image_tiering.status()
+
+@app.post("/admin/images/tiering/run", status_code=202)
+async def run_image_tiering():
+    """Start a tiering pass in the background"""
+    if not image_tiering.trigger():
+        raise HTTPException(status_code=409, detail="A tiering pass is already running")
+    return image_tiering.status()
+
+@app.get("/admin/ingest-scheduler")
+async def get_ingest_scheduler_status():
+    """Ingest lanes of this worker: live and backlog writes in flight and backlog waiting, by source"""
+    return ingest_scheduler.status()
+
+@app.get("/admin/ingest-journal")
+async def get_ingest_journal_status():
+    """Ingest journal of this worker (INGEST_MODE=journal): positions written and applied, lag"""
+    return ingest_journal.status()
+
 # BOF Hotlist Synchronization Endpoints
 @app.get("/bof/services/UpdateHotlistsService/getHotlistRepoStatus")
 async def get_hotlist_repo_status(
@@ -460,17 +1203,31 @@ async def get_hotlist_repo_status(
 @app.get("/bof/services/UpdateHotlistsService/getHotlistStatus")
 async def get_hotlist_status(
     sourceID: str,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ) -> List[BofHotlistRevisions]:
     """
     BOF: Get hotlist status for a specific source
-    Returns array of BofHotlistRevisions for all hotlist groups allocated to this source
+    Returns array of BofHotlistRevisions for the active hotlist groups allocated to this source.
+    Supports If-None-Match: 304 when none of the device's allocated groups and none of its
+    acknowledged revisions have changed since its last poll.
     """
+    fleet_monitor.record_poll(sourceID)
+    allocations = allocation_cache.table()
+    allocated = allocations.allocated(sourceID, group_revision_cache.snapshot())
+    etag = hotlist_status_etag(revisions_tag(allocated), fleet_monitor.ack_tag(sourceID))
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    
     # Get or create the device source
-    device_source = get_or_create_device_source(db, sourceID)
+    device_source_id = get_or_create_device_source_id(db, sourceID)
     
-    # Get all active hotlist groups
-    hotlist_groups = db.query(HotlistGroup).filter(HotlistGroup.is_active == True).all()
+    # Get the active hotlist groups allocated to the device
+    hotlist_groups = [
+        group for group in db.query(HotlistGroup).filter(HotlistGroup.is_active == True).order_by(HotlistGroup.id)
+        if allocations.is_allocated(sourceID, group.id)
+    ]
     
     result = []
     for group in hotlist_groups:
@@ -478,7 +1235,7 @@ async def get_hotlist_status(
         hotlist_name = group.name
         
         # Get or create revision tracking for this group
-        revision = get_or_create_hotlist_revision(db, group.id, device_source.id, hotlist_name)
+        revision = get_or_create_hotlist_revision(db, group.id, device_source_id, hotlist_name)
         
         # Update latest revision from group
         revision.latest_revision = group.revision
@@ -491,64 +1248,161 @@ async def get_hotlist_status(
             is_allocated=revision.is_allocated
         ))
     
+    response.headers["ETag"] = hotlist_status_etag(revisions_tag(hotlist_groups), fleet_monitor.ack_tag(sourceID))
+    response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
     return result
 
 @app.post("/bof/services/UpdateHotlistsService/setHotlistStatus")
 async def set_hotlist_status(
-    request: Request,
+    request: BofSetHotlistStatusRequest,
     db: Session = Depends(get_db)
 ):
     """
     BOF: Set hotlist status for a specific source
-    Simplified implementation for BOF compatibility
+    Records the revision the device holds of each hotlist (hotlistsAndRevisions,
+    or a single hotlistname and externalSystemRevision) as its external_system_revision
     """
-    # For now, return a simple success response
-    return {"status": "success", "message": "Hotlist status updated"}
+    acknowledgements = request.acknowledgements()
+    if not acknowledgements:
+        raise HTTPException(status_code=400, detail="hotlistsAndRevisions or hotlistname and externalSystemRevision required")
+    
+    source_id = str(request.sourceID)
+    device_source_id = get_or_create_device_source_id(db, source_id)
+    snapshot = group_revision_cache.snapshot()
+    allocations = allocation_cache.table()
+    
+    acknowledged = {}
+    unknown_hotlists = []
+    for acknowledgement in acknowledgements:
+        group = snapshot.by_name.get(acknowledgement.hotlistName)
+        if group is None:
+            # Deleted here, or never known
+            unknown_hotlists.append(acknowledgement.hotlistName)
+            continue
+        revision = get_or_create_hotlist_revision(db, group.id, device_source_id, group.name,
+                                                  allocations.is_allocated(source_id, group.id))
+        revision.external_system_revision = acknowledgement.currentRevision
+        acknowledged[group.id] = acknowledgement.currentRevision
+    db.commit()
+    
+    if acknowledged:
+        fleet_monitor.record_ack(source_id, acknowledged)
+        # Other workers pick the acknowledgement up for their fleet view and status ETags
+        invalidation_channel.publish(FLEET_SYNC)
+    
+    return {
+        "status": "success",
+        "message": "Hotlist status updated",
+        "updated": len(acknowledged),
+        "unknown_hotlists": unknown_hotlists
+    }
 
 # BOF Hotlist Updates Endpoints
-@app.get("/bof/services/UpdateHotlistsService/getHotlistUpdates")
-async def get_hotlist_updates(
-    sourceID: str,
-    hotlistname: str,
-    db: Session = Depends(get_db)
-) -> BofHotlistData:
-    """
-    BOF: Get hotlist updates for a specific hotlist group
-    Returns BofHotlistData with ZIP file containing all vehicles in the group
-    """
-    # Find the hotlist group by name
+def find_hotlist_group(db: Session, hotlistname: str) -> HotlistGroup:
+    """Hotlist group by name, 404 if it does not exist"""
     hotlist_group = db.query(HotlistGroup).filter(HotlistGroup.name == hotlistname).first()
     if not hotlist_group:
         raise HTTPException(status_code=404, detail="Hotlist group not found")
+    return hotlist_group
+
+def find_allocated_hotlist_group(db: Session, source_id: str, hotlistname: str) -> HotlistGroup:
+    """Hotlist group by name, 404 if it does not exist or is not allocated to the device"""
+    hotlist_group = find_hotlist_group(db, hotlistname)
+    if not allocation_cache.table().is_allocated(source_id, hotlist_group.id):
+        raise HTTPException(status_code=404, detail="Hotlist group not allocated to this device")
+    return hotlist_group
+
+def build_hotlist_zip(db: Session, source_id: str, hotlist_group: HotlistGroup) -> bytes:
+    """ZIP of every active vehicle in the group (or the device's force area subset), as sent to the device"""
+    hotlistname = hotlist_group.name
     
     # Get device source
-    device_source = get_or_create_device_source(db, sourceID)
+    device_source_id = get_or_create_device_source_id(db, source_id)
     
     # Get or create revision tracking for this group
-    revision = get_or_create_hotlist_revision(db, hotlist_group.id, device_source.id, hotlistname)
+    revision = get_or_create_hotlist_revision(db, hotlist_group.id, device_source_id, hotlistname)
     
     # Get all active vehicles in this group
     vehicles = db.query(Hotlist).filter(
         Hotlist.hotlist_group_id == hotlist_group.id,
         Hotlist.is_active == True
-    ).all()
+    )
+    
+    # A shared group narrowed to the device's force area by its allocation rule
+    subset = allocation_cache.table().subset(source_id, hotlist_group.id)
+    if subset is not None:
+        vehicles = vehicles.filter(
+            (Hotlist.force_area == subset) | (Hotlist.force_area == None) | (Hotlist.force_area == "")
+        )
     
     # Generate CSV data for all vehicles in the group
-    csv_data = generate_hotlist_csv_data(vehicles)
+    csv_data = generate_hotlist_csv_data(vehicles.all())
     
     # Create ZIP file with hotlist data
-    zip_data = create_hotlist_zip(hotlistname, sourceID, csv_data)
+    return create_hotlist_zip(hotlistname, source_id, csv_data)
+
+def build_hotlist_update(db: Session, source_id: str, hotlist_group: HotlistGroup) -> BofHotlistData:
+    """BofHotlistData with a ZIP of every active vehicle in the group"""
+    zip_data = build_hotlist_zip(db, source_id, hotlist_group)
     
     # Encode binary data as base64 for JSON response
     zip_data_b64 = base64.b64encode(zip_data).decode('utf-8')
     
     return BofHotlistData(
-        hotlist_name=hotlistname,
+        hotlist_name=hotlist_group.name,
         latest_revision=hotlist_group.revision,
         hotlist_deltas=zip_data_b64,
         is_file_too_big=False
     )
 
+def hotlist_zip_headers(hotlist_group: HotlistGroup) -> dict:
+    """Hotlist name (percent-encoded) and revision for a binary hotlist body or part"""
+    return {"X-Hotlist-Name": quote(hotlist_group.name), "X-Latest-Revision": str(hotlist_group.revision)}
+
+def hotlist_zip_filename(source_id: str, hotlist_group: HotlistGroup) -> str:
+    return quote(f"{source_id}_{hotlist_group.name}.zip")
+
+@app.get("/bof/services/UpdateHotlistsService/getHotlistUpdates")
+async def get_hotlist_updates(
+    sourceID: str,
+    hotlistname: str,
+    request: Request,
+    response: Response,
+    format: Optional[str] = None,
+    db: Session = Depends(get_db)
+) -> BofHotlistData:
+    """
+    BOF: Get hotlist updates for a specific hotlist group
+    Returns BofHotlistData with ZIP file containing all vehicles in the group,
+    or the raw ZIP with format=binary or Accept: application/zip. 404 for groups
+    not allocated to the device.
+    Supports If-None-Match: 304 while the group's revision is unchanged.
+    """
+    fleet_monitor.record_poll(sourceID)
+    binary = wants_binary(format, request.headers.get("accept"), ZIP_MEDIA_TYPE)
+    allocations = allocation_cache.table()
+    cached = group_revision_cache.snapshot().by_name.get(hotlistname)
+    if cached and allocations.is_allocated(sourceID, cached.id):
+        etag = hotlist_group_etag(cached.id, cached.revision, binary, allocations.subset(sourceID, cached.id))
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag, vary="Accept")
+    
+    hotlist_group = find_allocated_hotlist_group(db, sourceID, hotlistname)
+    headers = {
+        "ETag": hotlist_group_etag(hotlist_group.id, hotlist_group.revision, binary,
+                                   allocations.subset(sourceID, hotlist_group.id)),
+        "Cache-Control": REVALIDATE_CACHE_CONTROL,
+        "Vary": "Accept",
+    }
+    if binary:
+        zip_data = build_hotlist_zip(db, sourceID, hotlist_group)
+        return zip_response(zip_data, hotlist_zip_filename(sourceID, hotlist_group),
+                            dict(headers, **hotlist_zip_headers(hotlist_group)))
+    
+    update = build_hotlist_update(db, sourceID, hotlist_group)
+    response.headers.update(headers)
+    return update
+
 @app.get("/bof/services/UpdateHotlistsService/getHotlistUpdatesRestrictSize")
 async def get_hotlist_updates_restrict_size(
     sourceID: str,
@@ -560,28 +1414,13 @@ async def get_hotlist_updates_restrict_size(
     BOF: Get hotlist updates with size restriction for a specific hotlist group
     Returns BofHotlistData with ZIP file containing updates or too_big flag
     """
-    # Find the hotlist group by name
-    hotlist_group = db.query(HotlistGroup).filter(HotlistGroup.name == hotlistname).first()
-    if not hotlist_group:
-        raise HTTPException(status_code=404, detail="Hotlist group not found")
+    fleet_monitor.record_poll(sourceID)
     
-    # Get device source
-    device_source = get_or_create_device_source(db, sourceID)
-    
-    # Get or create revision tracking for this group
-    revision = get_or_create_hotlist_revision(db, hotlist_group.id, device_source.id, hotlistname)
-    
-    # Get all active vehicles in this group
-    vehicles = db.query(Hotlist).filter(
-        Hotlist.hotlist_group_id == hotlist_group.id,
-        Hotlist.is_active == True
-    ).all()
-    
-    # Generate CSV data for all vehicles in the group
-    csv_data = generate_hotlist_csv_data(vehicles)
+    # Find the hotlist group by name
+    hotlist_group = find_allocated_hotlist_group(db, sourceID, hotlistname)
     
     # Create ZIP file with hotlist data
-    zip_data = create_hotlist_zip(hotlistname, sourceID, csv_data)
+    zip_data = build_hotlist_zip(db, sourceID, hotlist_group)
     
     # Check if ZIP file is too big
     if len(zip_data) > size:
@@ -605,30 +1444,46 @@ async def get_hotlist_updates_restrict_size(
 @app.get("/bof/services/UpdateHotlistsService/getMultipleHotlistUpdates")
 async def get_multiple_hotlist_updates(
     sourceid: str,
-    hotlistnames: List[str],
+    request: Request,
+    response: Response,
+    hotlistnames: List[str] = Query(...),
+    format: Optional[str] = None,
     db: Session = Depends(get_db)
 ) -> List[BofHotlistData]:
     """
     BOF: Get updates for multiple hotlists
-    Returns array of BofHotlistData objects
+    Returns array of BofHotlistData objects, or a multipart/mixed body with one
+    raw ZIP part per hotlist with format=binary or Accept: multipart/mixed
     """
-    results = []
+    fleet_monitor.record_poll(sourceid)
+    hotlist_groups = []
     
     for hotlist_name in hotlistnames:
         try:
-            result = await get_hotlist_updates(sourceid, hotlist_name, db)
-            results.append(result)
+            hotlist_groups.append(find_allocated_hotlist_group(db, sourceid, hotlist_name))
         except HTTPException:
-            # Skip hotlists that don't exist
+            # Skip hotlists that don't exist or are not allocated to the device
             continue
     
-    return results
+    if wants_binary(format, request.headers.get("accept"), MULTIPART_MEDIA_TYPE):
+        parts = []
+        for hotlist_group in hotlist_groups:
+            part_headers = {
+                "Content-Type": ZIP_MEDIA_TYPE,
+                "Content-Disposition": f'attachment; filename="{hotlist_zip_filename(sourceid, hotlist_group)}"',
+            }
+            part_headers.update(hotlist_zip_headers(hotlist_group))
+            parts.append((part_headers, build_hotlist_zip(db, sourceid, hotlist_group)))
+        return multipart_response(parts, {"Vary": "Accept"})
+    
+    response.headers["Vary"] = "Accept"
+    return [build_hotlist_update(db, sourceid, hotlist_group) for hotlist_group in hotlist_groups]
 
 @app.get("/bof/services/UpdateHotlistsService/getMultipleHotlistUpdatesRestrictSize")
 async def get_multiple_hotlist_updates_restrict_size(
     sourceid: str,
-    hotlistnames: List[str],
     size: int,
+    hotlistnames: List[str] = Query(...),
     db: Session = Depends(get_db)
 ) -> List[BofHotlistData]:
     """
@@ -642,12 +1497,32 @@ async def get_multiple_hotlist_updates_restrict_size(
             result = await get_hotlist_updates_restrict_size(sourceid, hotlist_name, size, db)
             results.append(result)
         except HTTPException:
-            # Skip hotlists that don't exist
+            # Skip hotlists that don't exist or are not allocated to the device
             continue
     
     return results
 
 # BOF Capture/Input Endpoints
+# With INGEST_MODE=journal each endpoint journals the request and acknowledges it;
+# the journal applier later runs the same process_* function against the database.
+JOURNALED_RESPONSE_MESSAGE = "Capture accepted and journalled for processing"
+
+async def journal_capture(kind: str, request) -> BofCaptureResponse:
+    """Journal a capture request (fsynced) instead of writing it to the database"""
+    try:
+        await ingest_journal.append(kind, request.model_dump())
+    except Exception as e:
+        logger.error("Ingest journal append failed: %s", e, extra={"event": "journal.append_failed", "kind": kind})
+        raise HTTPException(status_code=503, detail="Capture could not be journalled, retry later")
+    return BofCaptureResponse(success=True, message=JOURNALED_RESPONSE_MESSAGE, read_id=None)
+
+def compact_capture_lane(captures: List[str]):
+    """(ingest lane, source ID) of compact capture strings; live if any of them is live"""
+    fields = [capture.split('|') for capture in captures]
+    lanes = {ingest_scheduler.lane_for_date(parts[6] if len(parts) > 6 else None) for parts in fields}
+    source = next((parts[4].strip() for parts in fields if len(parts) > 4), None)
+    return (LIVE if LIVE in lanes or not lanes else BACKLOG), source
+
 @app.post("/bof/services/InputCaptureWebService/sendCapture", response_model=BofCaptureResponse)
 async def bof_send_capture(
     request: BofSendCaptureRequest,
@@ -657,9 +1532,50 @@ async def bof_send_capture(
     BOF: Send complete capture record to BOF system
     Creates an ANPR read from the full capture data with image support
     """
+    if ingest_journal.enabled:
+        return await journal_capture("sendCapture", request)
+    async with ingest_scheduler.admit(ingest_scheduler.lane_for_date(request.captureDate), request.sourceID):
+        return await run_in_threadpool(process_send_capture, request, db)
+
+def process_send_capture(request: BofSendCaptureRequest, db: Session) -> BofCaptureResponse:
+    """Store a sendCapture request (in the request, or from the ingest journal)"""
+    entry, duplicate = None, False
     try:
         # Parse capture date
-        capture_time = datetime.fromisoformat(request.captureDate.replace('Z', '+00:00'))
+        with stage_timer("parse"):
+            capture_time = datetime.fromisoformat(request.captureDate.replace('Z', '+00:00'))
+        
+        # A resend of a capture GUID we already stored
+        if request.captureGUID:
+            existing = capture_correlator.lookup(request.captureGUID)
+            existing_id = existing.read_id if existing else db.query(ANPRRead.id).filter(
+                ANPRRead.capture_guid == request.captureGUID
+            ).scalar()
+            if existing_id is not None:
+                return BofCaptureResponse(
+                    success=True,
+                    message=f"Capture {request.captureGUID} already received",
+                    read_id=existing_id
+                )
+        
+        # Suppress resent / multi-camera duplicates
+        with stage_timer("dedup"):
+            entry, duplicate = capture_deduplicator.claim(
+                request.vrm, str(request.cameraID), str(request.sourceID), capture_time
+            )
+        if duplicate and capture_deduplicator.mode != "tag":
+            response = duplicate_capture_response(
+                db, entry, request.vrm,
+                confidence=request.confidencePercentage,
+                plate_image=request.plateImage,
+                overview_image=request.overviewImage
+            )
+            if request.captureGUID and response.read_id is not None:
+                # Images sent against the duplicate's GUID belong to the original read
+                capture_correlator.remember(request.captureGUID, response.read_id, str(request.cameraID), has_images=True)
+                attach_pending_images(db, {request.captureGUID: response.read_id})
+                db.commit()
+            return response
         
         # Create ANPR read record
         anpr_read = ANPRRead(
@@ -670,68 +1586,72 @@ async def bof_send_capture(
             confidence=request.confidencePercentage or 0,
             direction=None,
             speed=None,
-            lane=None
+            lane=None,
+            capture_guid=request.captureGUID,
+            duplicate_of_id=capture_deduplicator.wait_stored(entry) if duplicate else None,
+            **geo_fields(request.latitude, request.longitude)
         )
         
         # Check for hotlist match
-        hotlist_match = db.query(Hotlist).filter(Hotlist.license_plate == request.vrm).first()
-        if hotlist_match:
-            anpr_read.hotlist_match = True
-            anpr_read.hotlist_id = hotlist_match.id
+        apply_hotlist_match(anpr_read)
         
         # Save to database first to get the ID
-        db.add(anpr_read)
-        db.commit()
+        with stage_timer("db_insert"):
+            db.add(anpr_read)
+            db.flush()
+        with stage_timer("commit"):
+            db.commit()
         db.refresh(anpr_read)
+        if entry and not duplicate:
+            capture_deduplicator.stored(entry, anpr_read.id)
         
         # Process plate image if provided
         if request.plateImage:
             try:
-                # Decode base64 image
-                image_data = base64.b64decode(request.plateImage)
-                
-                # Generate filename
-                filename = f"plate_{uuid.uuid4()}.jpg"
-                filepath = UPLOAD_DIR / filename
-                
-                # Save image
-                with open(filepath, "wb") as f:
-                    f.write(image_data)
-                
-                # Update ANPR read with image path
-                anpr_read.plate_image_path = str(filepath)
-                
-                logger.info(f"BOF sendCapture: Saved plate image for plate {request.vrm}")
-                
+                anpr_read.plate_image_path = save_capture_image(request.plateImage, "plate")
             except Exception as e:
-                logger.error(f"Error processing plate image: {str(e)}")
+                logger.error("Error processing plate image for plate %s: %s", request.vrm, e,
+                             extra={"event": "capture.image_failed", "vrm": request.vrm, "image_type": "P"})
         
         # Process overview image if provided
         if request.overviewImage:
             try:
-                # Decode base64 image
-                image_data = base64.b64decode(request.overviewImage)
-                
-                # Generate filename
-                filename = f"context_{uuid.uuid4()}.jpg"
-                filepath = UPLOAD_DIR / filename
-                
-                # Save image
-                with open(filepath, "wb") as f:
-                    f.write(image_data)
-                
-                # Update ANPR read with context image path
-                anpr_read.context_image_path = str(filepath)
-                
-                logger.info(f"BOF sendCapture: Saved overview image for plate {request.vrm}")
-                
+                anpr_read.context_image_path = save_capture_image(request.overviewImage, "context")
             except Exception as e:
-                logger.error(f"Error processing overview image: {str(e)}")
+                logger.error("Error processing overview image for plate %s: %s", request.vrm, e,
+                             extra={"event": "capture.image_failed", "vrm": request.vrm, "image_type": "C"})
         
         # Update database with image paths
-        db.commit()
+        with stage_timer("commit"):
+            db.commit()
+        
+        # Join images that arrived (addBinaryCaptureData) before this capture, now that it is committed
+        if request.captureGUID:
+            _, unused = attach_pending_images(db, {request.captureGUID: anpr_read.id}, replace=False)
+            with stage_timer("commit"):
+                db.commit()
+            remove_unused_images(unused)
+        
+        if request.captureGUID:
+            capture_correlator.remember(
+                request.captureGUID, anpr_read.id, anpr_read.camera_id,
+                has_images=bool(anpr_read.plate_image_path or anpr_read.context_image_path)
+            )
         
-        logger.info(f"BOF sendCapture: Created ANPR read for plate {request.vrm}")
+        camera_monitor.record_read(
+            anpr_read.camera_id, anpr_read.confidence, capture_time,
+            has_images=bool(anpr_read.plate_image_path or anpr_read.context_image_path)
+        )
+        
+        logger.info(
+            "BOF sendCapture: Created ANPR read for plate %s", request.vrm,
+            extra={
+                "event": "capture.stored", "endpoint": "sendCapture", "vrm": request.vrm,
+                "read_id": anpr_read.id, "camera_id": anpr_read.camera_id,
+                "plate_image": anpr_read.plate_image_path is not None,
+                "context_image": anpr_read.context_image_path is not None
+            }
+        )
         
         return BofCaptureResponse(
             success=True,
@@ -740,7 +1660,9 @@ async def bof_send_capture(
         )
         
     except Exception as e:
-        logger.error(f"BOF sendCapture error: {str(e)}")
+        if not duplicate and (entry is None or entry.read_id is None):
+            capture_deduplicator.release(entry)
+        logger.error("BOF sendCapture error: %s", e, extra={"event": "capture.failed", "endpoint": "sendCapture"})
         raise HTTPException(status_code=500, detail=f"Error processing capture: {str(e)}")
 
 @app.post("/bof/services/InputCaptureWebService/sendCompactCapture", response_model=BofCaptureResponse)
@@ -752,33 +1674,49 @@ async def bof_send_compact_capture(
     BOF: Send compact (pipe-delimited) capture record
     Format: signature | username | vrm | feedID | sourceID | cameraID | captureDate | latitude | longitude | cameraPresetPosition | cameraPan | cameraTilt | cameraZoom | confidencePercentage | motionTowardCamera
     """
+    if ingest_journal.enabled:
+        return await journal_capture("sendCompactCapture", request)
+    lane, source = compact_capture_lane([request.capture])
+    async with ingest_scheduler.admit(lane, source):
+        return await run_in_threadpool(process_send_compact_capture, request, db)
+
+def process_send_compact_capture(request: BofSendCompactCaptureRequest, db: Session) -> BofCaptureResponse:
+    """Store a sendCompactCapture request (in the request, or from the ingest journal)"""
+    entry, duplicate = None, False
     try:
-        # Parse the pipe-delimited capture string
-        parts = request.capture.split('|')
-        if len(parts) < 7:
-            raise HTTPException(status_code=400, detail="Invalid compact capture format")
-        
-        # Extract required fields
-        signature = parts[0].strip()
-        username = parts[1].strip()
-        vrm = parts[2].strip()
-        feed_id = int(parts[3].strip())
-        source_id = int(parts[4].strip())
-        camera_id = int(parts[5].strip())
-        capture_date = parts[6].strip()
-        
-        # Parse optional fields
-        latitude = float(parts[7].strip()) if len(parts) > 7 and parts[7].strip() else None
-        longitude = float(parts[8].strip()) if len(parts) > 8 and parts[8].strip() else None
-        camera_preset = int(parts[9].strip()) if len(parts) > 9 and parts[9].strip() else None
-        camera_pan = parts[10].strip() if len(parts) > 10 else None
-        camera_tilt = parts[11].strip() if len(parts) > 11 else None
-        camera_zoom = parts[12].strip() if len(parts) > 12 else None
-        confidence = int(parts[13].strip()) if len(parts) > 13 and parts[13].strip() else 0
-        motion_toward_camera = parts[14].strip().lower() == 'true' if len(parts) > 14 else None
+        with stage_timer("parse"):
+            # Parse the pipe-delimited capture string
+            parts = request.capture.split('|')
+            if len(parts) < 7:
+                raise HTTPException(status_code=400, detail="Invalid compact capture format")
+            
+            # Extract required fields
+            signature = parts[0].strip()
+            username = parts[1].strip()
+            vrm = parts[2].strip()
+            feed_id = int(parts[3].strip())
+            source_id = int(parts[4].strip())
+            camera_id = int(parts[5].strip())
+            capture_date = parts[6].strip()
+            
+            # Parse optional fields
+            latitude = float(parts[7].strip()) if len(parts) > 7 and parts[7].strip() else None
+            longitude = float(parts[8].strip()) if len(parts) > 8 and parts[8].strip() else None
+            camera_preset = int(parts[9].strip()) if len(parts) > 9 and parts[9].strip() else None
+            camera_pan = parts[10].strip() if len(parts) > 10 else None
+            camera_tilt = parts[11].strip() if len(parts) > 11 else None
+            camera_zoom = parts[12].strip() if len(parts) > 12 else None
+            confidence = int(parts[13].strip()) if len(parts) > 13 and parts[13].strip() else 0
+            motion_toward_camera = parts[14].strip().lower() == 'true' if len(parts) > 14 else None
+            
+            # Parse capture date
+            capture_time = datetime.fromisoformat(capture_date.replace('Z', '+00:00'))
         
-        # Parse capture date
-        capture_time = datetime.fromisoformat(capture_date.replace('Z', '+00:00'))
+        # Suppress resent / multi-camera duplicates
+        with stage_timer("dedup"):
+            entry, duplicate = capture_deduplicator.claim(vrm, str(camera_id), str(source_id), capture_time)
+        if duplicate and capture_deduplicator.mode != "tag":
+            return duplicate_capture_response(db, entry, vrm, confidence=confidence)
         
         # Create ANPR read record
         anpr_read = ANPRRead(
@@ -789,21 +1727,33 @@ async def bof_send_compact_capture(
             confidence=confidence,
             direction=None,
             speed=None,
-            lane=None
+            lane=None,
+            duplicate_of_id=capture_deduplicator.wait_stored(entry) if duplicate else None,
+            **geo_fields(latitude, longitude)
         )
         
         # Check for hotlist match
-        hotlist_match = db.query(Hotlist).filter(Hotlist.license_plate == vrm).first()
-        if hotlist_match:
-            anpr_read.hotlist_match = True
-            anpr_read.hotlist_id = hotlist_match.id
+        apply_hotlist_match(anpr_read)
         
         # Save to database
-        db.add(anpr_read)
-        db.commit()
+        with stage_timer("db_insert"):
+            db.add(anpr_read)
+            db.flush()
+        with stage_timer("commit"):
+            db.commit()
         db.refresh(anpr_read)
+        if entry and not duplicate:
+            capture_deduplicator.stored(entry, anpr_read.id)
+        
+        camera_monitor.record_read(anpr_read.camera_id, confidence, capture_time)
         
-        logger.info(f"BOF sendCompactCapture: Created ANPR read for plate {vrm}")
+        logger.info(
+            "BOF sendCompactCapture: Created ANPR read for plate %s", vrm,
+            extra={
+                "event": "capture.stored", "endpoint": "sendCompactCapture", "vrm": vrm,
+                "read_id": anpr_read.id, "camera_id": anpr_read.camera_id
+            }
+        )
         
         return BofCaptureResponse(
             success=True,
@@ -812,10 +1762,14 @@ async def bof_send_compact_capture(
         )
         
     except ValueError as e:
-        logger.error(f"BOF sendCompactCapture parsing error: {str(e)}")
+        logger.error("BOF sendCompactCapture parsing error: %s", e,
+                     extra={"event": "capture.invalid", "endpoint": "sendCompactCapture"})
         raise HTTPException(status_code=400, detail=f"Error parsing compact capture: {str(e)}")
     except Exception as e:
-        logger.error(f"BOF sendCompactCapture error: {str(e)}")
+        if not duplicate:
+            capture_deduplicator.release(entry)
+        logger.error("BOF sendCompactCapture error: %s", e,
+                     extra={"event": "capture.failed", "endpoint": "sendCompactCapture"})
         raise HTTPException(status_code=500, detail=f"Error processing compact capture: {str(e)}")
 
 @app.post("/bof/services/InputCaptureWebService/sendCompoundCapture", response_model=BofCaptureResponse)
@@ -827,33 +1781,67 @@ async def bof_send_compound_capture(
     BOF: Send multiple compact capture records in a single request
     Maximum 50 captures per request
     """
+    if len(request.captures) > 50:
+        raise HTTPException(status_code=400, detail="Maximum 50 captures per request")
+    if ingest_journal.enabled:
+        return await journal_capture("sendCompoundCapture", request)
+    lane, source = compact_capture_lane(request.captures)
+    async with ingest_scheduler.admit(lane, source, captures=len(request.captures)):
+        return await run_in_threadpool(process_send_compound_capture, request, db)
+
+def process_send_compound_capture(request: BofSendCompoundCaptureRequest, db: Session) -> BofCaptureResponse:
+    """Store a sendCompoundCapture request (in the request, or from the ingest journal)"""
+    claimed = []
     try:
         if len(request.captures) > 50:
             raise HTTPException(status_code=400, detail="Maximum 50 captures per request")
         
         created_reads = []
+        duplicates = 0
+        # Reads from this batch not committed yet, by dedup entry
+        pending_reads = {}
+        # (repeat, original) tagged within this batch, linked once both have IDs
+        tagged = []
         
         for capture_string in request.captures:
-            # Parse the pipe-delimited capture string
-            parts = capture_string.split('|')
-            if len(parts) < 7:
-                logger.warning(f"Skipping invalid compact capture format: {capture_string}")
-                continue
-            
-            # Extract required fields
-            signature = parts[0].strip()
-            username = parts[1].strip()
-            vrm = parts[2].strip()
-            feed_id = int(parts[3].strip())
-            source_id = int(parts[4].strip())
-            camera_id = int(parts[5].strip())
-            capture_date = parts[6].strip()
-            
-            # Parse optional fields
-            confidence = int(parts[13].strip()) if len(parts) > 13 and parts[13].strip() else 0
+            with stage_timer("parse"):
+                # Parse the pipe-delimited capture string
+                parts = capture_string.split('|')
+                if len(parts) < 7:
+                    logger.warning("Skipping invalid compact capture format: %s", capture_string,
+                                   extra={"event": "capture.invalid", "endpoint": "sendCompoundCapture"})
+                    continue
+                
+                # Extract required fields
+                signature = parts[0].strip()
+                username = parts[1].strip()
+                vrm = parts[2].strip()
+                feed_id = int(parts[3].strip())
+                source_id = int(parts[4].strip())
+                camera_id = int(parts[5].strip())
+                capture_date = parts[6].strip()
+                
+                # Parse optional fields
+                latitude = float(parts[7].strip()) if len(parts) > 7 and parts[7].strip() else None
+                longitude = float(parts[8].strip()) if len(parts) > 8 and parts[8].strip() else None
+                confidence = int(parts[13].strip()) if len(parts) > 13 and parts[13].strip() else 0
+                
+                # Parse capture date
+                capture_time = datetime.fromisoformat(capture_date.replace('Z', '+00:00'))
             
-            # Parse capture date
-            capture_time = datetime.fromisoformat(capture_date.replace('Z', '+00:00'))
+            # Suppress resent / multi-camera duplicates
+            with stage_timer("dedup"):
+                entry, duplicate = capture_deduplicator.claim(vrm, str(camera_id), str(source_id), capture_time)
+            if duplicate and capture_deduplicator.mode != "tag":
+                duplicates += 1
+                pending_read = pending_reads.get(id(entry))
+                if pending_read is not None:
+                    if capture_deduplicator.mode == "merge" and confidence > (pending_read.confidence or 0):
+                        pending_read.confidence = confidence
+                else:
+                    # Merged in the batch's transaction; compact captures carry no images
+                    handle_duplicate_capture(db, entry, vrm, confidence, written=[])
+                continue
             
             # Create ANPR read record
             anpr_read = ANPRRead(
@@ -864,123 +1852,411 @@ async def bof_send_compound_capture(
                 confidence=confidence,
                 direction=None,
                 speed=None,
-                lane=None
+                lane=None,
+                **geo_fields(latitude, longitude)
             )
+            if duplicate:
+                tag_duplicate(anpr_read, entry, pending_reads, tagged)
             
             # Check for hotlist match
-            hotlist_match = db.query(Hotlist).filter(Hotlist.license_plate == vrm).first()
-            if hotlist_match:
-                anpr_read.hotlist_match = True
-                anpr_read.hotlist_id = hotlist_match.id
+            apply_hotlist_match(anpr_read)
             
             # Save to database
             db.add(anpr_read)
             created_reads.append(anpr_read)
+            if entry and not duplicate:
+                claimed.append((entry, anpr_read))
+                pending_reads[id(entry)] = anpr_read
         
         # Commit all at once
-        db.commit()
+        with stage_timer("db_insert"):
+            db.flush()
+            for anpr_read, original in tagged:
+                anpr_read.duplicate_of_id = original.id
+        with stage_timer("commit"):
+            db.commit()
         
-        logger.info(f"BOF sendCompoundCapture: Created {len(created_reads)} ANPR reads")
+        for entry, anpr_read in claimed:
+            capture_deduplicator.stored(entry, anpr_read.id)
+        
+        for anpr_read in created_reads:
+            camera_monitor.record_read(anpr_read.camera_id, anpr_read.confidence, anpr_read.timestamp)
+        
+        logger.info(
+            "BOF sendCompoundCapture: Created %d ANPR reads", len(created_reads),
+            extra={"event": "compound.stored", "reads": len(created_reads), "duplicates": duplicates}
+        )
+        
+        message = f"Compound capture processed successfully. Created {len(created_reads)} reads"
+        if duplicates:
+            message += f", {duplicates} duplicates suppressed"
         
         return BofCaptureResponse(
             success=True,
-            message=f"Compound capture processed successfully. Created {len(created_reads)} reads",
+            message=message,
             read_id=None
         )
         
     except Exception as e:
-        logger.error(f"BOF sendCompoundCapture error: {str(e)}")
+        for entry, anpr_read in claimed:
+            if entry.read_id is None:
+                capture_deduplicator.release(entry)
+        logger.error("BOF sendCompoundCapture error: %s", e,
+                     extra={"event": "capture.failed", "endpoint": "sendCompoundCapture"})
         raise HTTPException(status_code=500, detail=f"Error processing compound capture: {str(e)}")
 
-@app.post("/bof/services/InputBinaryDataWebService/addBinaryCaptureData", response_model=BofCaptureResponse)
-async def bof_add_binary_capture_data(
-    request: BofAddBinaryCaptureDataRequest,
+@app.post("/bof/services/InputCaptureWebService/sendCaptureStream")
+async def bof_send_capture_stream(
+    request: Request,
+    results: str = "summary",
+    format: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """
-    BOF: Add binary image data to a previously sent capture record
-    Supports plate (P) and context (C) image types
+    BOF: Bulk upload of buffered captures, any number per request
+    One sendCapture JSON object per line (application/x-ndjson, or format=ndjson) or one
+    compact capture string per line (text/plain, or format=compact). Lines are stored in
+    transactions of BULK_INGEST_CHUNK_LINES as the body arrives. Returns a summary with the
+    numbers of failed lines, or NDJSON per-line results and a summary line with results=lines.
+    """
+    if results not in ("summary", "lines"):
+        raise HTTPException(status_code=400, detail="results must be summary or lines")
+    if format is None:
+        format = "ndjson" if "json" in request.headers.get("content-type", "") else "compact"
+    if format not in ("ndjson", "compact"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or compact")
+    
+    outcome = BulkIngestResult(per_line=results == "lines")
+    chunk = []
+    try:
+        async for line_number, line in iter_lines(request.stream()):
+            chunk.append((line_number, line))
+            if len(chunk) >= BULK_INGEST_CHUNK_LINES:
+                stored = await store_capture_chunk(db, chunk, format, outcome)
+                chunk = []
+                if not stored:
+                    break
+        if chunk:
+            await store_capture_chunk(db, chunk, format, outcome)
+    except ClientDisconnect:
+        summary = outcome.summary()
+        outcome.close()
+        logger.warning(
+            "BOF sendCaptureStream: client disconnected after %d lines", summary["lines"],
+            extra={"event": "stream.disconnected", "lines": summary["lines"], "reads_created": summary["created"]}
+        )
+        return Response(status_code=400)
+    
+    summary = outcome.summary()
+    logger.info(
+        "BOF sendCaptureStream: %d lines, %d reads created", summary["lines"], summary["created"],
+        extra={
+            "event": "stream.stored", "lines": summary["lines"], "reads_created": summary["created"],
+            "duplicates": summary["duplicates"], "journalled": summary["journalled"],
+            "errors": summary["errors"], "chunks": summary["chunks"], "aborted": outcome.aborted is not None
+        }
+    )
+    # Lines before resume_from_line are stored; the rest can be resent
+    status_code = 200 if outcome.aborted is None else 503
+    if results == "lines":
+        return StreamingResponse(outcome.iter_ndjson(), media_type=NDJSON_MEDIA_TYPE, status_code=status_code)
+    outcome.close()
+    return FastJSONResponse(summary, status_code=status_code)
+
+def parse_stream_line(line: bytes, format: str):
+    """(journal kind, journal body, capture fields) of one sendCaptureStream line; ValueError if invalid"""
+    if format == "compact":
+        text = line.decode("utf-8")
+        with stage_timer("parse"):
+            fields = parse_compact_capture(text)
+            fields["capture_time"] = datetime.fromisoformat(fields["capture_date"].replace('Z', '+00:00'))
+        return "sendCompactCapture", {"capture": text}, fields
+    
+    with stage_timer("parse"):
+        capture = BofSendCaptureRequest.model_validate_json(line)
+        fields = {
+            "vrm": capture.vrm,
+            "feed_id": capture.feedID,
+            "source_id": capture.sourceID,
+            "camera_id": capture.cameraID,
+            "capture_time": datetime.fromisoformat(capture.captureDate.replace('Z', '+00:00')),
+            "latitude": capture.latitude,
+            "longitude": capture.longitude,
+            "confidence": capture.confidencePercentage or 0,
+            "capture_guid": capture.captureGUID,
+            "plate_image": capture.plateImage,
+            "overview_image": capture.overviewImage,
+        }
+    return "sendCapture", capture.model_dump(), fields
+
+def describe_line_error(error: ValueError) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(str(part) for part in item['loc']) or 'line'}: {item['msg']}"
+                         for item in error.errors())
+    return str(error)
+
+async def store_capture_chunk(db: Session, chunk: list, format: str, outcome: BulkIngestResult) -> bool:
+    """
+    Store one chunk of sendCaptureStream lines in a single transaction (or journal them with
+    INGEST_MODE=journal) and record a result per line. False when the chunk could not be stored.
+    """
+    outcome.chunks += 1
+    # line number -> (status, read ID or the read it will get one from, error)
+    results = {}
+    # id(read) -> (read ID, camera, confidence, timestamp, capture GUID, has images) of reads created
+    stored = {}
+    parsed = []
+    for line_number, line in chunk:
+        if line is None:
+            results[line_number] = (RESULT_ERROR, None, f"Line longer than {BULK_INGEST_MAX_LINE_BYTES} bytes")
+            continue
+        try:
+            parsed.append((line_number, parse_stream_line(line, format)))
+        except ValueError as e:
+            results[line_number] = (RESULT_ERROR, None, describe_line_error(e))
+    
+    if ingest_journal.enabled:
+        try:
+            await asyncio.gather(*(ingest_journal.append(kind, body) for _, (kind, body, _) in parsed))
+        except Exception as e:
+            logger.error("Ingest journal append failed: %s", e, extra={"event": "journal.append_failed", "kind": "sendCaptureStream"})
+            outcome.abort(chunk[0][0], "Captures could not be journalled, retry later")
+            return False
+        for line_number, _ in parsed:
+            results[line_number] = (RESULT_JOURNALLED, None, None)
+    else:
+        # Live if any line is live, so the newest reads at the end of a flush are not held back
+        chunk_lane = LIVE if not parsed or any(ingest_scheduler.lane_for(fields["capture_time"]) == LIVE
+                                               for _, (_, _, fields) in parsed) else BACKLOG
+        source = parsed[0][1][2]["source_id"] if parsed else None
+        async with ingest_scheduler.admit(chunk_lane, source, captures=len(parsed)):
+            try:
+                # Off the event loop, so other requests (and the live lane) are served meanwhile
+                stored = await run_in_threadpool(write_capture_chunk, db, parsed, results)
+            except Exception as e:
+                logger.error("BOF sendCaptureStream error: %s", e,
+                             extra={"event": "capture.failed", "endpoint": "sendCaptureStream"})
+                outcome.abort(chunk[0][0], f"Error storing captures: {str(e)}")
+                return False
+    
+    for line_number, _ in chunk:
+        status, read, error = results[line_number]
+        outcome.record(line_number, status, stored[id(read)][0] if isinstance(read, ANPRRead) else read, error)
+    return True
+
+def write_capture_chunk(db: Session, parsed: list, results: dict) -> dict:
+    """
+    Store parsed sendCaptureStream lines in one transaction, filling in results.
+    Returns id(read) -> (read ID, camera, confidence, timestamp, capture GUID, has images)
+    of the reads created. Blocking: run it in the threadpool.
     """
+    claimed = []
+    created_reads = []
+    # Reads from this chunk not committed yet, by dedup entry
+    pending_reads = {}
+    # (repeat, original) tagged within this chunk, linked once both have IDs
+    tagged = []
+    # Inline images written for this chunk, removed again if it is rolled back
+    written = []
     try:
-        # Parse capture time
-        capture_time = datetime.fromisoformat(request.captureTime.replace('Z', '+00:00'))
-        
-        # Find existing ANPR read that matches this capture
-        anpr_read = db.query(ANPRRead).filter(
-            ANPRRead.license_plate == request.vrm,
-            ANPRRead.camera_id == str(request.cameraIdentifier),
-            ANPRRead.timestamp == capture_time
-        ).first()
-        
-        if not anpr_read:
-            # Create new ANPR read if it doesn't exist
+        for line_number, (_, _, fields) in parsed:
+            vrm, confidence = fields["vrm"], fields["confidence"]
+            
+            # Suppress resent / multi-camera duplicates
+            with stage_timer("dedup"):
+                entry, duplicate = capture_deduplicator.claim(
+                    vrm, str(fields["camera_id"]), str(fields["source_id"]), fields["capture_time"]
+                )
+            if duplicate and capture_deduplicator.mode != "tag":
+                pending_read = pending_reads.get(id(entry))
+                if pending_read is not None:
+                    if capture_deduplicator.mode == "merge" and confidence > (pending_read.confidence or 0):
+                        pending_read.confidence = confidence
+                    results[line_number] = (RESULT_DUPLICATE, pending_read, None)
+                else:
+                    # Merged into the chunk's transaction, so a rollback undoes it with the rest
+                    original = handle_duplicate_capture(
+                        db, entry, vrm, confidence,
+                        plate_image=fields.get("plate_image"), overview_image=fields.get("overview_image"),
+                        written=written
+                    )
+                    results[line_number] = (RESULT_DUPLICATE, original.id if original else entry.read_id, None)
+                continue
+            
             anpr_read = ANPRRead(
-                license_plate=request.vrm,
-                camera_id=str(request.cameraIdentifier),
-                location=f"Feed:{request.feedIdentifier}, Source:{request.sourceIdentifier}, Camera:{request.cameraIdentifier}",
-                timestamp=capture_time,
-                confidence=0,
+                license_plate=vrm,
+                camera_id=str(fields["camera_id"]),
+                location=f"Feed:{fields['feed_id']}, Source:{fields['source_id']}, Camera:{fields['camera_id']}",
+                timestamp=fields["capture_time"],
+                confidence=confidence,
                 direction=None,
                 speed=None,
-                lane=None
+                lane=None,
+                capture_guid=fields.get("capture_guid"),
+                **geo_fields(fields["latitude"], fields["longitude"])
             )
+            if duplicate:
+                tag_duplicate(anpr_read, entry, pending_reads, tagged)
+            
+            # Inline images; images that arrived (addBinaryCaptureData) earlier are joined after the commit
+            for key, image_type in (("plate_image", "P"), ("overview_image", "C")):
+                if fields.get(key):
+                    prefix, column = CAPTURE_IMAGE_COLUMNS[image_type]
+                    try:
+                        setattr(anpr_read, column, save_capture_image(fields[key], prefix))
+                        written.append(getattr(anpr_read, column))
+                    except Exception as e:
+                        logger.error("Error processing %s image for plate %s: %s", prefix, vrm, e,
+                                     extra={"event": "capture.image_failed", "vrm": vrm, "image_type": image_type})
             
             # Check for hotlist match
-            hotlist_match = db.query(Hotlist).filter(Hotlist.license_plate == request.vrm).first()
-            if hotlist_match:
-                anpr_read.hotlist_match = True
-                anpr_read.hotlist_id = hotlist_match.id
+            apply_hotlist_match(anpr_read)
             
             db.add(anpr_read)
-            db.commit()
-            db.refresh(anpr_read)
+            created_reads.append(anpr_read)
+            results[line_number] = (RESULT_CREATED, anpr_read, None)
+            if entry and not duplicate:
+                claimed.append((entry, anpr_read))
+                pending_reads[id(entry)] = anpr_read
         
-        # Save binary image data to filesystem
-        if request.binaryImage:
-            try:
-                # Decode base64 image
-                image_data = base64.b64decode(request.binaryImage)
-                
-                # Generate filename
-                image_extension = "jpg"  # Default to JPG
-                if request.binaryDataType == "P":
-                    filename = f"plate_{uuid.uuid4()}.{image_extension}"
-                    filepath = UPLOAD_DIR / filename
-                    
-                    # Save image
-                    with open(filepath, "wb") as f:
-                        f.write(image_data)
-                    
-                    # Update ANPR read with image path
-                    anpr_read.plate_image_path = str(filepath)
-                    
-                elif request.binaryDataType == "C":
-                    filename = f"context_{uuid.uuid4()}.{image_extension}"
-                    filepath = UPLOAD_DIR / filename
-                    
-                    # Save image
-                    with open(filepath, "wb") as f:
-                        f.write(image_data)
-                    
-                    # Update ANPR read with context image path
-                    anpr_read.context_image_path = str(filepath)
-                
+        with stage_timer("db_insert"):
+            db.flush()
+            for anpr_read, original in tagged:
+                anpr_read.duplicate_of_id = original.id
+        # Read back before the commit expires them, which would cost a SELECT per read
+        stored = {
+            id(anpr_read): (anpr_read.id, anpr_read.camera_id, anpr_read.confidence, anpr_read.timestamp,
+                            anpr_read.capture_guid, bool(anpr_read.plate_image_path or anpr_read.context_image_path))
+            for anpr_read in created_reads
+        }
+        with stage_timer("commit"):
+            db.commit()
+    except Exception:
+        db.rollback()
+        for entry, anpr_read in claimed:
+            if entry.read_id is None:
+                capture_deduplicator.release(entry)
+        remove_unused_images(written)
+        raise
+    
+    for entry, anpr_read in claimed:
+        capture_deduplicator.stored(entry, stored[id(anpr_read)][0])
+    
+    # Join images that arrived (addBinaryCaptureData) before these captures, now that they are committed
+    attached = set()
+    guid_reads = {values[4]: values[0] for values in stored.values() if values[4]}
+    if guid_reads:
+        try:
+            attached, unused = attach_pending_images(db, guid_reads, replace=False)
+            with stage_timer("commit"):
                 db.commit()
-                
-                logger.info(f"BOF addBinaryCaptureData: Saved {request.binaryDataType} image for plate {request.vrm}")
-                
-            except Exception as e:
-                logger.error(f"Error saving binary image: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Error saving binary image: {str(e)}")
+            remove_unused_images(unused)
+        except Exception as e:
+            # The captures are stored; their held images stay pending until they expire
+            db.rollback()
+            attached = set()
+            logger.error("BOF sendCaptureStream error attaching held images: %s", e,
+                         extra={"event": "capture.image_failed", "endpoint": "sendCaptureStream"})
+    
+    for read_id, camera_id, confidence, timestamp, capture_guid, has_images in stored.values():
+        has_images = has_images or read_id in attached
+        if capture_guid:
+            capture_correlator.remember(capture_guid, read_id, camera_id, has_images=has_images)
+        camera_monitor.record_read(camera_id, confidence, timestamp, has_images=has_images)
+    
+    return stored
+
+def decode_binary_capture(request: BofAddBinaryCaptureDataRequest):
+    """(image type, image bytes) of an addBinaryCaptureData request, 400 if invalid"""
+    image_type = request.imageType.strip().upper()
+    if image_type not in CAPTURE_IMAGE_COLUMNS:
+        raise HTTPException(status_code=400, detail="imageType must be P (plate) or C (context)")
+    
+    try:
+        image_data = base64.b64decode(request.binaryData, validate=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid binaryData: {str(e)}")
+    return image_type, image_data
+
+@app.post("/bof/services/InputBinaryDataWebService/addBinaryCaptureData", response_model=BofCaptureResponse)
+async def bof_add_binary_capture_data(
+    request: BofAddBinaryCaptureDataRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    BOF: Add binary image data to a previously sent capture record
+    Supports plate (P) and context (C) image types, correlated by captureGUID.
+    Images that arrive before their capture are held until sendCapture delivers the GUID.
+    """
+    if ingest_journal.enabled:
+        decode_binary_capture(request)
+        return await journal_capture("addBinaryCaptureData", request)
+    return await run_in_threadpool(process_add_binary_capture_data, request, db)
+
+def find_capture(db: Session, guid: str):
+    """The read a capture GUID was stored as: recent GUIDs from memory, otherwise the unique GUID index"""
+    capture = capture_correlator.lookup(guid)
+    if capture is None:
+        row = db.query(
+            ANPRRead.id, ANPRRead.camera_id, ANPRRead.plate_image_path, ANPRRead.context_image_path
+        ).filter(ANPRRead.capture_guid == guid).first()
+        if row:
+            capture_correlator.remember(
+                guid, row.id, row.camera_id,
+                has_images=bool(row.plate_image_path or row.context_image_path)
+            )
+            capture = capture_correlator.lookup(guid)
+    return capture
+
+def process_add_binary_capture_data(request: BofAddBinaryCaptureDataRequest, db: Session) -> BofCaptureResponse:
+    """Store an addBinaryCaptureData image (in the request, or from the ingest journal)"""
+    image_type, image_data = decode_binary_capture(request)
+    
+    try:
+        capture = find_capture(db, request.captureGUID)
+        if capture is None:
+            # Capture not received yet - hold the image rather than creating an orphan read
+            prefix, _ = CAPTURE_IMAGE_COLUMNS[image_type]
+            image_path = write_capture_image(image_data, prefix)
+            capture_correlator.add_pending(db, request.captureGUID, image_type, image_path, len(image_data))
+            # Another worker may have stored the capture, and looked for held images, since the lookup
+            capture = find_capture(db, request.captureGUID)
+            if capture is None:
+                logger.info(
+                    "BOF addBinaryCaptureData: Holding %s image for pending capture %s", image_type, request.captureGUID,
+                    extra={"event": "binary.held", "capture_guid": request.captureGUID, "image_type": image_type}
+                )
+                return BofCaptureResponse(
+                    success=True,
+                    message=f"Binary capture data held until capture {request.captureGUID} is received",
+                    read_id=None
+                )
+            attach_pending_images(db, {request.captureGUID: capture.read_id})
+        else:
+            attach_capture_image(db, capture.read_id, image_type, image_data)
+        db.commit()
+        
+        if not capture.has_images:
+            capture.has_images = True
+            camera_monitor.record_image_attached(capture.camera_id)
+        
+        logger.info(
+            "BOF addBinaryCaptureData: Saved %s image for capture %s", image_type, request.captureGUID,
+            extra={
+                "event": "binary.saved", "capture_guid": request.captureGUID, "image_type": image_type,
+                "read_id": capture.read_id
+            }
+        )
         
         return BofCaptureResponse(
             success=True,
-            message=f"Binary capture data processed successfully for plate {request.vrm}",
-            read_id=anpr_read.id
+            message=f"Binary capture data processed successfully for capture {request.captureGUID}",
+            read_id=capture.read_id
         )
         
     except Exception as e:
-        logger.error(f"BOF addBinaryCaptureData error: {str(e)}")
+        logger.error("BOF addBinaryCaptureData error: %s", e,
+                     extra={"event": "binary.failed", "capture_guid": request.captureGUID})
         raise HTTPException(status_code=500, detail=f"Error processing binary capture data: {str(e)}")
 
 # Helper function to parse compact capture strings
@@ -1008,16 +2284,58 @@ def parse_compact_capture(capture_string: str) -> dict:
         "motion_toward_camera": parts[14].strip().lower() == 'true' if len(parts) > 14 else None
     }
 
-# Sample connectivity check endpoint
+# Journalled request kinds: request model and the function storing it
+JOURNAL_HANDLERS = {
+    "sendCapture": (BofSendCaptureRequest, process_send_capture),
+    "sendCompactCapture": (BofSendCompactCaptureRequest, process_send_compact_capture),
+    "sendCompoundCapture": (BofSendCompoundCaptureRequest, process_send_compound_capture),
+    "addBinaryCaptureData": (BofAddBinaryCaptureDataRequest, process_add_binary_capture_data),
+}
+
+def apply_journal_record(db: Session, record: dict):
+    """
+    Store one journalled request through its normal ingest path (called by the journal applier).
+    Requests the endpoint would have refused are rejected rather than retried; database
+    connection failures propagate so the applier retries them.
+    """
+    handler = JOURNAL_HANDLERS.get(record.get("kind"))
+    if handler is None:
+        raise RejectedRecord(f"Unknown journal record kind {record.get('kind')!r}")
+    model, process = handler
+    try:
+        request = model.model_validate(record["body"])
+    except (KeyError, ValidationError) as e:
+        raise RejectedRecord(f"Invalid {record['kind']} record: {e}")
+    try:
+        process(request, db)
+    except HTTPException as e:
+        if e.status_code >= 500 and isinstance(e.__context__, (OperationalError, InterfaceError)):
+            raise
+        raise RejectedRecord(f"{record['kind']} refused with {e.status_code}: {e.detail}")
+
+# Device connectivity, from the fleet sync monitor
 @app.get("/anpr/connectivity")
 async def get_connectivity_status():
-    """Get connectivity status for dashboard"""
-    # This is a placeholder - would normally check actual connectivity
+    """Get connectivity status for dashboard: devices polling for hotlists, and when the last one did"""
+    counts = fleet_monitor.counts()
+    last_poll = fleet_monitor.last_poll()
+    connected = counts["total"] - counts["silent"]
     return {
-        "status": "connected",
-        "last_sync": datetime.utcnow().isoformat(),
-        "devices_connected": 1
+        "status": "connected" if connected else ("disconnected" if counts["total"] else "no_devices"),
+        "last_sync": last_poll.isoformat() if last_poll else None,
+        "devices_connected": connected,
+        "devices_total": counts["total"],
+        "devices_behind": counts["behind"],
+        "devices_stale": counts["stale"],
+        "devices_silent": counts["silent"]
     }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import uvicorn
+    
+    # WEB_CONCURRENCY > 1 runs several worker processes; caches stay coherent via cache_sync
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")), workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
\ No newline at end of file
@@ -0,0 +1,346 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain objects updated under a short lock,
+cheap enough to stay on at full ingest rate. The SQL query count of the current
+request travels in a context variable, so handlers need no extra arguments.
+Every worker process exposes its own values on /metrics; scrape each worker (or
+sum by instance) when running more than one.
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in labels]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Registry:
+    """All metrics of this process, rendered together for /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, "Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: "Metric"):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                logger.warning("Could not collect metric %s: %s", metric.name, e,
+                               extra={"event": "metrics.collect_failed"})
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for suffix, labels, value in samples:
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Unlabelled metrics are exported from the start, even while zero
+            self.labels()
+        registry.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """The child for one combination of label values"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _labelled(self):
+        for values, child in list(self._children.items()):
+            yield list(zip(self.labelnames, values)), child
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for labels, child in self._labelled():
+            yield "", labels, child.value
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def samples(self):
+        for labels, child in self._labelled():
+            yield "", labels, child.value
+
+
+class GaugeFunction(Metric):
+    """Gauge whose value is read from a callback when /metrics is scraped"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], Optional[float]]):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def _new_child(self):
+        return None
+
+    def samples(self):
+        value = self.function()
+        if value is not None:
+            yield "", [], value
+
+
+class _HistogramValue:
+    __slots__ = ("upper_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        # Per-bucket (not cumulative) counts, the last one is +Inf
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self):
+        for labels, child in self._labelled():
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", labels + [("le", _format_value(upper_bound))], cumulative
+            yield "_count", labels, cumulative
+            yield "_sum", labels, total
+
+
+# Metrics shared across modules
+
+REQUEST_SECONDS = Histogram(
+    "anpr_http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+REQUESTS_TOTAL = Counter(
+    "anpr_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+REQUESTS_IN_PROGRESS = Gauge("anpr_http_requests_in_progress", "HTTP requests being handled")
+INGEST_STAGE_SECONDS = Histogram(
+    "anpr_ingest_stage_duration_seconds",
+    "Time spent in each ingest stage (parse, dedup, hotlist_match, db_insert, commit, image_decode, image_write)",
+    ("stage",), buckets=STAGE_BUCKETS
+)
+DB_QUERIES_TOTAL = Counter("anpr_db_queries_total", "SQL statements executed")
+DB_QUERY_SECONDS = Histogram("anpr_db_query_duration_seconds", "SQL statement latency", buckets=STAGE_BUCKETS)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "anpr_db_queries_per_request", "SQL statements executed per HTTP request", ("route",), buckets=COUNT_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "anpr_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss; for dedup a hit is a duplicate capture)", ("cache", "result")
+)
+HOTLIST_CHECKS = Counter(
+    "anpr_hotlist_checks_total", "Reads checked against the hotlist index by result (match or no_match)", ("result",)
+)
+HOTLIST_WEEDED = Counter("anpr_hotlist_entries_weeded_total", "Hotlist entries deactivated past their weed date")
+INGEST_LANE_CAPTURES = Counter(
+    "anpr_ingest_lane_captures_total", "Captures admitted for storage by ingest lane (live or backlog)", ("lane",)
+)
+INGEST_LANE_WAIT_SECONDS = Histogram(
+    "anpr_ingest_lane_wait_seconds", "Time capture writes waited for admission by ingest lane", ("lane",)
+)
+UPLOAD_IMAGES_RECONCILED = Counter(
+    "anpr_upload_images_reconciled_total",
+    "Upload store discrepancies found by the reconciler (orphan_quarantined, orphan_deleted, orphan_reported, missing)",
+    ("outcome",)
+)
+UPLOAD_IMAGES_TIERED = Counter(
+    "anpr_upload_images_tiered_total",
+    "Capture images handled by the tiering job (archived, recompressed, missing, failed)",
+    ("outcome",)
+)
+
+
+class stage_timer:
+    """Context manager observing the enclosed block as one ingest stage"""
+    __slots__ = ("_histogram", "_started")
+
+    def __init__(self, stage: str):
+        self._histogram = INGEST_STAGE_SECONDS.labels(stage)
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._histogram.observe(time.perf_counter() - self._started)
+        return False
+
+
+# Per-request SQL statement counter, a one-element list set by the middleware
+_request_queries: ContextVar[Optional[List[int]]] = ContextVar("request_queries", default=None)
+
+
+def instrument_engine(engine):
+    """Count and time every SQL statement run through engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started)
+        DB_QUERIES_TOTAL.inc()
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and SQL statement count per route"""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[dict] = None
+
+    def _route(self, scope) -> str:
+        if self._route_paths is None:
+            # Endpoint -> path template, so labels stay bounded (/reads/{read_id}, not every ID)
+            routes = getattr(scope.get("app"), "routes", [])
+            self._route_paths = {getattr(route, "endpoint", None) or route.app: route.path for route in routes}
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        queries = [0]
+        token = _request_queries.set(queries)
+        REQUESTS_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_PROGRESS.dec()
+            _request_queries.reset(token)
+            route = self._route(scope)
+            method = scope["method"]
+            REQUEST_SECONDS.labels(method, route).observe(elapsed)
+            REQUESTS_TOTAL.labels(method, route, str(status)).inc()
+            DB_QUERIES_PER_REQUEST.labels(route).observe(queries[0])
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, BigInteger, Date
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, BigInteger, Date, Index, Float
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -83,6 +83,11 @@ class Hotlist(Base):
     # Relationship
     hotlist_group = relationship("HotlistGroup", back_populates="vehicles")
     anpr_reads = relationship("ANPRRead", back_populates="hotlist")
+    
+    __table_args__ = (
+        # Active entries past their weed date (weeding scheduler)
+        Index("ix_hotlists_active_weed_date", "is_active", "weed_date"),
+    )
 
 class ANPRRead(Base):
     __tablename__ = "anpr_reads"
@@ -97,16 +102,36 @@ class ANPRRead(Base):
     speed = Column(Integer, nullable=True)  # Speed in km/h
     lane = Column(Integer, nullable=True)  # Lane number
     
-    # Image paths
-    plate_image_path = Column(String(500), nullable=True)
-    context_image_path = Column(String(500), nullable=True)
+    # Image paths (indexed for the upload store reconciler's lookups, see image_reconciler.py)
+    plate_image_path = Column(String(500), nullable=True, index=True)
+    context_image_path = Column(String(500), nullable=True, index=True)
     
     # Hotlist matching
     hotlist_match = Column(Boolean, default=False)
     hotlist_id = Column(Integer, ForeignKey("hotlists.id"), nullable=True)
     
+    # BOF capture GUID, correlates addBinaryCaptureData images with the read
+    capture_guid = Column(String(64), nullable=True, unique=True, index=True)
+    
+    # Set when this read repeats an earlier capture (DEDUP_MODE=tag)
+    duplicate_of_id = Column(Integer, ForeignKey("anpr_reads.id"), nullable=True)
+    
+    # GPS fix of the capture, and its geohash cell (geo.py) for area queries
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geo_cell = Column(String(12), nullable=True)
+    
     # Relationships
     hotlist = relationship("Hotlist", back_populates="anpr_reads")
+    
+    __table_args__ = (
+        # Per-camera time-ordered scans (convoy analysis)
+        Index("ix_anpr_reads_camera_timestamp", "camera_id", "timestamp"),
+        # Reads in an area and time window (geohash cell, then time)
+        Index("ix_anpr_reads_geo_cell_timestamp", "geo_cell", "timestamp"),
+        # Latest sighting and sighting count per VRM (bulk last-seen lookup)
+        Index("ix_anpr_reads_plate_timestamp", "license_plate", "timestamp"),
+    )
 
 class DeviceSource(Base):
     """Track device sources for BOF integration"""
@@ -116,6 +141,10 @@ class DeviceSource(Base):
     source_id = Column(String(50), unique=True, index=True, nullable=False)
     description = Column(String(200))
     is_active = Column(Boolean, default=True)
+    last_poll_at = Column(DateTime, nullable=True, index=True)  # Last hotlist sync request, written in batches
+    # Matched by hotlist allocation rules
+    device_group = Column(String(50), nullable=True)
+    force_area = Column(String(50), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -132,10 +161,114 @@ class HotlistRevision(Base):
     hotlist_name = Column(String(100), nullable=False)  # Name of the hotlist
     latest_revision = Column(BigInteger, nullable=False)  # Latest revision available
     external_system_revision = Column(BigInteger, default=-1)  # Revision device thinks it has
-    is_allocated = Column(Boolean, default=True)  # Whether this hotlist is allocated to this device
+    is_allocated = Column(Boolean, default=True)  # Whether this hotlist is allocated to this device (rewritten by hotlist_allocation)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Indexed so each worker can read the revisions acknowledged through other workers
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationships
     hotlist_group = relationship("HotlistGroup", back_populates="hotlist_revisions")
-    device_source = relationship("DeviceSource", back_populates="hotlist_revisions") 
\ No newline at end of file
+    device_source = relationship("DeviceSource", back_populates="hotlist_revisions")
+
+class HotlistAllocationRule(Base):
+    """Allocates a hotlist group to the devices matching one attribute (see hotlist_allocation.py)"""
+    __tablename__ = "hotlist_allocation_rules"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    hotlist_group_id = Column(Integer, ForeignKey("hotlist_groups.id"), nullable=False, index=True)
+    match_type = Column(String(20), nullable=False)  # device, device_group or force_area
+    match_value = Column(String(100), nullable=False)
+    force_area_subset = Column(Boolean, default=False)  # Only the entries for the device's force area
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ConvoyAnalysis(Base):
+    """Background co-travelling vehicle analysis for a target VRM"""
+    __tablename__ = "convoy_analyses"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    target_vrm = Column(String(20), nullable=False, index=True)
+    window_seconds = Column(Integer, nullable=False)  # Max time between target and candidate at a camera
+    start_time = Column(DateTime, nullable=True)  # Optional analysis period
+    end_time = Column(DateTime, nullable=True)
+    min_cameras = Column(Integer, default=2)  # Distinct cameras required to report a candidate
+    max_results = Column(Integer, default=100)
+    status = Column(String(20), default="pending")  # pending, running, completed, failed
+    target_reads = Column(Integer, default=0)
+    cameras_analysed = Column(Integer, default=0)
+    reads_scanned = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    
+    # Relationships
+    candidates = relationship("ConvoyCandidate", back_populates="analysis", cascade="all, delete-orphan",
+                              order_by="ConvoyCandidate.rank")
+
+class ConvoyCandidate(Base):
+    """Vehicle seen travelling with the target of a convoy analysis"""
+    __tablename__ = "convoy_candidates"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    analysis_id = Column(Integer, ForeignKey("convoy_analyses.id"), nullable=False, index=True)
+    rank = Column(Integer, nullable=False)
+    license_plate = Column(String(20), nullable=False)
+    camera_count = Column(Integer, nullable=False)  # Distinct cameras shared with the target (score)
+    co_occurrences = Column(Integer, nullable=False)  # Reads within the window of a target read
+    cameras = Column(Text)  # Comma-separated camera IDs
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime)
+    
+    # Relationships
+    analysis = relationship("ConvoyAnalysis", back_populates="candidates")
+
+class CacheVersion(Base):
+    """Version counter per cache topic, used to invalidate caches across worker processes"""
+    __tablename__ = "cache_versions"
+    
+    topic = Column(String(50), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class HotlistWeedLog(Base):
+    """Hotlist entry deactivated by the weeding scheduler because its weed date passed"""
+    __tablename__ = "hotlist_weed_log"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    # No foreign keys: the log outlives entries removed by group edits and deletes
+    hotlist_id = Column(Integer, nullable=False)
+    hotlist_group_id = Column(Integer, nullable=True, index=True)
+    license_plate = Column(String(10), nullable=False)
+    weed_date = Column(Date, nullable=False)
+    group_revision = Column(BigInteger, nullable=True)  # Group revision that dropped the entry
+    weeded_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class IngestJournalCheckpoint(Base):
+    """How far the ingest journal of one worker slot has been applied (see ingest_journal.py)"""
+    __tablename__ = "ingest_journal_checkpoints"
+    
+    slot = Column(String(200), primary_key=True)  # ID from the slot directory's slot-id file
+    segment = Column(Integer, nullable=False, default=0)
+    offset = Column(BigInteger, nullable=False, default=0)  # Byte offset after the last applied record
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class JobCursor(Base):
+    """Resume position and single-runner lease of a long-running background job"""
+    __tablename__ = "job_cursors"
+    
+    name = Column(String(100), primary_key=True)
+    position = Column(String(500), nullable=False, default="")  # Job-specific, e.g. the last file name done
+    lease_owner = Column(String(200), nullable=True)  # host/pid of the worker running the job
+    lease_until = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class PendingCaptureImage(Base):
+    """An addBinaryCaptureData image whose capture has not been stored yet (see capture_correlation.py)"""
+    __tablename__ = "pending_capture_images"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    capture_guid = Column(String(64), nullable=False, index=True)
+    image_type = Column(String(1), nullable=False)  # P (plate) or C (context)
+    image_path = Column(String(500), nullable=False)  # Already written to the uploads directory
+    size = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,211 @@
+"""
+Opt-in per-request profiling.
+
+A request is profiled when it carries the X-Profile header (matching
+PROFILE_TOKEN when one is set) or is picked by the sample rate, which can be
+changed at runtime through the admin API. A profiled request runs under
+cProfile and records every SQL statement with its duration; the result is kept
+in a bounded in-memory ring buffer and its ID returned in X-Profile-Id.
+
+Unprofiled requests pay for one header scan and one context variable lookup
+per SQL statement. cProfile follows the event loop thread, so work done by
+other requests interleaved on the loop can show up in a profile, and code run
+in the thread pool does not.
+"""
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional
+import itertools
+import os
+import random
+import threading
+import time
+
+from sqlalchemy import event
+
+if TYPE_CHECKING:
+    import cProfile
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+
+# Functions kept per profile, by cumulative time
+PROFILE_TOP_FUNCTIONS = 40
+SQL_STATEMENT_MAX_LENGTH = 1000
+
+# SQL statements of the request being profiled, None when not profiling
+_profiled_statements: ContextVar[Optional[List[dict]]] = ContextVar("profiled_statements", default=None)
+
+
+class RequestProfiler:
+    """Profiling settings plus the ring buffer of recent profiles"""
+
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE, token: str = PROFILE_TOKEN,
+                 buffer_size: int = PROFILE_BUFFER_SIZE):
+        self.sample_rate = sample_rate
+        self.path_prefix: Optional[str] = None
+        self.token = token
+        self._profiles = deque(maxlen=buffer_size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def configure(self, sample_rate: float, path_prefix: Optional[str] = None):
+        self.sample_rate = sample_rate
+        self.path_prefix = path_prefix or None
+
+    def settings(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "path_prefix": self.path_prefix,
+            "header_token_required": bool(self.token),
+            "buffer_size": self._profiles.maxlen,
+            "stored_profiles": len(self._profiles),
+        }
+
+    def trigger(self, scope) -> Optional[str]:
+        """Why this request should be profiled ("header" or "sample"), or None"""
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                if not self.token or value.decode("latin-1") == self.token:
+                    return "header"
+                break
+        if self.sample_rate and random.random() < self.sample_rate:
+            if self.path_prefix is None or scope["path"].startswith(self.path_prefix):
+                return "sample"
+        return None
+
+    def reserve_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def store(self, profile: dict, profile_id: Optional[int] = None) -> int:
+        if profile_id is None:
+            profile_id = self.reserve_id()
+        profile["id"] = profile_id
+        with self._lock:
+            self._profiles.append(profile)
+        return profile_id
+
+    def list(self) -> List[dict]:
+        """Newest first, without the call and SQL detail"""
+        with self._lock:
+            profiles = list(self._profiles)
+        return [
+            {key: value for key, value in profile.items() if key not in ("functions", "sql")}
+            for profile in reversed(profiles)
+        ]
+
+    def get(self, profile_id: int) -> Optional[dict]:
+        with self._lock:
+            return next((profile for profile in self._profiles if profile["id"] == profile_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+def _top_functions(profile: "cProfile.Profile") -> List[dict]:
+    import pstats
+
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, line, function), (primitive_calls, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": function,
+            "file": filename,
+            "line": line,
+            "calls": calls,
+            "total_ms": round(total * 1000, 3),
+            "cumulative_ms": round(cumulative * 1000, 3),
+        })
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return rows[:PROFILE_TOP_FUNCTIONS]
+
+
+def instrument_engine(engine):
+    """Record SQL statements and timings for requests being profiled"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _profiled_statements.get() is not None:
+            conn.info["profile_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements = _profiled_statements.get()
+        if statements is None:
+            return
+        started = conn.info.pop("profile_started", None)
+        statements.append({
+            "statement": statement[:SQL_STATEMENT_MAX_LENGTH],
+            "ms": round((time.perf_counter() - started) * 1000, 3) if started else None,
+            "executemany": executemany,
+        })
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles selected requests into request_profiler"""
+
+    def __init__(self, app, profiler: "RequestProfiler" = None):
+        self.app = app
+        self.profiler = profiler or request_profiler
+        self._active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self.profiler.trigger(scope)
+        if trigger is None or self._active:
+            # Only one cProfile can run per thread, overlapping requests go unprofiled
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        # Assigned up front so it can go out in the response headers
+        profile_id = self.profiler.reserve_id()
+        statements: List[dict] = []
+        # Imported on the first profiled request, it is not needed otherwise
+        import cProfile
+        profile = cProfile.Profile()
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message, headers=list(message.get("headers", [])) + [
+                    (b"x-profile-id", str(profile_id).encode())
+                ])
+            await send(message)
+
+        token = _profiled_statements.set(statements)
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        self._active = True
+        profile.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.disable()
+            self._active = False
+            elapsed = time.perf_counter() - started
+            _profiled_statements.reset(token)
+            self.profiler.store({
+                "method": scope["method"],
+                "path": scope["path"],
+                "query_string": scope.get("query_string", b"").decode("latin-1"),
+                "status": status,
+                "trigger": trigger,
+                "started_at": started_at.isoformat(),
+                "duration_ms": round(elapsed * 1000, 3),
+                "sql_count": len(statements),
+                "sql_ms": round(sum(statement["ms"] or 0 for statement in statements), 3),
+                "functions": _top_functions(profile),
+                "sql": statements,
+            }, profile_id)
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,105 @@
+"""
+Startup timing and readiness.
+
+main.py imports this module first, so the clock starts with the import of the
+app. The lifespan handler runs schema migrations (only when the models
+changed), then warms the hotlist index, device sources and group revisions in
+a background thread. /healthz answers as soon as the worker serves requests;
+/readyz answers 503 until the caches are warm, so a load balancer or platform
+health check only sends traffic to a worker that will not stall on its first
+requests.
+
+Each phase (import, schema, warm) is timed, and the import-to-ready total is
+logged once with event "startup.ready" and shown by /readyz.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Optional
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Wait between warm-up attempts while the database is unavailable
+WARM_RETRY_INITIAL_SECONDS = 0.5
+WARM_RETRY_MAX_SECONDS = 30.0
+
+
+class StartupState:
+    """Phase timings and readiness of this worker"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.started_at = datetime.utcnow()
+        self.phases_ms: Dict[str, float] = {}
+        self.migrated: Optional[bool] = None
+        self.ready = False
+        self.ready_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _elapsed_ms(self, since: float) -> float:
+        return round((time.perf_counter() - since) * 1000, 1)
+
+    def mark_imported(self):
+        self.phases_ms.setdefault("import", self._elapsed_ms(self.started))
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases_ms[name] = self._elapsed_ms(started)
+
+    def warm_in_background(self, warm: Callable[[], None]):
+        """Run warm() off the event loop (retrying until it succeeds), then mark the worker ready"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._warm, args=(warm,), name="startup-warm", daemon=True)
+        self._thread.start()
+
+    def _warm(self, warm: Callable[[], None]):
+        delay = WARM_RETRY_INITIAL_SECONDS
+        started = time.perf_counter()
+        while True:
+            try:
+                warm()
+                break
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning("Cache warm-up failed, retrying in %.1fs: %s", delay, e,
+                               extra={"event": "startup.warm_failed"})
+                if self._stop.wait(delay):
+                    return
+                delay = min(delay * 2, WARM_RETRY_MAX_SECONDS)
+        self.phases_ms["warm"] = self._elapsed_ms(started)
+        self.ready_ms = self._elapsed_ms(self.started)
+        self.ready = True
+        self.last_error = None
+        logger.info(
+            "Worker ready %.0fms after import started", self.ready_ms,
+            extra={"event": "startup.ready", "ready_ms": self.ready_ms, "migrated": self.migrated, **{
+                f"{name}_ms": duration for name, duration in self.phases_ms.items()
+            }}
+        )
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "started_at": self.started_at.isoformat(),
+            "ready_ms": self.ready_ms,
+            "phases_ms": dict(self.phases_ms),
+            "migrated": self.migrated,
+            "last_error": self.last_error,
+        }
+
+
+startup_state = StartupState()
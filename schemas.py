@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, ConfigDict
 from datetime import datetime, date
-from typing import Optional, List
+from typing import Optional, List, Union
 
 # Hotlist Group Schemas
 class HotlistGroupBase(BaseModel):
@@ -102,12 +102,16 @@ class ANPRReadBase(BaseModel):
     context_image_path: Optional[str] = Field(None, max_length=500, description="Path to context image")
     hotlist_match: bool = Field(False, description="Whether this read matched a hotlist")
     hotlist_id: Optional[int] = Field(None, description="ID of matched hotlist entry")
+    latitude: Optional[float] = Field(None, ge=-90, le=90, description="GPS latitude of the capture")
+    longitude: Optional[float] = Field(None, ge=-180, le=180, description="GPS longitude of the capture")
 
 class ANPRReadCreate(ANPRReadBase):
     pass
 
 class ANPRReadResponse(ANPRReadBase):
     id: int
+    duplicate_of_id: Optional[int] = Field(None, description="ID of the read this capture duplicates")
+    capture_guid: Optional[str] = Field(None, description="BOF capture GUID")
     
     model_config = ConfigDict(from_attributes=True)
 
@@ -118,6 +122,108 @@ class SystemStats(BaseModel):
     hotlist_matches: int = Field(..., description="Number of hotlist matches")
     system_status: str = Field(..., description="System operational status")
 
+# Camera health schemas
+class CameraHealth(BaseModel):
+    """Rolling health and throughput stats for one camera"""
+    camera_id: str
+    status: str = Field(..., description="ok or alert")
+    flags: List[str] = Field(default_factory=list, description="Anomaly flags: silent, low_confidence")
+    reads_per_minute: float
+    baseline_reads_per_minute: Optional[float] = None
+    mean_confidence: Optional[float] = None
+    baseline_confidence: Optional[float] = None
+    total_reads: int
+    image_attach_rate: float = Field(..., description="Fraction of reads with at least one image")
+    last_seen: Optional[datetime] = Field(None, description="Server time of the last read")
+    last_capture: Optional[datetime] = Field(None, description="captureDate of the last read")
+    seconds_since_last_read: Optional[float] = None
+    ingest_lag_seconds: Optional[float] = Field(None, description="Smoothed receive time minus capture time")
+    last_ingest_lag_seconds: Optional[float] = None
+
+class CameraHealthSummary(BaseModel):
+    total_cameras: int
+    alerting_cameras: int
+    silent_cameras: int
+    low_confidence_cameras: int
+    cameras: List[CameraHealth] = Field(default_factory=list)
+
+class FleetDeviceHotlist(BaseModel):
+    """One device's position against one active hotlist group allocated to it"""
+    hotlist_name: str
+    latest_revision: int
+    acknowledged_revision: int = Field(..., description="Revision last reported through setHotlistStatus, -1 if none")
+    acknowledged_at: Optional[datetime] = None
+    revisions_behind: int
+
+class FleetDeviceSync(BaseModel):
+    """Hotlist sync state of one device"""
+    source_id: str
+    status: str = Field(..., description="ok or alert")
+    flags: List[str] = Field(default_factory=list, description="behind, stale (behind for too long), silent")
+    last_poll: Optional[datetime] = Field(None, description="Server time of the last hotlist status or update request")
+    seconds_since_poll: Optional[float] = None
+    polls: int = Field(..., description="Polls seen by this worker")
+    groups_behind: int
+    revisions_behind: int = Field(..., description="Revisions missing, summed over the allocated active groups")
+    behind_since: Optional[datetime] = None
+    behind_seconds: Optional[float] = None
+    last_acknowledged: Optional[datetime] = None
+    hotlists: Optional[List[FleetDeviceHotlist]] = None
+
+class FleetGroupSync(BaseModel):
+    """Devices holding the latest revision of one active hotlist group"""
+    hotlist_name: str
+    latest_revision: int
+    devices_allocated: int
+    devices_current: int
+    devices_behind: int
+
+class FleetSyncSummary(BaseModel):
+    total_devices: int
+    connected_devices: int
+    behind_devices: int
+    stale_devices: int
+    silent_devices: int
+    last_poll: Optional[datetime] = None
+    silent_after_seconds: float
+    stale_after_seconds: float
+    loaded: bool = Field(..., description="Whether the stored poll times and acknowledgements have been loaded")
+    hotlists: List[FleetGroupSync] = Field(default_factory=list)
+    devices: List[FleetDeviceSync] = Field(default_factory=list)
+
+# Hotlist allocation schemas
+class HotlistAllocationRuleCreate(BaseModel):
+    match_type: str = Field(..., description="device, device_group or force_area")
+    match_value: str = Field(..., min_length=1, max_length=100, description="Source ID, device group or force area to match")
+    force_area_subset: bool = Field(False, description="Send matching devices only the entries for their own force area (and those with none)")
+
+class HotlistAllocationRuleResponse(HotlistAllocationRuleCreate):
+    id: int
+    hotlist_group_id: int
+    created_at: datetime
+    
+    model_config = ConfigDict(from_attributes=True)
+
+class DeviceSourceUpdate(BaseModel):
+    description: Optional[str] = Field(None, max_length=200)
+    device_group: Optional[str] = Field(None, max_length=50)
+    force_area: Optional[str] = Field(None, max_length=50)
+    is_active: Optional[bool] = None
+
+class DeviceAllocatedHotlist(BaseModel):
+    hotlist_name: str
+    latest_revision: int
+    force_area_subset: Optional[str] = Field(None, description="Force area the device's copy is narrowed to, \"\" for entries without one")
+
+class DeviceSourceResponse(BaseModel):
+    source_id: str
+    description: Optional[str] = None
+    device_group: Optional[str] = None
+    force_area: Optional[str] = None
+    is_active: bool
+    last_poll_at: Optional[datetime] = None
+    hotlists: List[DeviceAllocatedHotlist] = Field(default_factory=list, description="Active hotlist groups allocated to the device")
+
 # BOF-specific schemas for hotlist synchronization
 class BofHotlistRevisions(BaseModel):
     """BOF hotlist revision information for a specific hotlist"""
@@ -144,6 +250,28 @@ class BofHotlistStatusResponse(BaseModel):
     source_id: str = Field(..., description="Source identifier")
     hotlists: List[BofHotlistRevisions] = Field(default_factory=list, description="Hotlist status for this device")
 
+class BofHotlistAcknowledgement(BaseModel):
+    """Revision of one hotlist held by the device"""
+    hotlistName: str = Field(..., description="Name of the hotlist")
+    currentRevision: int = Field(..., description="Revision loaded on the device, -1 if it was deleted there")
+
+class BofSetHotlistStatusRequest(BaseModel):
+    """BOF setHotlistStatus request: the hotlist revisions a device holds"""
+    sourceID: Union[int, str] = Field(..., description="Source identifier")
+    hotlistsAndRevisions: List[BofHotlistAcknowledgement] = Field(default_factory=list, description="Revision held of each hotlist")
+    hotlistname: Optional[str] = Field(None, description="Single hotlist name (alternative to hotlistsAndRevisions)")
+    externalSystemRevision: Optional[int] = Field(None, description="Revision held of hotlistname")
+    signatureOfSender: Optional[str] = None
+    username: Optional[str] = None
+
+    def acknowledgements(self) -> List[BofHotlistAcknowledgement]:
+        acknowledgements = list(self.hotlistsAndRevisions)
+        if self.hotlistname is not None and self.externalSystemRevision is not None:
+            acknowledgements.append(BofHotlistAcknowledgement(
+                hotlistName=self.hotlistname, currentRevision=self.externalSystemRevision
+            ))
+        return acknowledgements
+
 class BofCaptureResponse(BaseModel):
     """Response for BOF capture operations"""
     success: bool = Field(..., description="Whether the operation was successful")
@@ -154,6 +282,7 @@ class BofCaptureResponse(BaseModel):
 class BofSendCaptureRequest(BaseModel):
     """BOF sendCapture request with full capture details"""
     vrm: str = Field(..., description="Vehicle Registration Mark (license plate)")
+    captureGUID: Optional[str] = Field(None, max_length=64, description="Unique identifier for the capture, used by addBinaryCaptureData")
     feedID: int = Field(..., description="Feed identifier")
     sourceID: int = Field(..., description="Source identifier")
     cameraID: int = Field(..., description="Camera identifier")
@@ -194,4 +323,71 @@ class BofAddBinaryCaptureDataRequest(BaseModel):
     """BOF addBinaryCaptureData request for sending binary image data"""
     captureGUID: str = Field(..., description="Unique identifier for the capture")
     imageType: str = Field(..., description="Type of image (P for plate, C for context)")
-    binaryData: str = Field(..., description="Base64 encoded binary image data") 
\ No newline at end of file
+    binaryData: str = Field(..., description="Base64 encoded binary image data")
+
+# Last seen lookup schemas
+class LastSeenLookup(BaseModel):
+    """VRMs whose latest sighting is wanted, with an optional time window"""
+    vrms: List[str] = Field(..., description="Vehicle Registration Marks, matched exactly after upper-casing")
+    start_time: Optional[datetime] = Field(None, description="Only count sightings from this time")
+    end_time: Optional[datetime] = Field(None, description="Only count sightings up to this time")
+
+# Convoy analysis schemas
+class ConvoyAnalysisCreate(BaseModel):
+    """Request to find vehicles travelling with a target VRM"""
+    target_vrm: str = Field(..., max_length=20, description="Target Vehicle Registration Mark")
+    window_seconds: int = Field(60, ge=1, le=3600, description="Max seconds between target and candidate at the same camera")
+    start_time: Optional[datetime] = Field(None, description="Start of the analysis period")
+    end_time: Optional[datetime] = Field(None, description="End of the analysis period")
+    min_cameras: int = Field(2, ge=1, description="Distinct shared cameras required to report a candidate")
+    max_results: int = Field(100, ge=1, le=1000, description="Maximum number of candidates to store")
+
+class ConvoyCandidateResponse(BaseModel):
+    rank: int
+    license_plate: str
+    camera_count: int
+    co_occurrences: int
+    cameras: Optional[str] = None
+    first_seen: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
+    
+    model_config = ConfigDict(from_attributes=True)
+
+class ConvoyAnalysisResponse(BaseModel):
+    id: int
+    target_vrm: str
+    window_seconds: int
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    min_cameras: int
+    max_results: int
+    status: str
+    target_reads: int
+    cameras_analysed: int
+    reads_scanned: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    candidates: List[ConvoyCandidateResponse] = Field(default_factory=list)
+    
+    model_config = ConfigDict(from_attributes=True)
+
+# Hotlist weeding schemas
+class HotlistWeedLogResponse(BaseModel):
+    """Hotlist entry deactivated because its weed date passed"""
+    id: int
+    hotlist_id: int
+    hotlist_group_id: Optional[int] = None
+    license_plate: str
+    weed_date: date
+    group_revision: Optional[int] = None
+    weeded_at: datetime
+    
+    model_config = ConfigDict(from_attributes=True)
+
+# Profiling schemas
+class ProfilingSettingsUpdate(BaseModel):
+    """Runtime profiling settings for this worker"""
+    sample_rate: float = Field(0.0, ge=0.0, le=1.0, description="Fraction of requests to profile (0 disables sampling)")
+    path_prefix: Optional[str] = Field(None, max_length=200, description="Only sample requests whose path starts with this")
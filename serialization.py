@@ -0,0 +1,83 @@
+"""
+Fast serialization for the bulk list endpoints.
+
+Rows are selected as plain column tuples (no ORM objects, identity map or
+relationship loading), turned into dicts shaped like the Pydantic response
+models, and encoded with orjson. The field lists come from the response
+schemas, so the JSON stays the same as the validated path.
+"""
+from datetime import date, datetime
+from typing import Dict, List, Sequence
+import json
+
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Query, Session
+
+from models import ANPRRead, Hotlist, HotlistGroup
+from schemas import ANPRReadResponse, HotlistGroupResponse, VehicleResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson (stdlib json when orjson is not installed)"""
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _columns(model, fields: Sequence[str]) -> list:
+    return [getattr(model, field) for field in fields]
+
+
+READ_FIELDS = tuple(ANPRReadResponse.model_fields)
+READ_COLUMNS = _columns(ANPRRead, READ_FIELDS)
+
+GROUP_FIELDS = tuple(field for field in HotlistGroupResponse.model_fields if field != "vehicles")
+GROUP_COLUMNS = _columns(HotlistGroup, GROUP_FIELDS)
+
+VEHICLE_FIELDS = tuple(VehicleResponse.model_fields)
+VEHICLE_COLUMNS = _columns(Hotlist, VEHICLE_FIELDS)
+
+
+def read_query(db: Session) -> Query:
+    """Query selecting exactly the ANPRReadResponse columns; filter and order it as usual"""
+    return db.query(*READ_COLUMNS)
+
+
+def rows_to_dicts(fields: Sequence[str], rows) -> List[dict]:
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def group_query(db: Session) -> Query:
+    """Query selecting the HotlistGroupResponse columns (without vehicles)"""
+    return db.query(*GROUP_COLUMNS)
+
+
+def groups_with_vehicles(db: Session, group_rows) -> List[dict]:
+    """Attach each group's vehicles, loaded for the whole page in one query"""
+    groups = rows_to_dicts(GROUP_FIELDS, group_rows)
+    by_id: Dict[int, dict] = {}
+    for group in groups:
+        group["vehicles"] = []
+        by_id[group["id"]] = group
+    if not by_id:
+        return groups
+
+    vehicle_rows = db.query(Hotlist.hotlist_group_id, *VEHICLE_COLUMNS).filter(
+        Hotlist.hotlist_group_id.in_(list(by_id))
+    ).order_by(Hotlist.id).all()
+    for row in vehicle_rows:
+        by_id[row[0]]["vehicles"].append(dict(zip(VEHICLE_FIELDS, row[1:])))
+    return groups
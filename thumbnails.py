@@ -0,0 +1,155 @@
+"""
+Thumbnail derivatives for capture images.
+
+Plate and context images are stored full size in static/uploads. The reads UI
+shows small derivatives instead, generated on first request (or at ingest when
+THUMBNAILS_EAGER is set) and kept in a size-bounded on-disk cache with
+least-recently-used eviction.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+import logging
+import os
+import threading
+import uuid
+
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+_thumbnail_hits = CACHE_REQUESTS.labels("thumbnail", "hit")
+_thumbnail_misses = CACHE_REQUESTS.labels("thumbnail", "miss")
+
+THUMBNAIL_CACHE_DIR = Path(os.getenv("THUMBNAIL_CACHE_DIR", "cache/thumbnails"))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "70"))
+THUMBNAILS_EAGER = os.getenv("THUMBNAILS_EAGER", "false").lower() in ("1", "true", "yes")
+
+# Derivative name -> bounding box (width, height)
+THUMBNAIL_SIZES = {
+    "small": (160, 120),
+    "medium": (480, 360),
+}
+
+
+class ThumbnailCache:
+    """Lazily generated, LRU-evicted thumbnail files"""
+
+    def __init__(self, cache_dir: Path = THUMBNAIL_CACHE_DIR, max_bytes: int = THUMBNAIL_CACHE_MAX_BYTES,
+                 quality: int = THUMBNAIL_QUALITY):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.quality = quality
+        # Cached file -> size in bytes, least recently used first
+        self._entries: "OrderedDict[Path, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    @property
+    def queue_depth(self) -> int:
+        """Derivatives waiting to be generated in the background"""
+        return self._executor._work_queue.qsize() if self._executor else 0
+
+    def _load(self):
+        """Index files left in the cache by a previous run, oldest first"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.cache_dir.exists():
+            return
+        files = []
+        for path in self.cache_dir.glob("*/*"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._entries[path] = size
+            self._total_bytes += size
+
+    def _track(self, path: Path, size: int):
+        with self._lock:
+            self._load()
+            self._total_bytes += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest, oldest_size = self._entries.popitem(last=False)
+                self._total_bytes -= oldest_size
+                try:
+                    oldest.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def _touch(self, path: Path):
+        with self._lock:
+            self._load()
+            if path in self._entries:
+                self._entries.move_to_end(path)
+
+    @staticmethod
+    def etag(source: Path, size: str) -> str:
+        """Validator derived from the source file, so it can be checked without generating"""
+        stat = source.stat()
+        return f'"{size}-{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    def get(self, source: Path, size: str) -> Optional[Path]:
+        """
+        Path to the derivative of source at the named size, generating it if needed.
+        Returns None when Pillow is unavailable or the image cannot be decoded.
+        """
+        target = self.cache_dir / size / f"{source.stem}.jpg"
+        try:
+            if target.stat().st_mtime_ns >= source.stat().st_mtime_ns:
+                self._touch(target)
+                _thumbnail_hits.inc()
+                return target
+        except FileNotFoundError:
+            pass
+        _thumbnail_misses.inc()
+
+        try:
+            from PIL import Image
+        except ImportError:
+            return None
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Write under a unique name then rename, so concurrent requests never see a partial file
+        tmp_path = target.with_name(f".{target.stem}.{uuid.uuid4().hex}.tmp")
+        try:
+            with Image.open(source) as image:
+                image.thumbnail(THUMBNAIL_SIZES[size])
+                if image.mode not in ("RGB", "L"):
+                    image = image.convert("RGB")
+                image.save(tmp_path, "JPEG", quality=self.quality, optimize=True)
+            os.replace(tmp_path, target)
+        except Exception as e:
+            logger.warning("Could not create %s thumbnail for %s: %s", size, source.name, e,
+                           extra={"event": "thumbnail.failed"})
+            try:
+                tmp_path.unlink()
+            except FileNotFoundError:
+                pass
+            return None
+
+        self._track(target, target.stat().st_size)
+        return target
+
+    def generate_in_background(self, source: Path):
+        """Queue every derivative of a newly stored image (THUMBNAILS_EAGER)"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnails")
+        for size in THUMBNAIL_SIZES:
+            self._executor.submit(self.get, source, size)
+
+
+thumbnail_cache = ThumbnailCache()
@@ -0,0 +1,193 @@
+"""
+Smaller wire formats for large responses.
+
+CompressionMiddleware gzip or brotli encodes JSON and text responses above
+COMPRESSION_MIN_BYTES when the client's Accept-Encoding allows it. Bodies that
+are already compressed (ZIP hotlists, images) are passed through untouched.
+
+Hotlist updates can also be fetched as binary: a raw application/zip body for
+one hotlist, or a multipart/mixed body with one ZIP part per hotlist, instead
+of base64 ZIPs inside JSON.
+"""
+from typing import Iterable, Optional, Tuple
+import os
+import uuid
+import zlib
+
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this go out uncompressed
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+# 0-11; 5 is close to gzip -6 in speed with noticeably smaller output
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/", "application/javascript")
+
+ZIP_MEDIA_TYPE = "application/zip"
+MULTIPART_MEDIA_TYPE = "multipart/mixed"
+
+
+def parse_qvalues(header: str) -> dict:
+    """An Accept or Accept-Encoding header as {value: q}"""
+    values = {}
+    for item in header.split(","):
+        value, *params = item.split(";")
+        value = value.strip().lower()
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, number = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        values[value] = q
+    return values
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """br when the client takes it and brotli is installed, else gzip, else None"""
+    if not accept_encoding:
+        return None
+    encodings = parse_qvalues(accept_encoding)
+    wildcard = encodings.get("*", 0.0)
+    if brotli is not None and encodings.get("br", wildcard) > 0:
+        return "br"
+    if encodings.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+class _StreamCompressor:
+    """Incremental gzip/brotli encoder; each call returns everything written so far"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            return out + (self._compressor.finish() if final else self._compressor.flush())
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """ASGI middleware negotiating gzip/brotli for compressible responses"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = next((value.decode("latin-1") for name, value in scope["headers"]
+                                if name == b"accept-encoding"), None)
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor: Optional[_StreamCompressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = dict((name.lower(), value) for name, value in start.get("headers", []))
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                if (b"content-encoding" in headers or start["status"] in (204, 304)
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(dict(start, headers=_with_vary(start.get("headers", []))))
+                    await send(message)
+                    return
+
+                compressor = _StreamCompressor(encoding)
+                compressed = compressor.compress(body, final=not more_body)
+                response_headers = [(name, value) for name, value in start.get("headers", [])
+                                    if name.lower() != b"content-length"]
+                response_headers.append((b"content-encoding", encoding.encode()))
+                if not more_body:
+                    response_headers.append((b"content-length", str(len(compressed)).encode()))
+                await send(dict(start, headers=_with_vary(response_headers)))
+                await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+                return
+
+            await send({"type": "http.response.body", "body": compressor.compress(body, final=not more_body),
+                        "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _with_vary(headers: list) -> list:
+    """Add Accept-Encoding to the Vary header"""
+    headers = list(headers)
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == b"vary":
+            if b"accept-encoding" not in value.lower():
+                headers[index] = (name, value + b", Accept-Encoding")
+            return headers
+    headers.append((b"vary", b"Accept-Encoding"))
+    return headers
+
+
+def accepts_media_type(accept: Optional[str], media_type: str) -> bool:
+    """Whether an Accept header names this exact media type (wildcards do not count)"""
+    return bool(accept) and parse_qvalues(accept).get(media_type, 0.0) > 0
+
+
+def wants_binary(format: Optional[str], accept: Optional[str], media_type: str) -> bool:
+    """Binary transport via ?format=binary or an Accept header naming the binary media type"""
+    if format:
+        return format.lower() == "binary"
+    return accepts_media_type(accept, media_type)
+
+
+def zip_response(data: bytes, filename: str, headers: Optional[dict] = None) -> Response:
+    """Raw ZIP body"""
+    headers = dict(headers or {}, **{"Content-Disposition": f'attachment; filename="{filename}"'})
+    return Response(content=data, media_type=ZIP_MEDIA_TYPE, headers=headers)
+
+
+def multipart_response(parts: Iterable[Tuple[dict, bytes]], headers: Optional[dict] = None) -> Response:
+    """multipart/mixed body from (part headers, part body) pairs"""
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for part_headers, body in parts:
+        chunks.append(f"--{boundary}\r\n".encode())
+        chunks.extend(f"{name}: {value}\r\n".encode("latin-1") for name, value in part_headers.items())
+        chunks.extend((b"\r\n", body, b"\r\n"))
+    chunks.append(f"--{boundary}--\r\n".encode())
+    return Response(content=b"".join(chunks), media_type=f'{MULTIPART_MEDIA_TYPE}; boundary="{boundary}"',
+                    headers=headers)
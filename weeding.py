@@ -0,0 +1,199 @@
+"""
+Hotlist weeding: deactivate entries whose weed date has passed.
+
+A background thread runs every WEED_INTERVAL_SECONDS. Each run finds active
+entries with weed_date before today through the (is_active, weed_date) index,
+deactivates them in bulk, bumps the revision of each affected group once and
+records every entry in hotlist_weed_log, all in one transaction. The HOTLISTS
+topic is then published, so every worker reloads its match index and devices
+see the new revisions on their next poll.
+
+Several workers may run the scheduler. A run takes the weeding lease in
+job_cursors first (see job_cursor.py), so only one worker weeds at a time and
+a run started elsewhere meanwhile is skipped. The deactivating UPDATE also
+only matches entries that are still active, and only the entries it changed
+bump a group revision and are logged, so an entry deactivated between the
+SELECT and the UPDATE (by hand, or by a run whose lease ran out) is not
+weeded twice.
+"""
+from datetime import datetime
+from typing import Dict, Optional
+import logging
+import os
+import random
+import threading
+import time
+
+from sqlalchemy import func
+
+from cache_sync import invalidation_channel, HOTLISTS
+from database import SessionLocal
+from job_cursor import JobLease
+from metrics import HOTLIST_WEEDED
+from models import Hotlist, HotlistGroup, HotlistWeedLog
+
+logger = logging.getLogger(__name__)
+
+# Seconds between runs (0 disables the scheduler; runs can still be started from the admin API)
+WEED_INTERVAL_SECONDS = float(os.getenv("WEED_INTERVAL_SECONDS", "3600"))
+
+# Entries weeded per run at most, so one run never holds the write lock for long
+WEED_MAX_PER_RUN = int(os.getenv("WEED_MAX_PER_RUN", "10000"))
+
+# IDs per UPDATE ... WHERE id IN (...) statement, under SQLite's bound parameter limit
+WEED_CHUNK_SIZE = 500
+
+JOB_NAME = "hotlist_weeding"
+
+
+class HotlistWeeder:
+    """Periodic bulk deactivation of expired hotlist entries"""
+
+    def __init__(self, interval_seconds: float = WEED_INTERVAL_SECONDS, max_per_run: int = WEED_MAX_PER_RUN):
+        self.interval_seconds = interval_seconds
+        self.max_per_run = max_per_run
+        self.last_run: Optional[dict] = None
+        self.next_run_at: Optional[datetime] = None
+        self.lease = JobLease(JOB_NAME)
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.interval_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="hotlist-weeder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _loop(self):
+        # Stagger workers started together, then run once straight away
+        delay = random.uniform(0, min(self.interval_seconds, 30))
+        while True:
+            self.next_run_at = datetime.utcfromtimestamp(time.time() + delay)
+            if self._stop.wait(delay):
+                return
+            delay = self.interval_seconds
+            try:
+                # A capped run left expired entries behind, carry on shortly
+                if self.run_once()["more_pending"]:
+                    delay = min(delay, 1.0)
+            except Exception:
+                logger.exception("Hotlist weeding run failed", extra={"event": "weeding.failed"})
+
+    def status(self) -> dict:
+        return {
+            "interval_seconds": self.interval_seconds,
+            "max_per_run": self.max_per_run,
+            "running": self._thread is not None,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at and self._thread else None,
+            "last_run": self.last_run,
+        }
+
+    def run_once(self, today=None) -> dict:
+        """Weed entries with a weed date before today; returns a summary of the run"""
+        with self._run_lock:
+            if self.lease.acquire() is None:
+                logger.info("Hotlist weeding is running in another worker", extra={"event": "weeding.skipped"})
+                return {"started_at": datetime.utcnow().isoformat(), "skipped": True,
+                        "entries_weeded": 0, "group_revisions": {}, "more_pending": False}
+            try:
+                summary = self._weed(today or datetime.utcnow().date())
+            finally:
+                self.lease.save("", release=True)
+        self.last_run = summary
+        return summary
+
+    def _weed(self, today) -> dict:
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            expired = db.query(
+                Hotlist.id, Hotlist.hotlist_group_id, Hotlist.license_plate, Hotlist.weed_date
+            ).filter(
+                Hotlist.is_active == True,
+                Hotlist.weed_date < today
+            ).order_by(Hotlist.weed_date).limit(self.max_per_run).all()
+            selected = len(expired)
+
+            group_revisions: Dict[int, int] = {}
+            if expired:
+                ids = [row.id for row in expired]
+                deactivated = 0
+                for offset in range(0, len(ids), WEED_CHUNK_SIZE):
+                    deactivated += db.query(Hotlist).filter(
+                        Hotlist.id.in_(ids[offset:offset + WEED_CHUNK_SIZE]),
+                        Hotlist.is_active == True
+                    ).update(
+                        {Hotlist.is_active: False, Hotlist.revision: Hotlist.revision + 1,
+                         Hotlist.updated_at: started_at},
+                        synchronize_session=False
+                    )
+                if deactivated < len(expired):
+                    # Some went inactive since the SELECT; keep the ones this transaction changed
+                    changed = set()
+                    for offset in range(0, len(ids), WEED_CHUNK_SIZE):
+                        changed.update(row_id for (row_id,) in db.query(Hotlist.id).filter(
+                            Hotlist.id.in_(ids[offset:offset + WEED_CHUNK_SIZE]),
+                            Hotlist.updated_at == started_at
+                        ))
+                    expired = [row for row in expired if row.id in changed]
+
+                # One new revision per affected group, however many of its entries went
+                group_ids = sorted({row.hotlist_group_id for row in expired if row.hotlist_group_id is not None})
+                if group_ids:
+                    db.query(HotlistGroup).filter(HotlistGroup.id.in_(group_ids)).update(
+                        {HotlistGroup.revision: func.coalesce(HotlistGroup.revision, 0) + 1,
+                         HotlistGroup.updated_at: started_at},
+                        synchronize_session=False
+                    )
+                    group_revisions = dict(
+                        db.query(HotlistGroup.id, HotlistGroup.revision).filter(HotlistGroup.id.in_(group_ids)).all()
+                    )
+
+            if expired:
+                db.bulk_insert_mappings(HotlistWeedLog, [
+                    {
+                        "hotlist_id": row.id,
+                        "hotlist_group_id": row.hotlist_group_id,
+                        "license_plate": row.license_plate,
+                        "weed_date": row.weed_date,
+                        "group_revision": group_revisions.get(row.hotlist_group_id),
+                        "weeded_at": started_at,
+                    }
+                    for row in expired
+                ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        if expired:
+            invalidation_channel.publish(HOTLISTS)
+            HOTLIST_WEEDED.inc(len(expired))
+        summary = {
+            "started_at": started_at.isoformat(),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "entries_weeded": len(expired),
+            "group_revisions": {str(group_id): revision for group_id, revision in group_revisions.items()},
+            "more_pending": selected == self.max_per_run,
+        }
+        if expired:
+            logger.info(
+                "Weeded %d hotlist entries from %d groups", len(expired), len(group_revisions),
+                extra={"event": "weeding.completed", "entries_weeded": len(expired),
+                       "groups": len(group_revisions)}
+            )
+        return summary
+
+
+hotlist_weeder = HotlistWeeder()